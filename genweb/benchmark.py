@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+
+
+""" Measure how the site build scales using a generated family tree and artifacts
+
+    python3 -m genweb.benchmark --people 10000 --pictures 3
+
+Everything is generated in a local directory, nothing needs the network.
+"""
+
+
+from os import makedirs, urandom
+from os.path import join, dirname
+from random import Random
+from argparse import ArgumentParser
+from tempfile import TemporaryDirectory
+from multiprocessing import get_context, get_all_start_methods
+from multiprocessing.forkserver import ensure_running
+from multiprocessing.connection import Connection
+from time import perf_counter
+from json import dump, dumps
+
+from yaml import safe_dump
+
+from genweb.metadata import load_yaml
+from genweb.people import People
+from genweb.relationships import load_gedcom
+import genweb.genweb
+
+
+GIVEN_NAMES = {
+    "M": ["John", "William", "James", "George", "Thomas", "Henry", "Samuel", "David"],
+    "F": ["Mary", "Sarah", "Elizabeth", "Anna", "Margaret", "Emma", "Alice", "Jane"],
+}
+SURNAMES = [
+    "Smith",
+    "Johnson",
+    "Williams",
+    "Brown",
+    "Jones",
+    "Miller",
+    "Davis",
+    "Wilson",
+    "Anderson",
+    "Taylor",
+    "Page",
+    "Hislop",
+]
+MONTHS = "JAN FEB MAR APR MAY JUN JUL AUG SEP OCT NOV DEC".split()
+
+
+def synthetic_people(count: int, seed: int = 0) -> tuple[list[dict], list[dict]]:
+    """Generates generations of families
+
+    Args:
+        count (int): The (approximate) number of people to generate
+        seed (int, optional): Seed for the random generator. Defaults to 0.
+
+    Returns:
+        tuple[list[dict], list[dict]]: people with id, given, surname, sex,
+                                        birth (y, m, d), death, famc (the family they
+                                        are a child of) and fams (families they are a
+                                        spouse in), and families with husb, wife and chil
+    """
+    rng = Random(seed)
+    people = []
+    families = []
+
+    def new_person(sex: str, surname: str, year: int) -> dict:
+        person = {
+            "id": f"I{len(people) + 1}",
+            "given": " ".join(rng.sample(GIVEN_NAMES[sex], 2)),
+            "surname": surname,
+            "sex": sex,
+            "birth": (year, rng.randint(1, 12), rng.randint(1, 28)),
+            "death": year + rng.randint(30, 95) if rng.random() < 0.7 else None,
+            "famc": None,
+            "fams": [],
+        }
+        people.append(person)
+        return person
+
+    unmarried = [
+        new_person(rng.choice("MF"), rng.choice(SURNAMES), 1700 + rng.randint(0, 20))
+        for _ in range(max(1, min(count, 10)))
+    ]
+
+    while len(people) < count and unmarried:
+        person = unmarried.pop(rng.randrange(len(unmarried)))
+        spouse_sex = "F" if person["sex"] == "M" else "M"
+        year = person["birth"][0]
+        spouse = new_person(spouse_sex, rng.choice(SURNAMES), year + rng.randint(-5, 5))
+        husband, wife = (person, spouse) if person["sex"] == "M" else (spouse, person)
+        family = {"id": f"F{len(families) + 1}", "husb": husband, "wife": wife}
+        family["chil"] = [
+            new_person(rng.choice("MF"), husband["surname"], year + 20 + 2 * i)
+            for i in range(rng.randint(1, 5))
+        ]
+        families.append(family)
+        husband["fams"].append(family["id"])
+        wife["fams"].append(family["id"])
+
+        for child in family["chil"]:
+            child["famc"] = family["id"]
+
+        unmarried.extend(family["chil"])
+
+    return people, families
+
+
+def gedcom_date(year: int, month: int = 1, day: int = 1) -> str:
+    """Formats a date for GEDCOM
+
+    Args:
+        year (int): The year
+        month (int, optional): The month (1-12). Defaults to 1.
+        day (int, optional): The day of the month. Defaults to 1.
+
+    Returns:
+        str: The date like 12 MAR 1850
+    """
+    return f"{day} {MONTHS[month - 1]} {year}"
+
+
+def write_gedcom(path: str, people: list[dict], families: list[dict]) -> None:
+    """Writes people and families as a GEDCOM 5.5 file
+
+    Args:
+        path (str): The file to write
+        people (list[dict]): The people from synthetic_people()
+        families (list[dict]): The families from synthetic_people()
+    """
+    lines = ["0 HEAD", "1 GEDC", "2 VERS 5.5", "2 FORM LINEAGE-LINKED", "1 CHAR UTF-8"]
+
+    for person in people:
+        lines.extend(
+            [
+                f"0 @{person['id']}@ INDI",
+                f"1 NAME {person['given']} /{person['surname']}/",
+                f"1 SEX {person['sex']}",
+                "1 BIRT",
+                f"2 DATE {gedcom_date(*person['birth'])}",
+            ]
+        )
+
+        if person["death"]:
+            lines.extend(["1 DEAT", f"2 DATE {gedcom_date(person['death'])}"])
+
+        lines.extend(f"1 FAMS @{f}@" for f in person["fams"])
+
+        if person["famc"]:
+            lines.append(f"1 FAMC @{person['famc']}@")
+
+    for family in families:
+        lines.extend(
+            [
+                f"0 @{family['id']}@ FAM",
+                f"1 HUSB @{family['husb']['id']}@",
+                f"1 WIFE @{family['wife']['id']}@",
+            ]
+        )
+        lines.extend(f"1 CHIL @{c['id']}@" for c in family["chil"])
+
+    lines.append("0 TRLR")
+
+    with open(path, "w", encoding="utf-8") as gedcom_file:
+        gedcom_file.write("\n".join(lines) + "\n")
+
+
+def write_random_files(directory: str, names: list[str], size: int) -> None:
+    """Creates files of random bytes (like compressed pictures)
+
+    Args:
+        directory (str): The directory to create the files in
+        names (list[str]): The names of the files
+        size (int): The number of bytes in each file
+    """
+    makedirs(directory, exist_ok=True)
+
+    for name in names:
+        with open(join(directory, name), "wb") as artifact:
+            artifact.write(urandom(size))
+
+
+def write_artifacts(
+    binaries_dir: str, metadata_path: str, people: People, **options
+) -> int:
+    """Creates pictures, thumbnails and the metadata that describes them
+
+    Args:
+        binaries_dir (str): The directory to put the artifacts in
+        metadata_path (str): The metadata yaml file to write
+        people (People): The people (with canonical identifiers)
+        options: pictures (per person), picture_bytes (size of each picture),
+                    coverage (fraction of people with pictures) and seed
+
+    Returns:
+        int: The number of artifact files created
+    """
+    rng = Random(options.get("seed", 0))
+    metadata = {}
+    created = 0
+
+    for person in sorted(people.values(), key=lambda p: p.id):
+        if rng.random() >= options.get("coverage", 0.5):
+            continue
+
+        year = person.birthdate.year if person.birthdate else 1900
+        relatives = sorted(person.parents | person.spouses | person.children)
+        files = [f"{person.id}.jpg"] if rng.random() < 0.5 else []
+
+        for index in range(options.get("pictures", 3)):
+            identifier = f"{year + 10 * index:04d}0101{index:02d}{person.id}"
+            files.append(f"{identifier}.jpg")
+            metadata[identifier] = {
+                "type": "picture",
+                "title": f"{person.given} {person.surname} #{index}",
+                "caption": f"Picture {index} of {person.given}",
+                "file": f"{identifier}.jpg",
+                "path": person.id,
+                "width": 500,
+                "people": [person.id, *rng.sample(relatives, min(2, len(relatives)))],
+            }
+
+        write_random_files(
+            join(binaries_dir, person.id), files, options.get("picture_bytes", 4096)
+        )
+        created += len(files)
+
+    with open(metadata_path, "w", encoding="utf-8") as metadata_file:
+        safe_dump(metadata, metadata_file)
+
+    return created
+
+
+def generate(directory: str, people_count: int, **options) -> dict:
+    """Generates a GEDCOM, artifacts and metadata and the settings to build a site
+
+    Args:
+        directory (str): Where to put everything
+        people_count (int): The (approximate) number of people
+        options: see write_artifacts()
+
+    Returns:
+        dict: The settings to pass to genweb.genweb.main()
+    """
+    defaults = load_yaml(join(dirname(genweb.genweb.__file__), "genweb.yml"))
+    settings = {
+        **defaults,
+        "binaries_dir": join(directory, "binaries"),
+        "metadata_yaml": join(directory, "metadata.yml"),
+        "gedcom_path": join(directory, "family.ged"),
+        "site_dir": join(directory, "site"),
+        "build_report": join(directory, "build report.json"),
+        "render_workers": options.get("workers", 1),
+    }
+    makedirs(settings["binaries_dir"], exist_ok=True)
+    write_gedcom(
+        settings["gedcom_path"], *synthetic_people(people_count, options.get("seed", 0))
+    )
+    people = People(load_gedcom(settings["gedcom_path"]), None)
+    write_artifacts(
+        settings["binaries_dir"], settings["metadata_yaml"], people, **options
+    )
+    return settings
+
+
+def measure_build(settings: dict, reports: Connection) -> None:
+    """Builds the site and reports the timings. This runs in a new process (see run)
+        so the peak memory is the build's own.
+
+    Args:
+        settings (dict): The settings from generate()
+        reports (Connection): Where to send the timing report of the build
+    """
+    start = perf_counter()
+
+    try:
+        genweb.genweb.main(settings)
+
+    finally:
+        report = genweb.genweb.TIMINGS.report()
+        report["seconds"] = perf_counter() - start
+        reports.send(report)
+
+
+def run(directory: str, people_count: int, runs: int = 2, **options) -> dict:
+    """Generates a synthetic family and builds the site from it (possibly repeatedly)
+
+    Args:
+        directory (str): Where to put everything
+        people_count (int): The (approximate) number of people
+        runs (int, optional): How many times to build the site. The first build is
+                                from scratch, later builds are incremental.
+                                Each build runs in its own process.
+                                Defaults to 2.
+        options: see write_artifacts()
+
+    Returns:
+        dict: The scale, how long generating took and the report of each build
+    """
+    # A child starts with the peak memory of the process it was forked from (even
+    # after exec on Linux), so the builds are forked from a server started before
+    # anything is generated, rather than from this process.
+    server = "forkserver" in get_all_start_methods()
+    context = get_context("forkserver" if server else "spawn")
+
+    if server:
+        ensure_running()
+
+    start = perf_counter()
+    settings = generate(directory, people_count, **options)
+    results = {
+        "people": people_count,
+        "options": options,
+        "generate_seconds": perf_counter() - start,
+        "runs": [],
+    }
+
+    for _ in range(runs):
+        receiver, sender = context.Pipe(duplex=False)
+        build = context.Process(target=measure_build, args=(settings, sender))
+        build.start()
+        sender.close()  # so receiving fails if the build dies without a report
+
+        try:
+            results["runs"].append(receiver.recv())
+
+        except EOFError:
+            pass
+
+        build.join()
+        receiver.close()
+        assert build.exitcode == 0, f"build failed with exit code {build.exitcode}"
+
+    return results
+
+
+def main() -> None:
+    """Parse the command line and run the benchmark"""
+    parser = ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--people", type=int, default=1000, help="number of people")
+    parser.add_argument("--pictures", type=int, default=3, help="pictures per person")
+    parser.add_argument("--picture-bytes", type=int, default=4096, help="picture size")
+    parser.add_argument("--coverage", type=float, default=0.5, help="with pictures")
+    parser.add_argument("--workers", type=int, default=1, help="render processes")
+    parser.add_argument("--runs", type=int, default=2, help="builds to measure")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--dir", help="where to generate (default: temporary)")
+    parser.add_argument("--output", help="file to write the results to")
+    args = parser.parse_args()
+    options = {
+        "pictures": args.pictures,
+        "picture_bytes": args.picture_bytes,
+        "coverage": args.coverage,
+        "workers": args.workers,
+        "seed": args.seed,
+    }
+
+    if args.dir:
+        results = run(args.dir, args.people, args.runs, **options)
+
+    else:
+        with TemporaryDirectory() as working_dir:
+            results = run(working_dir, args.people, args.runs, **options)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            dump(results, output_file, indent=2)
+
+    print(dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
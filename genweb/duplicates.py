@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+
+""" Find files with identical contents in the artifacts directory
+
+    python3 -m genweb.duplicates --output duplicates.json
+
+The report lists each group of identical files, largest waste of space first.
+"""
+
+
+from argparse import ArgumentParser
+from os.path import join, dirname
+from json import dump, dumps
+from sys import stderr
+
+from devopsdriver.settings import Settings
+
+from genweb.inventory import Artifacts
+
+
+def report(artifacts: Artifacts, progress: callable = None) -> dict:
+    """Finds the duplicate files and describes them
+
+    Args:
+        artifacts (Artifacts): The artifacts to search
+        progress (callable, optional): see Artifacts.hash_many. Defaults to None.
+
+    Returns:
+        dict: directory, duplicate_files (copies beyond the first), duplicate_bytes
+                (space used by those copies) and groups (hash, size and paths)
+    """
+    groups = [
+        {"hash": h, "size": artifacts.inventory[p[0]].size, "paths": p}
+        for h, p in artifacts.duplicates(progress).items()
+    ]
+    groups.sort(key=lambda g: (-g["size"] * (len(g["paths"]) - 1), g["paths"]))
+    return {
+        "directory": artifacts.directory,
+        "algorithm": artifacts.algorithm,
+        "duplicate_files": sum(len(g["paths"]) - 1 for g in groups),
+        "duplicate_bytes": sum(g["size"] * (len(g["paths"]) - 1) for g in groups),
+        "groups": groups,
+    }
+
+
+def print_progress(done: int, total: int) -> None:
+    """Shows how many files have been hashed on stderr
+
+    Args:
+        done (int): The number of files hashed so far
+        total (int): The number of files to hash
+    """
+    print(
+        f"\rhashed {done:,} of {total:,}",
+        end="\n" if done == total else "",
+        file=stderr,
+    )
+
+
+def main() -> None:
+    """Parse the command line and report the duplicates"""
+    parser = ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--dir", help="directory to search (default: binaries_dir)")
+    parser.add_argument("--cache-dir", help="where to keep the hash cache")
+    parser.add_argument("--algorithm", help="hash algorithm (default: artifact_hash)")
+    parser.add_argument("--output", help="file to write the report to")
+    parser.add_argument("-q", "--quiet", action="store_true", help="no progress")
+    args = parser.parse_args()
+    settings = Settings(join(dirname(__file__), "genweb.py"))  # genweb.yml
+    directory = args.dir if args.dir else settings["binaries_dir"]
+    algorithm = (
+        args.algorithm if args.algorithm else settings.get("artifact_hash", None)
+    )
+    ignore = settings.get("artifact_ignore", None)
+    artifacts = Artifacts(directory, args.cache_dir, algorithm, ignore)
+    results = report(artifacts, None if args.quiet else print_progress)
+    artifacts.close()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            dump(results, output_file, indent=2)
+
+    else:
+        print(dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+
+
+""" A compact table of files: interned directories and a column (array) per field """
+
+
+from array import array
+from collections import Counter
+from os import curdir
+from os.path import join, basename, dirname, normpath
+
+
+FREE = -1  # the size of rows that are not in use
+NONE = -1  # no row (end of a chain or an empty slot)
+DELETED = -2  # a slot of an index that used to have a row (or a row not indexed)
+
+
+def directory_key(dir_path: str) -> str:
+    """The relative directory as it is stored in the table
+
+    Args:
+        dir_path (str): A relative directory (may have a trailing /, . for the top)
+
+    Returns:
+        str: The normalized directory ("" for the top)
+    """
+    normalized = normpath(dir_path)
+    return "" if normalized == curdir else normalized
+
+
+class FileEntry:
+    """A view of one row of a FileTable, the attributes read and write the columns"""
+
+    __slots__ = ("table", "row")
+
+    def __init__(self, table: "FileTable", row: int):
+        self.table = table
+        self.row = row
+
+    @property
+    def size(self) -> int:
+        """The size of the file in bytes"""
+        return self.table.size[self.row]
+
+    @size.setter
+    def size(self, value: int) -> None:
+        if self.table.size[self.row] != value:
+            indexed = self.table.by_size.remove(self.row)  # not if removed from table
+            self.table.size[self.row] = value
+
+            if indexed:
+                self.table.by_size.add(self.row)
+
+    @property
+    def modified(self) -> float:
+        """The modification time of the file"""
+        return self.table.modified[self.row]
+
+    @modified.setter
+    def modified(self, value: float) -> None:
+        self.table.modified[self.row] = value
+
+    @property
+    def accounted(self) -> bool:
+        """Has the file been referenced"""
+        return bool(self.table.accounted[self.row])
+
+    @accounted.setter
+    def accounted(self, value: bool) -> None:
+        self.table.accounted[self.row] = bool(value)
+
+    @property
+    def hash(self) -> str | None:
+        """The hex digest of the contents of the file (None if not known)"""
+        if not self.table.hashed[self.row]:
+            return None
+
+        start = self.row * self.table.digest_bytes
+        return self.table.digests[start : start + self.table.digest_bytes].hex()
+
+    @hash.setter
+    def hash(self, value: str | None) -> None:
+        self.table.hashed[self.row] = value is not None
+
+        if value is not None:
+            start = self.row * self.table.digest_bytes
+            digest = bytes.fromhex(value)
+            assert len(digest) == self.table.digest_bytes, value
+            self.table.digests[start : start + self.table.digest_bytes] = digest
+
+
+class ColumnIndex:
+    """Multimap of a value of each row (ie its name) to the rows with that value.
+    An open addressing hash table in an array has the first row with each value and
+    the other rows are chained from it (like the rows of a directory), so rows that
+    share a value do not crowd the table. The values are only stored in the columns.
+    """
+
+    def __init__(self, key: callable):
+        self.key = key  # row -> value
+        self.slots = array("i", [NONE] * 8)  # the first row with each value
+        self.used = 0  # slots that are not NONE (including DELETED)
+        self.next = array("i")  # row -> next row with the same value
+        self.previous = array("i")  # row -> previous row (DELETED if not indexed)
+
+    def _slot(self, value) -> int:
+        """Finds the slot of a value, or the slot to put it in (linear probing)"""
+        mask = len(self.slots) - 1
+        slot = hash(value) & mask
+        available = None
+
+        while True:
+            row = self.slots[slot]
+
+            if row == NONE:
+                return slot if available is None else available
+
+            if row == DELETED:
+                available = slot if available is None else available
+
+            elif self.key(row) == value:
+                return slot
+
+            slot = (slot + 1) & mask
+
+    def _resize(self) -> None:
+        first_rows = [r for r in self.slots if r >= 0]
+        size = 8
+
+        while size < 3 * len(first_rows):
+            size *= 2
+
+        self.slots = array("i", [NONE] * size)
+        self.used = len(first_rows)
+
+        for row in first_rows:
+            self.slots[self._slot(self.key(row))] = row
+
+    def add(self, row: int) -> None:
+        """Indexes a row by its value
+
+        Args:
+            row (int): The row (its value must already be in the columns)
+        """
+        while len(self.next) <= row:
+            self.next.append(NONE)
+            self.previous.append(DELETED)
+
+        if 3 * (self.used + 1) > 2 * len(self.slots):
+            self._resize()
+
+        slot = self._slot(self.key(row))
+        first = self.slots[slot]
+        self.used += first == NONE
+        self.slots[slot] = row
+        self.previous[row] = NONE
+        self.next[row] = max(first, NONE)
+
+        if first >= 0:
+            self.previous[first] = row
+
+    def remove(self, row: int) -> bool:
+        """Stops indexing a row (call before its value is changed)
+
+        Args:
+            row (int): The row
+
+        Returns:
+            bool: False if the row was not indexed
+        """
+        if row >= len(self.previous) or self.previous[row] == DELETED:
+            return False
+
+        before, after = self.previous[row], self.next[row]
+
+        if before == NONE:
+            self.slots[self._slot(self.key(row))] = DELETED if after == NONE else after
+
+        else:
+            self.next[before] = after
+
+        if after != NONE:
+            self.previous[after] = before
+
+        self.previous[row] = DELETED
+        return True
+
+    def rows(self, value) -> list[int]:
+        """Gets the rows with a value
+
+        Args:
+            value (Any): The value to look for (ie a file name or size)
+
+        Returns:
+            list[int]: The rows with that value (in order)
+        """
+        found = []
+        row = self.slots[self._slot(value)]
+
+        while row >= 0:
+            found.append(row)
+            row = self.next[row]
+
+        return sorted(found)  # the newest row is first in the chain
+
+
+class FileTable:  # pylint: disable=too-many-instance-attributes
+    """Map of relative path to FileEntry, stored as columns indexed by row.
+    Directory paths are stored once, and each row only has the file name.
+    """
+
+    def __init__(self, digest_bytes: int = 32):
+        self.digest_bytes = digest_bytes
+        self.directories = [""]  # directory number -> relative path
+        self.directory_numbers = {"": 0}
+        self.subdirectories = [None]  # directory number -> list of numbers or None
+        self.first = array("i", [NONE])  # directory number -> first row directly in it
+        self.counts = array("i", [0])  # directory number -> number of files under it
+        self.parents = array("i", [NONE])
+        self.directory = array("i")  # row -> directory number
+        self.next = array("i")  # row -> next row in the same directory
+        self.previous = array("i")  # row -> previous row in the same directory
+        self.name = []  # row -> file name (None if the row is free)
+        self.size = array("q")
+        self.modified = array("d")
+        self.accounted = bytearray()
+        self.hashed = bytearray()
+        self.digests = bytearray()
+        self.by_name = ColumnIndex(self.name.__getitem__)
+        self.by_size = ColumnIndex(self.size.__getitem__)
+        self.by_path = ColumnIndex(lambda r: (self.directory[r], self.name[r]))
+        self.free = []  # rows that are not in use
+
+    def _directory_number(self, path: str) -> int:
+        """Gets the number of a directory, adding it (and its parents) if needed"""
+        number = self.directory_numbers.get(path, None)
+
+        if number is not None:
+            return number
+
+        parent = self._directory_number(dirname(path))
+        number = len(self.directories)
+        self.directories.append(path)
+        self.directory_numbers[path] = number
+        self.subdirectories.append(None)
+        self.first.append(NONE)
+        self.counts.append(0)
+        self.parents.append(parent)
+
+        if self.subdirectories[parent] is None:
+            self.subdirectories[parent] = []
+
+        self.subdirectories[parent].append(number)
+        return number
+
+    def _count(self, number: int, change: int) -> None:
+        """Adjusts the number of files under a directory and its parents"""
+        while number >= 0:
+            self.counts[number] += change
+            number = self.parents[number]
+
+    def _rows_in(self, number: int):
+        """Generates the rows of the files directly in a directory"""
+        row = self.first[number]
+
+        while row != NONE:
+            yield row
+            row = self.next[row]
+
+    def row(self, path: str) -> int | None:
+        """Finds the row of a file
+
+        Args:
+            path (str): The relative path of the file
+
+        Returns:
+            int | None: The row or None if the file is not in the table
+        """
+        number = self.directory_numbers.get(dirname(path), None)
+
+        if number is None:
+            return None
+
+        rows = self.by_path.rows((number, basename(path)))
+        return rows[0] if rows else None
+
+    def path(self, row: int) -> str:
+        """Gets the relative path of the file in a row
+
+        Args:
+            row (int): The row
+
+        Returns:
+            str: The relative path of the file
+        """
+        return join(self.directories[self.directory[row]], self.name[row])
+
+    def insert(self, path: str, size: int, modified: float, accounted: bool = False):
+        """Adds a file (which must not already be in the table)
+
+        Args:
+            path (str): The relative path of the file
+            size (int): The size of the file in bytes
+            modified (float): The modification time of the file
+            accounted (bool, optional): Has the file been referenced. Defaults to False.
+        """
+        name = basename(path)
+        number = self._directory_number(dirname(path))
+
+        if self.free:
+            row = self.free.pop()
+            self.directory[row] = number
+            self.next[row] = self.first[number]
+            self.previous[row] = NONE
+            self.name[row] = name
+            self.size[row] = size
+            self.modified[row] = modified
+            self.accounted[row] = accounted
+            self.hashed[row] = False
+
+        else:
+            row = len(self.name)
+            self.directory.append(number)
+            self.next.append(self.first[number])
+            self.previous.append(NONE)
+            self.name.append(name)
+            self.size.append(size)
+            self.modified.append(modified)
+            self.accounted.append(accounted)
+            self.hashed.append(False)
+            self.digests.extend(bytes(self.digest_bytes))
+
+        if self.first[number] != NONE:
+            self.previous[self.first[number]] = row
+
+        self.first[number] = row
+        self.by_name.add(row)
+        self.by_size.add(row)
+        self.by_path.add(row)
+        self._count(number, 1)
+
+    def remove(self, path: str) -> None:
+        """Removes a file
+
+        Args:
+            path (str): The relative path of the file (must be in the table)
+        """
+        row = self.row(path)
+        assert row is not None, path
+        number = self.directory[row]
+        self.by_name.remove(row)
+        self.by_size.remove(row)
+        self.by_path.remove(row)
+
+        if self.previous[row] == NONE:
+            self.first[number] = self.next[row]
+
+        else:
+            self.next[self.previous[row]] = self.next[row]
+
+        if self.next[row] != NONE:
+            self.previous[self.next[row]] = self.previous[row]
+
+        self._count(number, -1)
+        self.name[row] = None
+        self.size[row] = FREE
+        self.hashed[row] = False
+        self.free.append(row)
+
+    def __len__(self) -> int:
+        return self.counts[0]
+
+    def __contains__(self, path: str) -> bool:
+        return self.row(path) is not None
+
+    def __iter__(self):
+        return (self.path(r) for r, n in enumerate(self.name) if n is not None)
+
+    def __getitem__(self, path: str) -> FileEntry:
+        row = self.row(path)
+
+        if row is None:
+            raise KeyError(path)
+
+        return FileEntry(self, row)
+
+    def get(self, path: str, default: FileEntry = None) -> FileEntry | None:
+        """Gets the entry for a file
+
+        Args:
+            path (str): The relative path of the file
+            default (FileEntry, optional): Returned if the file is not in the table.
+                                            Defaults to None.
+
+        Returns:
+            FileEntry | None: A view of the file's row
+        """
+        row = self.row(path)
+        return default if row is None else FileEntry(self, row)
+
+    def items(self):
+        """Generates (relative path, entry) for every file"""
+        return (
+            (self.path(r), FileEntry(self, r))
+            for r, n in enumerate(self.name)
+            if n is not None
+        )
+
+    def named(self, name: str) -> list[str]:
+        """Finds the files with a given name
+
+        Args:
+            name (str): The file name
+
+        Returns:
+            list[str]: The relative paths of the files with that name
+        """
+        return [self.path(r) for r in self.by_name.rows(name)]
+
+    def has_directory(self, dir_path: str) -> bool:
+        """Is there a file in (or under) a directory
+
+        Args:
+            dir_path (str): The relative directory
+
+        Returns:
+            bool: True if there is at least one file under the directory
+        """
+        number = self.directory_numbers.get(directory_key(dir_path), None)
+        return number is not None and self.counts[number] > 0
+
+    def files_in(self, dir_path: str) -> dict[str, int]:
+        """Gets the files directly in a directory
+
+        Args:
+            dir_path (str): The relative directory
+
+        Returns:
+            dict[str, int]: file name -> row
+        """
+        number = self.directory_numbers.get(directory_key(dir_path), None)
+        return (
+            {} if number is None else {self.name[r]: r for r in self._rows_in(number)}
+        )
+
+    def files_under(self, dir_path: str) -> list[str]:
+        """Gets the files in a directory and all the directories under it
+
+        Args:
+            dir_path (str): The relative directory
+
+        Returns:
+            list[str]: The relative paths of the files
+        """
+        number = self.directory_numbers.get(directory_key(dir_path), None)
+        pending = [] if number is None else [number]
+        found = []
+
+        while pending:
+            number = pending.pop()
+
+            if self.counts[number]:
+                found.extend(self.path(r) for r in self._rows_in(number))
+                pending.extend(self.subdirectories[number] or ())
+
+        return found
+
+    def of_size(self, size: int) -> list[str]:
+        """Finds the files of a given size
+
+        Args:
+            size (int): The size in bytes
+
+        Returns:
+            list[str]: The relative paths of the files with that size
+        """
+        return [self.path(r) for r in self.by_size.rows(size)]
+
+    def same_size(self, minimum: int = 0) -> list[list[str]]:
+        """Finds the groups of files that have the same size (scans the size column,
+            which is quicker than the size index when looking at every file)
+
+        Args:
+            minimum (int, optional): The smallest size to consider. Defaults to 0.
+
+        Returns:
+            list[list[str]]: The relative paths of files with the same size, per size
+        """
+        colliding = {
+            s for s, c in Counter(self.size).items() if c > 1 and s >= max(0, minimum)
+        }
+        groups = {}
+
+        for row, size in enumerate(self.size):
+            if size in colliding:
+                groups.setdefault(size, []).append(row)
+
+        return [[self.path(r) for r in g] for g in groups.values()]
@@ -4,20 +4,33 @@
 """ This is the main website interface """
 
 
-from os import makedirs, link, unlink
-from os.path import join, dirname, isfile, basename
-from shutil import copyfile
+from os import makedirs, listdir, unlink
+from os.path import join, dirname, isfile, isdir, normpath
+from multiprocessing import get_context, cpu_count
+from platform import system
+from traceback import format_exc
+from time import perf_counter
+from collections import Counter
+from types import SimpleNamespace
 
 from devopsdriver.settings import Settings
 
 from genweb.relationships import load_gedcom
 from genweb.people import People
 from genweb.metadata import Metadata
-from genweb.template import render_to_file
+from genweb.template import render_to_file, get_template
 from genweb.inventory import Artifacts
+from genweb.manifest import Manifest, fingerprint, files_fingerprint
+from genweb.output import copy_if_changed, sync_links
+from genweb.timing import Timings
 
 
 TEMPLATE_DIR = join(dirname(__file__), "templates")
+MANIFEST_FILE = ".genweb manifest.json"
+INDEX_DIR = "names"
+RENDER_CHUNK_SIZE = 16
+RENDER_STATE = {}  # shared with render workers
+TIMINGS = Timings()
 PRINT = print
 
 
@@ -41,112 +54,419 @@ def link_people_to_metadata(people: People, metadata: dict[str, dict]) -> None:
             people[person_id].metadata.append(metadata_id)
 
 
+def templates_fingerprint() -> str:
+    """Fingerprint of all the templates (they can include each other)
+
+    Returns:
+        str: The fingerprint of the contents of the templates directory
+    """
+    return files_fingerprint(
+        TEMPLATE_DIR,
+        *[f for f in listdir(TEMPLATE_DIR) if isfile(join(TEMPLATE_DIR, f))],
+    )
+
+
+def person_page_inputs(
+    person, people: People, metadata: dict[str, dict], templates: str
+) -> str:
+    """Fingerprint everything that is displayed on a person's page
+
+    Args:
+        person (SimpleNamespace): The person the page is for
+        people (People): All the people (for the navigation area)
+        metadata (dict[str, dict]): All the metadata
+        templates (str): The fingerprint of the templates
+
+    Returns:
+        str: The fingerprint of the person, their metadata, neighbors and templates
+    """
+    neighbors = sorted(set(person.parents) | set(person.spouses) | set(person.children))
+    shown = [i for i in neighbors if i in people and people[i].metadata]
+    return fingerprint(
+        templates,
+        [
+            person.id,
+            person.given,
+            person.surname,
+            person.birthdate,
+            person.deathdate,
+            sorted(person.parents),
+            sorted(person.spouses),
+            sorted(person.children),
+        ],
+        [[i, metadata[i]] for i in person.metadata],
+        [[i, people[i].given, people[i].birthdate] for i in shown],
+    )
+
+
+def index_groups(people: People) -> dict[str, dict[str, list]]:
+    """Groups the people with a surname by the first letter of the surname, then surname
+
+    Args:
+        people (People): All the people
+
+    Returns:
+        dict[str, dict[str, list]]: letter -> surname -> people sorted by name
+    """
+    groups = {}
+    named = sorted(
+        (p for p in people.values() if p.surname),
+        key=lambda p: f"{p.surname}, {p.given}",
+    )
+
+    for person in named:
+        letter = person.surname[0].upper()
+        groups.setdefault(letter, {}).setdefault(person.surname, []).append(person)
+
+    return {letter: groups[letter] for letter in sorted(groups)}
+
+
+def letter_page(letter: str) -> str:
+    """The page, relative to the site, that lists the surnames starting with a letter
+
+    Args:
+        letter (str): The first letter of the surnames
+
+    Returns:
+        str: The relative path to the page (with / as it is also the link to it)
+    """
+    name = letter if letter.isalnum() else f"u{ord(letter):04x}"
+    return f"{INDEX_DIR}/{name}.html"
+
+
+def render_person_page(person_id: str) -> tuple[str, str, str | None, float]:
+    """Renders a single person's page using the people and metadata in RENDER_STATE
+        This runs in render worker processes, which inherit RENDER_STATE when forked.
+
+    Args:
+        person_id (str): The identifier of the person to render
+
+    Returns:
+        tuple[str, str, str | None, float]: The person identifier, the status ("written",
+                                            "identical" or "failed"), the error (if any)
+                                            and the number of seconds it took
+    """
+    start = perf_counter()
+    site_dir = RENDER_STATE["site_dir"]
+    people = RENDER_STATE["people"]
+
+    try:
+        person = people[person_id]
+        makedirs(join(site_dir, person.id), exist_ok=True)
+        written = render_to_file(
+            join(site_dir, person.id, "index.html"),
+            join(TEMPLATE_DIR, "person.html.mako"),
+            person=person,
+            people=people,
+            metadata=RENDER_STATE["metadata"],
+        )
+
+    except Exception:  # pylint: disable=broad-exception-caught
+        return person_id, "failed", format_exc(), perf_counter() - start
+
+    status = "written" if written else "identical"
+    return person_id, status, None, perf_counter() - start
+
+
+def render_person_pages(person_ids: list[str], workers: int):
+    """Render the pages for the given people, possibly in parallel (only on Linux,
+        where fork is the default, elsewhere forking is not safe)
+
+    Args:
+        person_ids (list[str]): The people whose pages need to be rendered
+        workers (int): The maximum number of processes to render with
+
+    Yields:
+        tuple[str, str, str | None, float]: The person identifier, status, error (if any)
+                                            and seconds it took
+    """
+    workers = min(workers, len(person_ids))
+
+    if workers <= 1 or system() != "Linux":
+        yield from map(render_person_page, person_ids)
+        return
+
+    # compile before forking so the workers share the compiled template
+    get_template(join(TEMPLATE_DIR, "person.html.mako"))
+
+    # fork so the workers share the people and metadata copy-on-write
+    with get_context("fork").Pool(workers) as pool:
+        yield from pool.imap_unordered(
+            render_person_page,
+            person_ids,
+            chunksize=max(1, min(RENDER_CHUNK_SIZE, len(person_ids) // workers)),
+        )
+
+
 def generate_people_pages(
-    site_dir: str, people: People, metadata: dict[str, dict]
-) -> None:
+    site_dir: str,
+    people: People,
+    metadata: dict[str, dict],
+    manifest: Manifest | None = None,
+    workers: int = 1,
+) -> Counter:
     """Generates a page for each person with metadata
 
     Args:
         site_dir (str): The path to the site directory
         people (People): The people to possibly generate pages for
+        metadata (dict[str, dict]): The metadata to display
+        manifest (Manifest | None, optional): If given, pages whose inputs have not
+                                                changed are skipped. Defaults to None.
+        workers (int, optional): The number of processes to render with. Defaults to 1.
+
+    Returns:
+        Counter: The number of pages "written", "identical" (rendered but unchanged),
+                    "current" (skipped because of the manifest) and "failed"
     """
     metadata_people = [p for p in people.values() if p.metadata]
-    template_path = join(TEMPLATE_DIR, "person.html.mako")
+    templates = templates_fingerprint() if manifest else None
+    inputs = {}
+    to_render = []
+    results = Counter()
 
     for person in metadata_people:
-        person_dir = join(site_dir, person.id)
-        makedirs(person_dir, exist_ok=True)
-        index_path = join(person_dir, "index.html")
-        render_to_file(
-            index_path, template_path, person=person, people=people, metadata=metadata
-        )
+        if manifest:
+            inputs[person.id] = person_page_inputs(person, people, metadata, templates)
+
+            if manifest.unchanged(join(person.id, "index.html"), inputs[person.id]):
+                results["current"] += 1
+                continue
+
+        to_render.append(person.id)
+
+    RENDER_STATE.update(site_dir=site_dir, people=people, metadata=metadata)
+
+    try:
+        for person_id, status, error, seconds in render_person_pages(
+            to_render, workers
+        ):
+            results[status] += 1
+            TIMINGS.page(person_id, seconds)
+
+            if error:
+                PRINT(f"WARNING: unable to render {person_id}: {error}")
+                continue
+
+            if manifest:
+                manifest.record(join(person_id, "index.html"), inputs[person_id])
+
+    finally:
+        RENDER_STATE.clear()
 
+    return results
 
-def copy_static_files(files: dict[str, str], destination: str) -> None:
-    """Copy any static files from the repo to the website
+
+def render_page(
+    site_dir: str, page: str, template: str, manifest: Manifest | None, inputs, **args
+) -> str:
+    """Renders a page, unless the manifest shows its inputs have not changed
 
     Args:
-        files (dict[str, str]): List of relative paths (dest->source) to copy
-        destination (str): website directory root
+        site_dir (str): The path to the site directory
+        page (str): The page to render relative to site_dir
+        template (str): The name of the template in TEMPLATE_DIR
+        manifest (Manifest | None): If given, the page is skipped if its inputs
+                                        have not changed
+        inputs (any): The values displayed on the page (see fingerprint())
+        args (**dict[str:any]): Arguments to pass to the template
+
+    Returns:
+        str: "written", "identical" (rendered but unchanged) or "current" (skipped
+                because of the manifest)
     """
-    source_dir = dirname(__file__)
+    inputs = fingerprint(templates_fingerprint(), inputs) if manifest else None
 
-    for dest_path, source_path in files.items():
-        destination_path = join(destination, dest_path)
-        makedirs(dirname(destination_path), exist_ok=True)
-        copyfile(join(source_dir, source_path), destination_path)
+    if manifest and manifest.unchanged(page, inputs):
+        return "current"
+
+    makedirs(dirname(join(site_dir, page)), exist_ok=True)
+    written = render_to_file(join(site_dir, page), join(TEMPLATE_DIR, template), **args)
 
+    if manifest:
+        manifest.record(page, inputs)
 
-def destination_file(dst_dir: str, filename: str) -> str:
-    """Given a root directory, subdirectory, and filename, ensure we can link a file there
+    return "written" if written else "identical"
+
+
+def generate_index_pages(
+    site_dir: str, people: People, manifest: Manifest | None = None
+) -> Counter:
+    """Generates the top level index page, which links to a page per letter of the
+        alphabet that lists the people by surname
 
     Args:
-        dst_dir (str): The root directory
-        filename (str): The filename that will be created
+        site_dir (str): The path to the site directory
+        people (People): The people to list
+        manifest (Manifest | None, optional): If given, pages are skipped if their
+                                                inputs have not changed. Defaults to None.
+
+    Returns:
+        Counter: The number of pages "written", "identical" (rendered but unchanged),
+                    "current" (skipped because of the manifest) and "removed"
+                    (letter pages for letters that no longer have surnames)
+    """
+    groups = index_groups(people)
+    results = Counter()
+    letters = [
+        SimpleNamespace(
+            letter=letter,
+            page=letter_page(letter),
+            surnames=len(surnames),
+            people=sum(len(p) for p in surnames.values()),
+        )
+        for letter, surnames in groups.items()
+    ]
+
+    for letter, surnames in groups.items():
+        inputs = [
+            [p.id, p.surname, p.given, p.birthdate]
+            for surname_people in surnames.values()
+            for p in surname_people
+        ]
+        status = render_page(
+            site_dir,
+            letter_page(letter),
+            "letter.html.mako",
+            manifest,
+            inputs,
+            letter=letter,
+            surnames=surnames,
+        )
+        results[status] += 1
+
+    # letters that no longer have any surnames
+    index_dir = join(site_dir, INDEX_DIR)
+    stale = set(manifest.fingerprints if manifest else ())
+    stale.update(
+        f"{INDEX_DIR}/{n}" for n in (listdir(index_dir) if isdir(index_dir) else ())
+    )
+    stale = {p for p in stale if p.startswith(f"{INDEX_DIR}/") and p.endswith(".html")}
+
+    for page in stale - {letter.page for letter in letters}:
+        if isfile(join(site_dir, page)):
+            unlink(join(site_dir, page))
+            results["removed"] += 1
+
+        if manifest:
+            manifest.forget(page)
+
+    inputs = [vars(letter) for letter in letters]
+    status = render_page(
+        site_dir, "index.html", "top_level.html.mako", manifest, inputs, letters=letters
+    )
+    results[status] += 1
+    return results
+
+
+def copy_static_files(files: dict[str, str], destination: str) -> Counter:
+    """Copy any static files from the repo to the website (unless already identical)
+
+    Args:
+        files (dict[str, str]): List of relative paths (dest->source) to copy
+        destination (str): website directory root
 
     Returns:
-        str: The path to the file that can now be linked
+        Counter: The number of files "written" and left alone because they were "identical"
     """
-    makedirs(dst_dir, exist_ok=True)
-    dest_file = join(dst_dir, filename)
+    source_dir = dirname(__file__)
+    results = Counter()
 
-    if isfile(dest_file):
-        unlink(dest_file)
+    for dest_path, source_path in files.items():
+        destination_path = join(destination, dest_path)
+        makedirs(dirname(destination_path), exist_ok=True)
+        copied = copy_if_changed(join(source_dir, source_path), destination_path)
+        results["written" if copied else "identical"] += 1
 
-    return dest_file
+    return results
 
 
-def copy_person_thumbnails(
+def person_thumbnail_links(
     people: People, artifacts: Artifacts, dst_dir: str, default_thumbnail: str
-) -> None:
-    """Copy each person's thumbnail to the website or use the default
+) -> dict[str, str]:
+    """Find each person's thumbnail or use the default
 
     Args:
         people (People): The people to evaluate
-        existing_files (dict[str, str]): Map of names of all files in the source to
-                                            their absolute path
+        artifacts (Artifacts): The artifacts to find thumbnails in
         dst_dir (str): The destination directory (website)
         default_thumbnail (str): The path to the default thumbnail to use if the person does
                                     not have one
+
+    Returns:
+        dict[str, str]: Map of thumbnail path relative to the website to the file to link
     """
+    links = {}
+
     for person in people.values():
         if not person.metadata:
             continue
 
-        dest_file = destination_file(join(dst_dir, person.id), f"{person.id}.jpg")
         source_file = join(person.id, f"{person.id}.jpg")
 
         if not artifacts.has_file(source_file):
-            link(join(dst_dir, default_thumbnail), dest_file)
+            links[source_file] = join(dst_dir, default_thumbnail)
             continue
 
-        link(join(artifacts.directory, source_file), dest_file)
+        links[source_file] = join(artifacts.directory, source_file)
         artifacts.add(source_file)
 
+    return links
 
-def copy_metadata_files(
+
+def site_links(
     artifacts: Artifacts,
     dest_dir: str,
     metadata: dict[str, dict],
     people: People,
     default_thumbnail: str,
-) -> None:
-    """copy metadata files from source to website
+) -> dict[str, str]:
+    """Find the metadata files and thumbnails that need to be linked into the website
 
     Args:
-        sourcedir (str): location of original files
+        artifacts (Artifacts): location of original files
         dest_dir (str): location of website
-        metadata (dict[str, dict]): _description_
+        metadata (dict[str, dict]): the metadata that references the files
+        people (People): the people whose thumbnails are needed
+        default_thumbnail (str): the thumbnail (relative to dest_dir) for people without one
+
+    Returns:
+        dict[str, str]: Map of path relative to the website to the file to link there
     """
-    copy_list = metadata.get_copy_list(artifacts)
+    links = {}
 
-    for src_path, dst_path in copy_list:
-        proposed_dst = join(dest_dir, dst_path)
-        final_dst = destination_file(dirname(proposed_dst), basename(proposed_dst))
-        link(join(artifacts.directory, src_path), final_dst)
+    for src_path, dst_path in metadata.get_copy_list(artifacts):
+        links[dst_path] = join(artifacts.directory, src_path)
         artifacts.add(src_path)
 
-    copy_person_thumbnails(people, artifacts, dest_dir, default_thumbnail)
+    links.update(person_thumbnail_links(people, artifacts, dest_dir, default_thumbnail))
+    return links
+
+
+def copy_metadata_files(
+    artifacts: Artifacts,
+    dest_dir: str,
+    metadata: dict[str, dict],
+    people: People,
+    default_thumbnail: str,
+) -> Counter:
+    """link metadata files and thumbnails from source to website
+
+    Args:
+        artifacts (Artifacts): location of original files
+        dest_dir (str): location of website
+        metadata (dict[str, dict]): the metadata that references the files
+        people (People): the people whose thumbnails are needed
+        default_thumbnail (str): the thumbnail (relative to dest_dir) for people without one
+
+    Returns:
+        Counter: The number of files put in place per strategy (see sync_links)
+                    and already "current"
+    """
+    return sync_links(
+        dest_dir,
+        site_links(artifacts, dest_dir, metadata, people, default_thumbnail),
+    )[1]
 
 
 def metadata_references(metadata: dict[str, dict], artifacts: Artifacts):
@@ -174,37 +494,118 @@ def metadata_references(metadata: dict[str, dict], artifacts: Artifacts):
             print("\t" + "\n\t".join(found))
 
 
-def load_startup_data():
-    """Loads all the startup data"""
-    settings = Settings(__file__)
-    artifacts = Artifacts(settings["binaries_dir"])
-    people = People(
-        load_gedcom(settings["gedcom_path"]), settings.get("alias_path", None)
-    )
-    metadata = Metadata(settings["metadata_yaml"])
-    link_people_to_metadata(people, metadata)
+def load_startup_data(settings: dict = None, watch: bool = False):
+    """Loads all the startup data
+
+    Args:
+        settings (dict, optional): The settings to use. Defaults to genweb.yml.
+        watch (bool, optional): Keep the artifacts up to date as files are added,
+                                removed or renamed (for long running processes).
+                                Defaults to False.
+    """
+    settings = settings if settings else Settings(__file__)
+
+    with TIMINGS.phase("artifacts"):
+        artifacts = Artifacts(
+            settings["binaries_dir"],
+            algorithm=settings.get("artifact_hash", None),
+            ignore=settings.get("artifact_ignore", None),
+        )
+
+        if watch:
+            artifacts.watch()
+
+    with TIMINGS.phase("gedcom"):
+        individuals = load_gedcom(settings["gedcom_path"])
+
+    with TIMINGS.phase("people"):
+        people = People(individuals, settings.get("alias_path", None))
+
+    with TIMINGS.phase("metadata"):
+        metadata = Metadata(settings["metadata_yaml"])
+
+    with TIMINGS.phase("link people to metadata"):
+        link_people_to_metadata(people, metadata)
+
     return settings, artifacts, people, metadata
 
 
-def main() -> None:
-    """Generate the website"""
-    settings, artifacts, people, metadata = load_startup_data()
-    copy_static_files(settings["copy files"], settings["site_dir"])
-    copy_metadata_files(
-        artifacts,
-        settings["site_dir"],
-        metadata,
-        people,
-        settings["unknown_thumbnail"],
+def main(settings: dict = None) -> None:
+    """Generate the website
+
+    Args:
+        settings (dict, optional): The settings to use. Defaults to genweb.yml.
+
+    Raises:
+        SystemExit: (after the build report is saved) if any page failed to render
+    """
+    TIMINGS.reset()
+    settings, artifacts, people, metadata = load_startup_data(settings)
+    TIMINGS.count("artifacts", len(artifacts.inventory))
+    TIMINGS.count("people", len(people))
+    TIMINGS.count("metadata", len(metadata))
+    manifest = Manifest(settings["site_dir"], join(settings["site_dir"], MANIFEST_FILE))
+
+    with TIMINGS.phase("static files"):
+        outputs = copy_static_files(settings["copy files"], settings["site_dir"])
+
+    with TIMINGS.phase("find files to link"):
+        linked = site_links(
+            artifacts,
+            settings["site_dir"],
+            metadata,
+            people,
+            settings["unknown_thumbnail"],
+        )
+
+    with TIMINGS.phase("link files"):
+        manifest.links, links = sync_links(settings["site_dir"], linked, manifest.links)
+
+    with TIMINGS.phase("person pages"):
+        outputs += generate_people_pages(
+            settings["site_dir"],
+            people,
+            metadata,
+            manifest,
+            settings.get("render_workers", cpu_count()),
+        )
+
+    with TIMINGS.phase("index page"):
+        outputs += generate_index_pages(settings["site_dir"], people, manifest)
+
+    manifest.save()
+
+    for name, value in links.items():
+        TIMINGS.count(f"links {name}", value)
+
+    for name, value in outputs.items():
+        TIMINGS.count(f"pages {name}", value)
+
+    print(
+        f"{links.pop('current', 0)} files already in place, "
+        + f"{links.pop('removed', 0)} stale files removed, placed: {dict(links)}"
+    )
+    print(
+        f"{outputs['written']} files written, "
+        + f"{outputs['identical'] + outputs['current']} unchanged, "
+        + f"{outputs['failed']} failed"
     )
-    generate_people_pages(settings["site_dir"], people, metadata)
-    root_index_path = join(settings["site_dir"], "index.html")
-    root_template_path = join(TEMPLATE_DIR, "top_level.html.mako")
-    render_to_file(root_index_path, root_template_path, people=people)
     print("*** Website Rendered and Ready ***")
     print("Checking for unused files ...")
-    metadata_references(metadata, artifacts)
-    print("\n".join(f"WARNING: Not referenced: {f}" for f in artifacts.lost()))
+
+    with TIMINGS.phase("unused files"):
+        metadata_references(metadata, artifacts)
+        lost = artifacts.lost()
+
+    print("\n".join(f"WARNING: Not referenced: {f}" for f in lost))
+    report_path = settings.get(
+        "build_report", normpath(settings["site_dir"]) + " build report.json"
+    )
+    TIMINGS.save(report_path)
+    print(f"Build report: {report_path}")
+
+    if outputs["failed"]:
+        raise SystemExit(f"ERROR: {outputs['failed']} pages failed to render")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+
+
+""" Persist file hashes in SQLite, looking them up only when they are needed """
+
+
+from os import makedirs, remove
+from os.path import isfile, dirname, splitext
+from json import load, loads
+from time import monotonic
+from sqlite3 import connect, Connection
+
+
+SCHEMA_VERSION = 2  # PRAGMA user_version
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    path TEXT NOT NULL,
+    algorithm TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    modified REAL NOT NULL,
+    digest BLOB NOT NULL,
+    device INTEGER,
+    inode INTEGER,
+    PRIMARY KEY (path, algorithm)
+) WITHOUT ROWID
+"""
+COLUMNS = "path, algorithm, size, modified, digest, device, inode"
+UPGRADES = {  # version -> statements to bring the table up to SCHEMA_VERSION
+    0: [  # every hash was sha256 before the algorithm was recorded
+        "ALTER TABLE hashes RENAME TO hashes_0",
+        SCHEMA,
+        "INSERT INTO hashes (path, algorithm, size, modified, digest)"
+        + " SELECT path, 'sha256', size, modified, digest FROM hashes_0",
+        "DROP TABLE hashes_0",
+    ],
+    1: [  # device and inode were not recorded
+        "ALTER TABLE hashes ADD COLUMN device INTEGER",
+        "ALTER TABLE hashes ADD COLUMN inode INTEGER",
+    ],
+}
+QUERY_PATHS = 500  # paths per query (below SQLITE_MAX_VARIABLE_NUMBER)
+LEGACY_ALGORITHM = "sha256"  # the JSON cache only had sha256 hashes
+
+
+def read_legacy(path: str) -> dict[str, dict]:
+    """Reads a JSON snapshot and its journal (the format before SQLite)
+
+    Args:
+        path (str): The JSON snapshot (the journal is next to it)
+
+    Returns:
+        dict[str, dict]: path -> size, modified and hash (hex digest)
+    """
+    entries = {}
+    journal_path = splitext(path)[0] + ".journal"
+
+    if isfile(path):
+        with open(path, "r", encoding="utf-8") as cache_file:
+            entries = load(cache_file)
+
+    if isfile(journal_path):
+        with open(journal_path, "r", encoding="utf-8") as journal_file:
+            for line in journal_file:
+                try:
+                    change = loads(line)
+
+                except ValueError:  # last line of a batch cut short by a crash
+                    break
+
+                entries[change.pop("path")] = change
+
+    return entries
+
+
+class HashCache:
+    """Map of relative path to the size, modification time and hash of a file.
+    New hashes are written in batches, each in its own transaction, so a killed
+    process loses at most the batch in progress. Digests are stored as bytes.
+    The device and inode of the file are stored to recognize it if it is moved.
+    Each hash is stored with its algorithm, hashes by other algorithms are kept
+    (they can still be looked up) until the cache is compacted.
+    """
+
+    BATCH_ENTRIES = 256
+    BATCH_SECONDS = 5.0
+
+    def __init__(self, path: str, legacy_path: str = None, algorithm: str = "sha256"):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.algorithm = algorithm
+        self.database = None
+        # path -> (size, modified, digest bytes, device, inode) or None to remove
+        self.pending = {}
+        self.last_flush = monotonic()
+
+    def _connect(self, create: bool) -> Connection | None:
+        """Opens the database the first time it is needed
+
+        Args:
+            create (bool): Create the database if it does not exist
+
+        Returns:
+            Connection | None: The database or None if it doesn't exist (and not create)
+        """
+        if self.database is not None:
+            return self.database
+
+        legacy = self.legacy_path and (
+            isfile(self.legacy_path)
+            or isfile(splitext(self.legacy_path)[0] + ".journal")
+        )
+
+        if not create and not legacy and not isfile(self.path):
+            return None
+
+        makedirs(dirname(self.path), exist_ok=True)
+        # finalizers may close the cache from another thread, access is never concurrent
+        self.database = connect(self.path, check_same_thread=False)
+        self.database.execute("PRAGMA journal_mode=WAL")
+        self._upgrade()
+
+        if legacy:
+            self._migrate()
+
+        return self.database
+
+    def _upgrade(self) -> None:
+        """Creates the table or brings one from an older version up to date"""
+        version = self.database.execute("PRAGMA user_version").fetchone()[0]
+        exists = self.database.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'hashes'"
+        ).fetchone()
+
+        if exists and version == SCHEMA_VERSION:
+            return
+
+        with self.database:
+            for statement in UPGRADES[version] if exists else [SCHEMA]:
+                self.database.execute(statement)
+
+            self.database.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _migrate(self) -> None:
+        """Moves the hashes from the JSON cache into the database"""
+        entries = read_legacy(self.legacy_path)
+
+        with self.database:
+            self.database.executemany(
+                f"INSERT OR REPLACE INTO hashes ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        p,
+                        LEGACY_ALGORITHM,
+                        e["size"],
+                        e["modified"],
+                        bytes.fromhex(e["hash"]),
+                        None,
+                        None,
+                    )
+                    for p, e in entries.items()
+                    if e.get("hash") and e.get("size") is not None and e.get("modified")
+                ),
+            )
+
+        for path in [self.legacy_path, splitext(self.legacy_path)[0] + ".journal"]:
+            if isfile(path):
+                remove(path)
+
+    def get(self, path: str, algorithm: str = None) -> dict | None:
+        """Gets the cached information about a file
+
+        Args:
+            path (str): The relative path of the file
+            algorithm (str, optional): The hash algorithm. Defaults to the algorithm
+                                        of the cache.
+
+        Returns:
+            dict | None: size, modified and hash (hex digest) or None if not cached
+        """
+        algorithm = algorithm if algorithm else self.algorithm
+
+        if path in self.pending and algorithm == self.algorithm:
+            found = self.pending[path]
+
+        elif self._connect(create=False) is None:
+            return None
+
+        else:
+            found = self.database.execute(
+                "SELECT size, modified, digest FROM hashes"
+                + " WHERE path = ? AND algorithm = ?",
+                (path, algorithm),
+            ).fetchone()
+
+        if found is None:
+            return None
+
+        return {"size": found[0], "modified": found[1], "hash": found[2].hex()}
+
+    def identities(self, paths: list[str]) -> dict[tuple, str]:
+        """Gets what identifies files that have been hashed, even if they have been
+            discarded since (until the discard is written)
+
+        Args:
+            paths (list[str]): The relative paths of the files
+
+        Returns:
+            dict[tuple, str]: (device, inode, size, modified) -> relative path
+        """
+        found = {}
+
+        for path in paths:
+            recorded = self.pending.get(path, None)
+
+            if recorded is not None and recorded[4] is not None:
+                found[(recorded[3], recorded[4], recorded[0], recorded[1])] = path
+
+        if self._connect(create=False) is None:
+            return found
+
+        for start in range(0, len(paths), QUERY_PATHS):
+            chunk = paths[start : start + QUERY_PATHS]
+            rows = self.database.execute(
+                "SELECT device, inode, size, modified, path FROM hashes"
+                + f" WHERE inode IS NOT NULL AND path IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            )
+
+            for device, inode, size, modified, path in rows:
+                found.setdefault((device, inode, size, modified), path)
+
+        return found
+
+    def move(self, moved: dict[str, str]) -> None:
+        """Moves the hashes (by every algorithm) of files that were renamed or moved
+
+        Args:
+            moved (dict[str, str]): old relative path -> new relative path
+        """
+        for old, new in moved.items():
+            recorded = self.pending.pop(old, None)
+
+            if new in self.pending and self.pending[new] is None:
+                del self.pending[new]  # would remove the moved hashes
+
+            if recorded is not None:
+                self.pending[new] = recorded
+
+        if not moved or self._connect(create=False) is None:
+            return
+
+        with self.database:
+            self.database.executemany(
+                "DELETE FROM hashes WHERE path = ?", ((n,) for n in moved.values())
+            )
+            self.database.executemany(
+                "UPDATE hashes SET path = ? WHERE path = ?",
+                ((n, o) for o, n in moved.items()),
+            )
+
+    def record(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        path: str,
+        size: int,
+        modified: float,
+        digest: str,
+        device: int = None,
+        inode: int = None,
+    ) -> None:
+        """Remembers the hash of a file, writing the batch if it is complete
+
+        Args:
+            path (str): The relative path of the file
+            size (int): The size of the file that was hashed
+            modified (float): The modification time of the file that was hashed
+            digest (str): The hash hex digest of the contents
+            device (int, optional): The device the file is on. Defaults to None.
+            inode (int, optional): The inode of the file. Defaults to None.
+        """
+        self.pending[path] = (size, modified, bytes.fromhex(digest), device, inode)
+
+        if (
+            len(self.pending) >= HashCache.BATCH_ENTRIES
+            or monotonic() - self.last_flush >= HashCache.BATCH_SECONDS
+        ):
+            self.flush()
+
+    def discard(self, path: str) -> None:
+        """Forgets a file (its hashes by every algorithm)
+
+        Args:
+            path (str): The relative path of the file
+        """
+        self.pending[path] = None
+
+    def flush(self) -> None:
+        """Writes the pending changes in one transaction"""
+        self.last_flush = monotonic()
+        recorded = [
+            (p, self.algorithm, *v) for p, v in self.pending.items() if v is not None
+        ]
+
+        if self._connect(create=bool(recorded)) is None:
+            self.pending.clear()  # nothing to discard from
+            return
+
+        with self.database:
+            self.database.executemany(
+                "DELETE FROM hashes WHERE path = ?",
+                ((p,) for p, v in self.pending.items() if v is None),
+            )
+            self.database.executemany(
+                f"INSERT OR REPLACE INTO hashes ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                recorded,
+            )
+
+        self.pending.clear()
+
+    def algorithms(self) -> dict[str, int]:
+        """Counts the hashes by each algorithm (more than one after switching)
+
+        Returns:
+            dict[str, int]: algorithm -> number of files hashed with it
+        """
+        self.flush()
+
+        if self._connect(create=False) is None:
+            return {}
+
+        return dict(
+            self.database.execute(
+                "SELECT algorithm, COUNT(*) FROM hashes GROUP BY algorithm"
+            ).fetchall()
+        )
+
+    def compact(self, keep: set[str] = None) -> None:
+        """Removes files that are not listed and hashes by other algorithms
+        and reclaims the unused space
+
+        Args:
+            keep (set[str], optional): The paths to keep. Defaults to all of them.
+        """
+        self.flush()
+
+        if self._connect(create=False) is None:
+            return
+
+        with self.database:
+            self.database.execute(
+                "DELETE FROM hashes WHERE algorithm != ?", (self.algorithm,)
+            )
+
+        if keep is not None:
+            with self.database:
+                self.database.execute("CREATE TEMP TABLE keep (path TEXT PRIMARY KEY)")
+                self.database.executemany(
+                    "INSERT INTO keep VALUES (?)", ((p,) for p in keep)
+                )
+                self.database.execute(
+                    "DELETE FROM hashes WHERE path NOT IN (SELECT path FROM keep)"
+                )
+                self.database.execute("DROP TABLE keep")
+
+        self.database.execute("VACUUM")
+
+    def close(self) -> None:
+        """Writes any pending changes and closes the database"""
+        self.flush()
+
+        if self.database is not None:
+            self.database.close()
+            self.database = None
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+
+""" Decide which files and directories to skip using gitignore style patterns
+
+Patterns are matched against paths relative to the top directory:
+    - blank lines and lines starting with # are skipped
+    - a leading ! includes again what an earlier pattern excluded
+    - a trailing / only matches directories
+    - a pattern with a / (other than at the end) is relative to the top directory,
+        otherwise it matches a name at any depth
+    - * and ? match anything except /, [...] matches one of a set of characters,
+        ** matches any number of directories and \\ escapes the next character
+The last pattern that matches wins. Like git, nothing under an excluded directory is
+looked at (so it cannot be included again).
+"""
+
+
+from os import sep
+from re import compile as regex, escape, DOTALL
+
+from genweb.cleanup import DELETE_NAMES
+
+
+def case_insensitive(name: str) -> str:
+    """Makes a pattern that matches a name in any case (like genweb.cleanup)
+
+    Args:
+        name (str): The name (no special characters)
+
+    Returns:
+        str: The pattern, like [tT][oO][dD][oO]
+    """
+    return "".join(f"[{c.lower()}{c.upper()}]" if c.isalpha() else c for c in name)
+
+
+DEFAULT_PATTERNS = [
+    # version control
+    ".git/",
+    ".svn/",
+    ".hg/",
+    ".bzr/",
+    "CVS/",
+    # editor and temporary files
+    "*~",
+    "*.swp",
+    "*.swo",
+    ".#*",
+    "\\#*#",
+    "*.tmp",
+    # moved to the trash by genweb.cleanup
+    *(case_insensitive(n) for n in DELETE_NAMES),
+]
+
+
+def escape_pattern(path: str) -> str:
+    """Makes a pattern that matches exactly a path
+
+    Args:
+        path (str): The relative path
+
+    Returns:
+        str: The pattern with every special character escaped
+    """
+    return "".join("\\" + c if c in "\\*?[!#" else c for c in path)
+
+
+def translate(pattern: str) -> str:
+    """Converts a glob (without !, leading or trailing /) to a regular expression
+
+    Args:
+        pattern (str): The glob
+
+    Returns:
+        str: The regular expression
+    """
+    parts = []
+    index = 0
+
+    while index < len(pattern):
+        if pattern.startswith("**/", index):
+            parts.append("(?:.*/)?")
+            index += 3
+            continue
+
+        if pattern.startswith("**", index):
+            parts.append(".*")
+            index += 2
+            continue
+
+        char = pattern[index]
+        end = pattern.find("]", index + 2) if char == "[" else -1
+
+        if char == "*":
+            parts.append("[^/]*")
+
+        elif char == "?":
+            parts.append("[^/]")
+
+        elif char == "\\" and index + 1 < len(pattern):
+            index += 1
+            parts.append(escape(pattern[index]))
+
+        elif end > 0:
+            characters = pattern[index + 1 : end]
+            negated = characters.startswith("!")
+            # escaped so nothing is special in the set, except - for ranges
+            characters = escape(characters[1:] if negated else characters)
+            characters = characters.replace(escape("-"), "-")
+            parts.append("[" + ("^" if negated else "") + characters + "]")
+            index = end
+
+        else:
+            parts.append(escape(char))
+
+        index += 1
+
+    return "".join(parts)
+
+
+class IgnoreRules:
+    """Compiled gitignore style patterns"""
+
+    def __init__(self, patterns: list[str]):
+        self.patterns = list(patterns)
+        self.rules = []  # (regular expression, include, directories only)
+
+        for line in self.patterns:
+            pattern = line.strip()
+
+            if not pattern or pattern.startswith("#"):
+                continue
+
+            include = pattern.startswith("!")
+            pattern = pattern[1:] if include else pattern
+            directories_only = pattern.endswith("/")
+            pattern = pattern.rstrip("/")
+            anchored = "/" in pattern
+            expression = ("" if anchored else "(?:.*/)?") + translate(
+                pattern.lstrip("/")
+            )
+            self.rules.append((expression, include, directories_only))
+
+        # most paths match nothing, so check all the patterns at once first
+        self.any_directory = regex(
+            "|".join(f"(?:{e})\\Z" for e, _, _ in self.rules) or "(?!)", DOTALL
+        )
+        self.any_file = regex(
+            "|".join(f"(?:{e})\\Z" for e, _, d in self.rules if not d) or "(?!)",
+            DOTALL,
+        )
+        self.rules = [(regex(e + "\\Z", DOTALL), i, d) for e, i, d in self.rules]
+
+    def ignored(self, path: str, is_dir: bool = False) -> bool:
+        """Is a file or directory excluded (assuming the directories above it are not)
+
+        Args:
+            path (str): The relative path
+            is_dir (bool, optional): Is the path a directory. Defaults to False.
+
+        Returns:
+            bool: True if the path should be skipped
+        """
+        path = path.replace(sep, "/")
+
+        if not (self.any_directory if is_dir else self.any_file).match(path):
+            return False
+
+        excluded = False
+
+        for expression, include, directories_only in self.rules:
+            if (is_dir or not directories_only) and expression.match(path):
+                excluded = not include
+
+        return excluded
+
+    def excluded(self, path: str, is_dir: bool = False) -> bool:
+        """Is a file or directory, or any directory above it, excluded
+
+        Args:
+            path (str): The relative path
+            is_dir (bool, optional): Is the path a directory. Defaults to False.
+
+        Returns:
+            bool: True if the path should be skipped
+        """
+        parts = path.replace(sep, "/").split("/")
+
+        for depth in range(1, len(parts)):
+            if self.ignored("/".join(parts[:depth]), is_dir=True):
+                return True
+
+        return self.ignored(path, is_dir)
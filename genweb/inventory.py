@@ -4,68 +4,266 @@
 """ Keep track of artifact files """
 
 
-from os import walk, stat, makedirs
-from os.path import join, relpath, isfile, basename, commonpath
-from types import SimpleNamespace
+from os import stat, stat_result, lstat, fstat, makedirs, scandir, replace, cpu_count
+from os import sep, curdir, pardir
+from os.path import join, isfile, isdir, islink, exists, lexists, dirname, basename
+from os.path import relpath
+from collections import namedtuple
 from hashlib import new as Hasher
 from json import load, dump
+from time import time_ns
+from mmap import mmap, ACCESS_READ
+from weakref import finalize
+from threading import RLock
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
 
+from genweb.hash_cache import HashCache
+from genweb.file_table import FileTable, FileEntry
+from genweb.watcher import start_watching, POLL_SECONDS
+from genweb.ignore import IgnoreRules, DEFAULT_PATTERNS, escape_pattern
 
-class Artifacts:
-    """keep track of files used and unused"""
 
-    HASH_FILE_CHUNK_SIZE_BYTES = 1 * 1024 * 1024  # 1 MiB
+# modified (ns, None if it may still change), files (name -> [size, modified, device,
+# inode], None once they are in the inventory) and dirs (names of subdirectories)
+Listing = namedtuple("Listing", ["modified", "files", "dirs"])
+
+
+def synchronized(method: callable) -> callable:
+    """Decorator for Artifacts methods that use or change the inventory"""
+
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+
+    return locked
+
 
-    def __init__(self, directory: str, cache_dir: str = None):
+class Artifacts:  # pylint: disable=too-many-instance-attributes
+    """keep track of files used and unused
+    Creating one scans the directory and writes the listing cache (and later the hash
+    cache) to cache_dir, which defaults to the metadata directory in the directory.
+    """
+
+    HASH_ALGORITHM = "sha256"  # any hashlib algorithm with a fixed digest size
+    HASH_FILE_CHUNK_SIZE_BYTES = 1 * 1024 * 1024  # 1 MiB
+    MMAP_THRESHOLD_BYTES = 16 * 1024 * 1024  # larger files are hashed from a mmap
+    PARTIAL_HASH_BYTES = 64 * 1024  # from the start and the end of the file
+    HASH_THREADS = min(8, cpu_count() or 1)
+    SCAN_THREADS = 8
+    # directories modified this recently may still change within the same mtime tick
+    SETTLED_NS = 2 * 1000 * 1000 * 1000
+
+    def __init__(
+        self,
+        directory: str,
+        cache_dir: str = None,
+        algorithm: str = None,
+        ignore: list[str] = None,
+    ):
         self.cache_dir = cache_dir if cache_dir else join(directory, "metadata")
         self.directory = directory
-        self.inventory = {}
+        # the caches are not artifacts, user patterns come after (and can use !)
+        self.ignore = IgnoreRules(
+            [*DEFAULT_PATTERNS, *(ignore if ignore else []), *self._cache_patterns()]
+        )
+        self.algorithm = algorithm if algorithm else Artifacts.HASH_ALGORITHM
+        digest_bytes = Hasher(self.algorithm).digest_size
+        assert digest_bytes > 0, f"{self.algorithm} has no fixed digest size"
+        self.inventory = FileTable(digest_bytes)
+        self.lock = RLock()  # watchers update the inventory from another thread
+        self.watcher = None
+        self.vanished = {}  # relative paths removed since files last appeared
+        self.appeared = {}  # relative path -> (device, inode, size, modified)
+        self.directories = self._load_directories()
+        self.hash_cache = HashCache(
+            self._cache_path(), self._legacy_cache_path(), self.algorithm
+        )
+        finalize(self, self.hash_cache.close)
         self.refresh()
-        self._load_cache()
 
-    @staticmethod
-    def _new_entry(**kwargs) -> SimpleNamespace:
-        return SimpleNamespace(
-            size=kwargs.get("size", None),
-            modified=kwargs.get("modified", None),
-            hash=kwargs.get("hash", None),
-            accounted=kwargs.get("accounted", False),
-        )
+    def _forget(self, path: str) -> None:
+        """Removes a file from the hash cache (unless it turns out to have moved)"""
+        self.hash_cache.discard(path)
+        self.vanished[path] = None
+
+    def _remove(self, path: str) -> None:
+        """Removes a file from the inventory (and the hash cache)"""
+        self.inventory.remove(path)
+        self._forget(path)
+
+    def _set_stat(self, path: str, size: int, modified: float) -> None:
+        """Updates the size and modification time of a file"""
+        entry = self.inventory[path]
+        entry.size = size
+        entry.modified = modified
+
+    def _insert_stat(self, path: str, accounted: bool = False) -> None:
+        """Adds a file to the inventory with its current size and modification time"""
+        file_info = stat(join(self.directory, path))
+        self.inventory.insert(path, file_info.st_size, file_info.st_mtime, accounted)
+
+    def _sync_file(
+        self, path: str, size: int, modified: float, identity: tuple = ()
+    ) -> None:
+        """Adds a file found on disk or forgets its hash if it has changed
+        identity is (device, inode) if known (inode is 0 if not known on Windows)
+        """
+        entry = self.inventory.get(path, None)
+
+        if entry is None:
+            self.inventory.insert(path, size, modified)
+
+            if identity and identity[1]:
+                self.appeared[path] = (*identity, size, modified)
+
+        elif entry.size != size or entry.modified != modified:
+            self._set_stat(path, size, modified)
+            entry.hash = None
+
+    def _sync_directory(self, relative_dir: str, files: dict[str, list]) -> None:
+        """Brings the files directly in a directory up to date with a listing
+
+        Args:
+            relative_dir (str): The directory relative to the artifacts directory
+            files (dict[str, list]): file name -> [size, modified, device, inode]
+                                        (see _scan_directory, device and inode are
+                                        not in the directory cache)
+        """
+        for name in self.inventory.files_in(relative_dir).keys() - files.keys():
+            self._remove(join(relative_dir, name))
+
+        for name, (size, modified, *identity) in files.items():
+            self._sync_file(join(relative_dir, name), size, modified, identity)
+
+    def _carry_moved(self) -> None:
+        """Moves the cached hashes of files that vanished to files that appeared
+        with the same device, inode, size and modification time (renamed or moved)
+        so they are not hashed again
+        """
+        if self.vanished and self.appeared:
+            identities = self.hash_cache.identities(list(self.vanished))
+            self.hash_cache.move(
+                {identities[i]: p for p, i in self.appeared.items() if i in identities}
+            )
+
+        if self.appeared:
+            self.vanished.clear()
+            self.appeared.clear()
 
     def _cache_path(self) -> str:
+        return join(self.cache_dir, "artifact hash cache.sqlite3")
+
+    def _legacy_cache_path(self) -> str:
         return join(self.cache_dir, "artifact hash cache.json")
 
-    def _load_cache(self) -> None:
-        cache_path = self._cache_path()
+    def _directories_path(self) -> str:
+        return join(self.cache_dir, "artifact directory cache.json")
 
-        if not isfile(cache_path):
-            return
+    def _cache_patterns(self) -> list[str]:
+        """Patterns to ignore the cache directory (or files) if they are artifacts"""
+        relative = relpath(self.cache_dir, self.directory)
+
+        if relative == pardir or relative.startswith(pardir + sep):
+            return []
+
+        if relative == curdir:
+            return [
+                "/" + escape_pattern(basename(p)) + "*"
+                for p in [self._cache_path(), self._directories_path()]
+            ]
+
+        return ["/" + escape_pattern(relative.replace(sep, "/")) + "/"]
+
+    def _load_directories(self) -> dict[str, Listing]:
+        if not isfile(self._directories_path()):
+            return {}
 
-        with open(cache_path, "r", encoding="utf-8") as cache_file:
+        with open(self._directories_path(), "r", encoding="utf-8") as cache_file:
             cached = load(cache_file)
 
-        for path, info in cached.items():
-            if path in self.inventory:
-                self.inventory[path].modified = info.get("modified", None)
-                self.inventory[path].size = info.get("size", None)
-                self.inventory[path].hash = info.get("hash", None)
-
-    def _save_cache(self) -> None:
-        cache_data = {
-            p: {"modified": i.modified, "size": i.size, "hash": i.hash}
-            for p, i in self.inventory.items()
-            if i.modified and i.hash and i.size is not None
+        # listings made with other ignore patterns (or by older versions) are not used
+        if cached.get("ignore", None) != self.ignore.patterns:
+            return {}
+
+        return {
+            d: Listing(i["modified"], i["files"], tuple(i["dirs"]))
+            for d, i in cached["directories"].items()
         }
+
+    def _save_directories(self) -> None:
         makedirs(self.cache_dir, exist_ok=True)
+        temporary_path = self._directories_path() + ".tmp"
+        listings = {
+            d: {
+                "modified": i.modified,
+                "dirs": i.dirs,
+                "files": {
+                    n: [self.inventory.size[r], self.inventory.modified[r]]
+                    for n, r in self.inventory.files_in(d).items()
+                },
+            }
+            for d, i in self.directories.items()
+        }
+
+        with open(temporary_path, "w", encoding="utf-8") as cache_file:
+            dump({"ignore": self.ignore.patterns, "directories": listings}, cache_file)
+
+        replace(temporary_path, self._directories_path())
+
+    def _known_hash(self, path: str) -> bool:
+        """Looks up the hash of a file in the cache (if needed) and checks it is current
+
+        Args:
+            path (str): The relative path of the file (must be in the inventory)
+
+        Returns:
+            bool: True if the entry has the hash of the current contents of the file
+        """
+        entry = self.inventory[path]
 
-        with open(self._cache_path(), "w", encoding="utf-8") as cache_file:
-            dump(cache_data, cache_file)
+        if not entry.hash:
+            cached = self.hash_cache.get(path)
+
+            # only use hashes of files that have not changed since they were hashed
+            if (
+                cached
+                and cached["size"] == entry.size
+                and cached["modified"] == entry.modified
+            ):
+                entry.hash = cached["hash"]
+
+        return Artifacts._hash_valid(join(self.directory, path), entry)
+
+    def close(self) -> None:
+        """Writes any pending changes to the hash cache and closes it
+        (also done automatically when the artifacts are garbage collected or at exit)
+        """
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+
+        self.hash_cache.close()
+
+    @synchronized
+    def compact_cache(self) -> None:
+        """Removes files that are no longer in the inventory from the hash cache,
+        and hashes by other algorithms (call warm_cache first after switching)
+        """
+        self.hash_cache.compact(set(self.inventory))
 
     @staticmethod
-    def _hash_file(path: str) -> str:
-        hasher = Hasher("sha256")
+    def _hash_file(path: str, algorithm: str = HASH_ALGORITHM) -> str:
+        hasher = Hasher(algorithm)
 
         with open(path, "rb") as contents:
+            if fstat(contents.fileno()).st_size >= Artifacts.MMAP_THRESHOLD_BYTES:
+                with mmap(contents.fileno(), 0, access=ACCESS_READ) as mapped:
+                    hasher.update(mapped)  # no copies and the GIL is released
+
+                return hasher.hexdigest()
+
             while True:
                 block = contents.read(Artifacts.HASH_FILE_CHUNK_SIZE_BYTES)
 
@@ -77,7 +275,28 @@ class Artifacts:
         return hasher.hexdigest()
 
     @staticmethod
-    def _hash_valid(path: str, entry: SimpleNamespace) -> bool:
+    def _partial_hash(path: str, algorithm: str = HASH_ALGORITHM) -> str:
+        """Hashes the start and end of a file, cheap to rule out most duplicates"""
+        hasher = Hasher(algorithm)
+
+        with open(path, "rb") as contents:
+            hasher.update(contents.read(Artifacts.PARTIAL_HASH_BYTES))
+            size = fstat(contents.fileno()).st_size
+            contents.seek(max(0, size - Artifacts.PARTIAL_HASH_BYTES))
+            hasher.update(contents.read(Artifacts.PARTIAL_HASH_BYTES))
+
+        return hasher.hexdigest()
+
+    @staticmethod
+    def _stat_and_hash(
+        path: str, algorithm: str = HASH_ALGORITHM
+    ) -> tuple[stat_result, str]:
+        """stat before hashing so a file modified while hashing is hashed again later"""
+        file_info = stat(path)
+        return file_info, Artifacts._hash_file(path, algorithm)
+
+    @staticmethod
+    def _hash_valid(path: str, entry: FileEntry) -> bool:
         if entry.size is None or not entry.modified or not entry.hash:
             return False
 
@@ -91,12 +310,6 @@ class Artifacts:
 
         return True
 
-    @staticmethod
-    def _update_stat(entry: SimpleNamespace, path: str):
-        file_info = stat(path)
-        entry.size = file_info.st_size
-        entry.modified = file_info.st_mtime
-
     def hash(self, path: str) -> str:
         """Gets the hash of the given file.
             Hashes are cached along with mdoficiation timestamp and size.
@@ -109,30 +322,107 @@ class Artifacts:
             path (str): The relative path of the file
 
         Returns:
-            str: The sha256 hash hex digest of the contents of the file
+            str: The hash hex digest of the contents of the file (see algorithm)
         """
-        full_path = join(self.directory, path)
-        assert isfile(full_path), full_path
-        self.inventory[path] = self.inventory.get(
-            path,
-            Artifacts._new_entry(),
-        )
-        entry = self.inventory[path]
+        return self.hash_many([path])[path]
 
-        if not Artifacts._hash_valid(full_path, entry):
-            entry.hash = Artifacts._hash_file(full_path)
-            Artifacts._update_stat(entry, full_path)
-            self._save_cache()
+    @synchronized
+    def hash_many(self, paths: list[str], progress: callable = None) -> dict[str, str]:
+        """Gets the hashes of many files, hashing those not in the cache in parallel
+            (see hash)
 
-        return entry.hash
+        Args:
+            paths (list[str]): The relative paths of the files
+            progress (callable, optional): Called with the number of files hashed so far
+                                            and the number that need to be hashed.
+                                            Defaults to None.
 
-    def _populate_all_stats(self):
-        """42,787 files in 0.05 - 0.06 seconds on MacBook Pro M2"""
-        no_size = [p for p, i in self.inventory.items() if i.size is None]
+        Returns:
+            dict[str, str]: Map of relative path to hash hex digest
+        """
+        paths = list(dict.fromkeys(paths))
+        stale = []
 
-        for path in no_size:
-            Artifacts._update_stat(self.inventory[path], join(self.directory, path))
+        for path in paths:
+            full_path = join(self.directory, path)
+            assert isfile(full_path), full_path
 
+            if path not in self.inventory:
+                self._insert_stat(path)
+
+            if not self._known_hash(path):
+                stale.append(path)
+
+        if len(stale) == 1:
+            hashed = [
+                (
+                    stale[0],
+                    Artifacts._stat_and_hash(
+                        join(self.directory, stale[0]), self.algorithm
+                    ),
+                )
+            ]
+
+        else:
+            hashed = self._hash_in_parallel(stale, progress)
+
+        for path, (file_info, digest) in hashed:
+            self._set_stat(path, file_info.st_size, file_info.st_mtime)
+            self.inventory[path].hash = digest
+            self.hash_cache.record(
+                path,
+                file_info.st_size,
+                file_info.st_mtime,
+                digest,
+                file_info.st_dev,
+                file_info.st_ino,
+            )
+
+        if stale:
+            self.hash_cache.flush()
+
+        return {p: self.inventory[p].hash for p in paths}
+
+    def _hash_in_parallel(self, paths: list[str], progress: callable = None):
+        """Hashes files on a thread pool (hashlib releases the GIL)
+
+        Args:
+            paths (list[str]): The relative paths of the files to hash
+            progress (callable, optional): see hash_many. Defaults to None.
+
+        Yields:
+            tuple[str, tuple[stat_result, str]]: path and (stat, hash)
+        """
+        with ThreadPoolExecutor(Artifacts.HASH_THREADS) as pool:
+            futures = {
+                pool.submit(
+                    Artifacts._stat_and_hash, join(self.directory, p), self.algorithm
+                ): p
+                for p in paths
+            }
+
+            for done, future in enumerate(as_completed(futures), start=1):
+                yield futures[future], future.result()
+
+                if progress:
+                    progress(done, len(paths))
+
+    @synchronized
+    def warm_cache(self, progress: callable = None) -> int:
+        """Hashes every file in the inventory that is not already in the hash cache
+            (by the algorithm of these artifacts, after switching every file is hashed)
+
+        Args:
+            progress (callable, optional): see hash_many. Defaults to None.
+
+        Returns:
+            int: The number of files that were hashed
+        """
+        stale = [p for p in self.inventory if not self._known_hash(p)]
+        self.hash_many(stale, progress)
+        return len(stale)
+
+    @synchronized
     def get_files_of_size(self, size: int) -> list[str]:
         """Finds all files with a given file size
 
@@ -142,36 +432,285 @@ class Artifacts:
         Returns:
             list[str]: The list of relative paths to the files with that size
         """
-        self._populate_all_stats()
-        return [p for p, i in self.inventory.items() if i.size == size]
+        return self.inventory.of_size(size)
 
-    def lookup_hashes(self, hash_sizes: dict[str, int]) -> dict[str, list[str]]:
+    @synchronized
+    def lookup_hashes(
+        self, hash_sizes: dict[str, int], algorithm: str = None
+    ) -> dict[str, list[str]]:
         """Given a list of hashes and the file size it represents, get the list of paths.
             The size is an optimization to prevent the need to hash every file.
 
         Args:
             hash_sizes (dict[str, int]): Map of hash to filesize
+            algorithm (str, optional): The algorithm of the hashes. Defaults to the
+                                        algorithm of these artifacts.
 
         Returns:
             dict[str, list[str]]: Map of hash to list of relative paths that match that hash
         """
-        return {
-            h: [p for p in self.get_files_of_size(s) if self.hash(p) == h]
-            for h, s in hash_sizes.items()
-        }
+        candidates = {h: self.get_files_of_size(s) for h, s in hash_sizes.items()}
+        paths = {p for c in candidates.values() for p in c}
+
+        if algorithm in {None, self.algorithm}:
+            hashes = self.hash_many(paths)
+
+        else:
+            hashes = {p: self._hash_other(p, algorithm) for p in paths}
+
+        return {h: [p for p in c if hashes[p] == h] for h, c in candidates.items()}
+
+    def _hash_other(self, path: str, algorithm: str) -> str:
+        """Hashes a file by an algorithm other than the one of these artifacts,
+            using the hash cache if it has a hash from before switching algorithm
+
+        Args:
+            path (str): The relative path of the file
+            algorithm (str): The hash algorithm
+
+        Returns:
+            str: The hash hex digest of the contents of the file
+        """
+        full_path = join(self.directory, path)
+        cached = self.hash_cache.get(path, algorithm)
+        file_info = stat(full_path)
+
+        if (
+            cached
+            and cached["size"] == file_info.st_size
+            and cached["modified"] == file_info.st_mtime
+        ):
+            return cached["hash"]
+
+        return Artifacts._hash_file(full_path, algorithm)
+
+    @synchronized
+    def duplicates(self, progress: callable = None) -> dict[str, list[str]]:
+        """Finds files with identical contents. Files are grouped by size, then files
+            big enough are grouped by a hash of their start and end, and only files
+            still in a group are fully hashed. Empty files are not considered.
+
+        Args:
+            progress (callable, optional): see hash_many. Defaults to None.
+
+        Returns:
+            dict[str, list[str]]: Map of hash hex digest to the (sorted) relative
+                                    paths of the files with that content
+        """
+        same_size = [sorted(g) for g in self.inventory.same_size(minimum=1)]
+        large = [
+            p
+            for group in same_size
+            for p in group
+            if self.inventory[p].size > 2 * Artifacts.PARTIAL_HASH_BYTES
+        ]
+
+        with ThreadPoolExecutor(Artifacts.HASH_THREADS) as pool:
+            partial = dict(
+                zip(
+                    large,
+                    pool.map(
+                        Artifacts._partial_hash,
+                        [join(self.directory, p) for p in large],
+                        [self.algorithm] * len(large),
+                    ),
+                )
+            )
+
+        candidates = []
+
+        for group in same_size:
+            by_partial = {}
+
+            for path in group:  # small files are not partially hashed (None)
+                by_partial.setdefault(partial.get(path, None), []).append(path)
+
+            candidates.extend(p for g in by_partial.values() if len(g) > 1 for p in g)
+
+        found = {}
+
+        for path, digest in self.hash_many(candidates, progress).items():
+            found.setdefault(digest, []).append(path)
+
+        return {h: sorted(p) for h, p in found.items() if len(p) > 1}
+
+    def _scan_directory(self, relative_dir: str, cached: bool = True) -> Listing:
+        """Lists a directory, unless it has not been modified since it was last listed
+
+        Args:
+            relative_dir (str): The directory relative to the artifacts directory
+            cached (bool, optional): Use the previous listing if the directory has not
+                                        been modified. Defaults to True.
+
+        Returns:
+            Listing: modified (ns, or None if it may still be changing),
+                                files (name -> [size, modified, device, inode], None
+                                once they are in the inventory) and dirs (names)
+        """
+        full_path = join(self.directory, relative_dir)
+        modified = stat(full_path).st_mtime_ns
+        previous = self.directories.get(relative_dir, None) if cached else None
+
+        if previous is not None and previous.modified == modified:
+            return previous
+
+        files = {}
+        dirs = []
+
+        with scandir(full_path) as entries:
+            for entry in entries:
+                is_dir = entry.is_dir()
+
+                if self.ignore.ignored(join(relative_dir, entry.name), is_dir):
+                    continue
+
+                if is_dir:
+                    if not entry.is_symlink():  # like os.walk, don't follow links
+                        dirs.append(entry.name)
+
+                    continue
+
+                try:
+                    info = entry.stat()
 
+                except OSError:  # broken symbolic link
+                    info = entry.stat(follow_symlinks=False)
+
+                files[entry.name] = [
+                    info.st_size,
+                    info.st_mtime,
+                    info.st_dev,
+                    info.st_ino,
+                ]
+
+        settled = time_ns() - modified > Artifacts.SETTLED_NS
+        return Listing(modified if settled else None, files, tuple(dirs))
+
+    def _scan(self, root: str = "", cached: bool = True) -> dict[str, Listing]:
+        """Lists all the directories in parallel (see _scan_directory)
+
+        Args:
+            root (str, optional): The relative directory to start at. Defaults to all.
+            cached (bool, optional): see _scan_directory. Defaults to True.
+
+        Returns:
+            dict[str, Listing]: directory relative path -> listing
+        """
+        scanned = {}
+
+        with ThreadPoolExecutor(Artifacts.SCAN_THREADS) as pool:
+            pending = {pool.submit(self._scan_directory, root, cached): root}
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    relative_dir = pending.pop(future)
+                    scanned[relative_dir] = future.result()
+
+                    for name in scanned[relative_dir].dirs:
+                        subdir = join(relative_dir, name)
+                        pending[pool.submit(self._scan_directory, subdir, cached)] = (
+                            subdir
+                        )
+
+        return scanned
+
+    def _sync_listings(self, scanned: dict[str, Listing]) -> None:
+        """Applies directory listings to the inventory. Once applied, the files of a
+            listing are dropped (they are in the inventory).
+
+        Args:
+            scanned (dict[str, Listing]): The listings (see _scan)
+        """
+        for relative_dir, listing in scanned.items():
+            if listing.files is not None:
+                self._sync_directory(relative_dir, listing.files)
+                scanned[relative_dir] = listing._replace(files=None)
+
+    @synchronized
+    def update(self, path: str) -> None:
+        """Brings a file, or everything under a directory, up to date with the disk.
+            Used to apply changes reported by a watcher (see watch).
+
+        Args:
+            path (str): The relative path of the file or directory that changed
+        """
+        full_path = join(self.directory, path)
+        scanned = {}
+
+        if self.ignore.excluded(path, isdir(full_path)):
+            return
+
+        if path in self.inventory and (isdir(full_path) or not lexists(full_path)):
+            self._remove(path)
+
+        if isdir(full_path) and not islink(full_path):
+            scanned = self._scan(path, cached=False)
+            self._sync_listings(scanned)
+
+        elif lexists(full_path):
+            file_info = stat(full_path) if exists(full_path) else lstat(full_path)
+            self._sync_file(
+                path,
+                file_info.st_size,
+                file_info.st_mtime,
+                (file_info.st_dev, file_info.st_ino),
+            )
+
+        for gone in set(self.files_under(path)):
+            if dirname(gone) not in scanned:
+                self._remove(gone)
+
+        self._carry_moved()
+
+    def watch(self, poll_seconds: float = POLL_SECONDS, inotify: bool = True) -> None:
+        """Keeps the inventory up to date in the background until close() is called.
+            Uses inotify when available, otherwise the directory is refreshed
+            periodically.
+
+        Args:
+            poll_seconds (float, optional): How often to refresh when polling.
+                                            Defaults to POLL_SECONDS.
+            inotify (bool, optional): Use inotify if available. Defaults to True.
+        """
+        if self.watcher is None:
+            self.watcher = start_watching(self, poll_seconds, inotify)
+
+    @synchronized
     def refresh(self) -> None:
-        """Looks for new files in the artifacts directory"""
-        all_files = {
-            relpath(join(r, f), self.directory)
-            for r, _, fs in walk(self.directory)
-            for f in fs
-        }
+        """Looks for new, changed and removed files in the artifacts directory.
+        Directories that have not been modified since the last refresh are not listed
+        again (so changes to the contents of a file in them are not noticed until it
+        is hashed). Files that were renamed or moved keep their cached hashes.
+        """
+        scanned = self._scan()
+        changed = scanned.keys() != self.directories.keys() or any(
+            listing is not self.directories[d] for d, listing in scanned.items()
+        )
+
+        for relative_dir, previous in self.directories.items():
+            listing = scanned.get(relative_dir, None)
+
+            if listing is None:
+                for name in self.inventory.files_in(relative_dir):
+                    self._remove(join(relative_dir, name))
+
+            # files from the directory cache that are gone (not in the inventory yet)
+            if previous.files is not None and listing is not previous:
+                kept = listing.files.keys() if listing is not None else set()
+
+                for name in previous.files.keys() - kept:
+                    self._forget(join(relative_dir, name))
+
+        self._sync_listings(scanned)
+        self._carry_moved()
+        self.directories = scanned
 
-        for file in all_files:
-            if file not in self.inventory:
-                self.inventory[file] = Artifacts._new_entry()
+        if changed:
+            self._save_directories()
 
+    @synchronized
     def paths(self, filename: str) -> list[str]:
         """Returns all the paths for a given filename
 
@@ -182,8 +721,9 @@ class Artifacts:
             list[str]: The list of relative paths from the artifacts directory for
                             all files found with that filename
         """
-        return [f for f in self.inventory if basename(f) == filename]
+        return self.inventory.named(filename)
 
+    @synchronized
     def suffixed(self, suffix: str) -> list[str]:
         """Finds all relative file paths that end with the given suffix
 
@@ -195,6 +735,7 @@ class Artifacts:
         """
         return [f for f in self.inventory if f.endswith(suffix)]
 
+    @synchronized
     def has_file(self, file_path: str) -> bool:
         """See if this file exists
 
@@ -206,6 +747,7 @@ class Artifacts:
         """
         return file_path in self.inventory
 
+    @synchronized
     def has_dir(self, dir_path: str) -> bool:
         """Does a directory with a file in it exist
 
@@ -215,8 +757,9 @@ class Artifacts:
         Returns:
             bool: We found the directory (must have a file in it)
         """
-        return any(commonpath([dir_path, f]) == dir_path for f in self.inventory)
+        return self.inventory.has_directory(dir_path)
 
+    @synchronized
     def files_under(self, dir_path: str) -> list[str]:
         """Get the list of files in a directory (recursively)
 
@@ -226,8 +769,9 @@ class Artifacts:
         Returns:
             list[str]: The files under that directory
         """
-        return [f for f in self.inventory if commonpath([dir_path, f]) == dir_path]
+        return self.inventory.files_under(dir_path)
 
+    @synchronized
     def add(self, *relative_file_path: str) -> None:
         """Adds a file to the inventory
 
@@ -238,7 +782,7 @@ class Artifacts:
 
         for path in relative_file_path:
             if path not in self.inventory and isfile(join(self.directory, path)):
-                self.inventory[path] = Artifacts._new_entry(accounted=True)
+                self._insert_stat(path, accounted=True)
                 continue
 
             if path not in self.inventory:
@@ -249,6 +793,7 @@ class Artifacts:
 
         assert len(not_found) == 0, not_found
 
+    @synchronized
     def lost(self) -> list[str]:
         """Gets a list of all the files in the artifacts directory that have not been referenced
 
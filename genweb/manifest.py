@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+
+""" Remember what went into each generated file so unchanged files can be skipped """
+
+
+from os import makedirs, replace
+from os.path import isfile, join, dirname
+from hashlib import new as Hasher
+from json import load, dump, dumps
+
+
+def fingerprint(*inputs) -> str:
+    """Calculates a stable fingerprint of the given inputs
+
+    Args:
+        inputs (any*): JSON-able values (anything else is converted with str())
+
+    Returns:
+        str: The sha256 hex digest of the inputs
+    """
+    serialized = dumps(inputs, sort_keys=True, default=str, separators=(",", ":"))
+    return Hasher("sha256", serialized.encode("utf-8")).hexdigest()
+
+
+def files_fingerprint(directory: str, *names: str) -> str:
+    """Calculates a fingerprint of the contents of files
+
+    Args:
+        directory (str): The directory the files are in
+        names (str*): The names of the files in the directory
+
+    Returns:
+        str: The sha256 hex digest of the names and contents of the files
+    """
+    hasher = Hasher("sha256")
+
+    for name in sorted(names):
+        hasher.update(name.encode("utf-8"))
+
+        with open(join(directory, name), "rb") as file:
+            hasher.update(Hasher("sha256", file.read()).digest())
+
+    return hasher.hexdigest()
+
+
+class Manifest:
+    """Map of generated file (relative to the site) to the fingerprint of its inputs
+    and how each file linked into the site was put there
+    """
+
+    def __init__(self, site_dir: str, path: str):
+        self.site_dir = site_dir
+        self.path = path
+        self.fingerprints = {}
+        self.links = {}
+
+        if isfile(path):
+            with open(path, "r", encoding="utf-8") as manifest_file:
+                contents = load(manifest_file)
+
+            self.fingerprints = contents.get("fingerprints", {})
+            self.links = contents.get("links", {})
+
+    def unchanged(self, output: str, inputs: str) -> bool:
+        """Determines if a generated file is still current
+
+        Args:
+            output (str): The path of the generated file relative to the site
+            inputs (str): The fingerprint of the inputs to the generated file
+
+        Returns:
+            bool: True if the file exists and was generated from the same inputs
+        """
+        if self.fingerprints.get(output, None) != inputs:
+            return False
+
+        return isfile(join(self.site_dir, output))
+
+    def record(self, output: str, inputs: str) -> None:
+        """Remember the inputs used to generate a file
+
+        Args:
+            output (str): The path of the generated file relative to the site
+            inputs (str): The fingerprint of the inputs to the generated file
+        """
+        self.fingerprints[output] = inputs
+
+    def forget(self, output: str) -> None:
+        """Stop tracking a generated file that is no longer generated
+
+        Args:
+            output (str): The path of the generated file relative to the site
+        """
+        self.fingerprints.pop(output, None)
+
+    def save(self) -> None:
+        """Write the manifest to disk"""
+        makedirs(dirname(self.path), exist_ok=True)
+        temporary_path = self.path + ".tmp"
+
+        with open(temporary_path, "w", encoding="utf-8") as manifest_file:
+            dump(
+                {"fingerprints": self.fingerprints, "links": self.links},
+                manifest_file,
+                sort_keys=True,
+            )
+
+        replace(temporary_path, self.path)
@@ -1,15 +1,24 @@
 #!/usr/bin/env python3
 
 
-""" Hanldes loading and saving of metadta """
+""" Hanldes loading and saving of metadta
+
+Fold the changes (revisions and journal) into one revision file with:
+
+    python3 -m genweb.metadata path/to/metadata.yml
+"""
 
 
 from glob import glob
-from copy import deepcopy
-from os.path import splitext, join, relpath
+from os import fsync, remove, replace, SEEK_END
+from os.path import splitext, join, relpath, isfile, dirname
 from datetime import datetime
+from argparse import ArgumentParser
+from json import dumps, loads
+from time import monotonic
 
 from yaml import safe_load, safe_dump
+from devopsdriver.settings import Settings
 
 from genweb.inventory import Artifacts
 
@@ -27,31 +36,182 @@ def load_yaml(path: str) -> dict[str, dict]:
         return safe_load(file)
 
 
-class Metadata:
+class FrozenDict(dict):
+    """A dict that cannot be changed (so it can be shared instead of copied)"""
+
+    def _immutable(self, *_, **__):
+        raise TypeError(f"{type(self).__name__} cannot be changed, see thaw()")
+
+    __setitem__ = __delitem__ = __ior__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __reduce__(self):  # pickle and deepcopy would otherwise use __setitem__
+        return (FrozenDict, (dict(self),))
+
+
+def freeze(value: any) -> any:
+    """Makes an immutable copy of loaded yaml (dicts become FrozenDict, lists tuples)
+
+    Args:
+        value (any): The value (dict, list or scalar)
+
+    Returns:
+        any: The value if already immutable, or an immutable copy
+    """
+    if isinstance(value, FrozenDict):
+        return value
+
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+
+    return value
+
+
+def thaw(value: any) -> any:
+    """Makes a mutable copy of a frozen value (FrozenDicts become dicts, tuples lists)
+
+    Args:
+        value (any): The value (see freeze)
+
+    Returns:
+        any: A copy that can be changed
+    """
+    if isinstance(value, dict):
+        return {k: thaw(v) for k, v in value.items()}
+
+    if isinstance(value, (list, tuple)):
+        return [thaw(v) for v in value]
+
+    return value
+
+
+class Metadata:  # pylint: disable=too-many-instance-attributes
     """dict-like object
-    When loading from file name.ext revisions are saved to name YYYY-MM-DD HH:MM:SS.ext
-    Revisions saved earlier are preserved, but overridden by later revisions
+    When loading from file name.ext revisions in name YYYY-MM-DD HH:MM:SS.ext and then
+    changes in the journal, name.journal, override the original.
+    Changes are saved by appending them to the journal, see compact() to fold them
+    into one revision.
+    Entries are frozen (see FrozenDict) so reading does not copy them, use editable()
+    to get a copy to change and then set it.
     """
 
+    SYNC_RECORDS = 64  # fsync the journal after this many changes
+    SYNC_SECONDS = 5.0  # or when this long has passed since the last fsync
+
     def __init__(self, path: str):
         self.path = path  # original file
-
-        # Calculate the file we will save any changes to
-        base, extension = splitext(path)
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.revision_path = f"{base} {now}{extension}"
+        self.journal_path = Metadata.__journal_path(path)
+        self.journal = None  # opened on the first save
+        self.unsaved = {}  # identifiers set since the last save
+        self.unsynced = 0  # changes written since the last fsync
+        self.last_sync = monotonic()
 
         # load all the revisions
         self.original = Metadata.__load(path)
         self.updated = {}
+        self.combined = dict(self.original)  # original with updated applied
 
     def save(self) -> None:
-        """If there are changes saves them to the revision file"""
-        if not self.updated:
+        """If there are changes appends them to the journal (only the changes since
+        the last save). The journal is synced to disk in batches, see sync_due().
+        """
+        if not self.unsaved:
             return
 
-        with open(self.revision_path, "w", encoding="utf-8") as revision_file:
-            safe_dump(self.updated, revision_file)
+        if self.journal is None:
+            torn = Metadata.__torn(self.journal_path)
+            self.journal = open(  # pylint: disable=consider-using-with
+                self.journal_path, "a", encoding="utf-8"
+            )
+
+            if torn:  # end the change cut short by a crash, so it is skipped alone
+                self.journal.write("\n")
+
+        for key in self.unsaved:
+            record = {"key": key, "yaml": safe_dump(thaw(self.updated[key]))}
+            self.journal.write(dumps(record) + "\n")  # one line, even with newlines
+
+        self.journal.flush()
+        self.unsynced += len(self.unsaved)
+        self.unsaved.clear()
+        self.sync_due()
+
+    def sync_due(self) -> None:
+        """Syncs the saved changes if there are enough of them or they have waited
+        long enough. Call it periodically (ie when idle) so the last changes saved do
+        not wait for the next save to reach the disk.
+        """
+        if (
+            self.unsynced >= Metadata.SYNC_RECORDS
+            or monotonic() - self.last_sync >= Metadata.SYNC_SECONDS
+        ):
+            self.sync()
+
+    def sync(self) -> None:
+        """Makes sure the saved changes are on disk"""
+        if self.journal is not None and self.unsynced:
+            fsync(self.journal.fileno())
+
+        self.unsynced = 0
+        self.last_sync = monotonic()
+
+    def close(self) -> None:
+        """Saves any changes, syncs them to disk and closes the journal"""
+        self.save()
+        self.sync()
+
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def compact(self) -> str | None:
+        """Folds the revisions and the journal into one revision (the original file
+        is not changed). The revision contains every entry that differs from the
+        original, so loading only reads two files. Do not compact while the metadata
+        is being edited.
+
+        Returns:
+            str | None: The revision written, or None if it was already compact
+                        (or there are no changes)
+        """
+        self.close()
+        folded = Metadata.__revisions(self.path)[1:]
+
+        if len(folded) <= 1 and not isfile(self.journal_path):
+            return None
+
+        folded.append(self.journal_path)
+        original = {k: freeze(v) for k, v in load_yaml(self.path).items()}
+        changed = {k: v for k, v in self.combined.items() if original.get(k, None) != v}
+        base, extension = splitext(self.path)
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        revision_path = f"{base} {now}{extension}" if changed else None
+
+        if changed:  # the journal is removed after the revision is complete
+            with open(revision_path + ".tmp", "w", encoding="utf-8") as revision_file:
+                safe_dump(thaw(changed), revision_file)
+
+            replace(revision_path + ".tmp", revision_path)
+
+        for path in folded:
+            if path != revision_path and isfile(path):
+                remove(path)
+
+        return revision_path
+
+    def editable(self, key: str) -> dict:
+        """Gets a copy of an entry that can be changed (set it to save the changes)
+
+        Args:
+            key (str): The identifier
+
+        Returns:
+            dict: A mutable copy of the entry
+        """
+        return thaw(self.combined[key])
 
     @staticmethod
     def _inline_copy_list(inline: dict, artifacts: Artifacts) -> list[tuple[str, str]]:
@@ -131,9 +291,25 @@ class Metadata:
         return to_copy
 
     @staticmethod
-    def __load(path: str) -> dict[str:dict]:
-        result = {}
+    def __journal_path(path: str) -> str:
+        # not base*ext, so it isn't mistaken for a revision
+        return splitext(path)[0] + ".journal"
 
+    @staticmethod
+    def __torn(journal_path: str) -> bool:
+        # the last line is not complete (a crash while appending)
+        if not isfile(journal_path):
+            return False
+
+        with open(journal_path, "rb") as journal_file:
+            if journal_file.seek(0, SEEK_END) == 0:
+                return False
+
+            journal_file.seek(-1, SEEK_END)
+            return journal_file.read(1) != b"\n"
+
+    @staticmethod
+    def __revisions(path: str) -> list[str]:
         # Revisions are stored as: base YYYY-mm-dd HH:MM:SS.ext
         base, extension = splitext(path)
         revisions = glob(base + "*" + extension)
@@ -141,40 +317,46 @@ class Metadata:
         revisions.remove(path)
         revisions.sort()
         revisions.insert(0, path)
+        return revisions
+
+    @staticmethod
+    def __load(path: str) -> dict[str:dict]:
+        result = {}
 
         # load them in order to have later override earlier
-        for revision_path in revisions:
+        for revision_path in Metadata.__revisions(path):
             revision = Metadata.__validate(load_yaml(revision_path))
-            result.update(revision)
+            result.update((k, freeze(v)) for k, v in revision.items())
+
+        journal_path = Metadata.__journal_path(path)
+
+        if isfile(journal_path):
+            with open(journal_path, "r", encoding="utf-8") as journal_file:
+                for line in journal_file:
+                    try:
+                        record = loads(line)
+
+                    except ValueError:  # change cut short by a crash
+                        continue
+
+                    result[record["key"]] = freeze(safe_load(record["yaml"]))
+
         return result
 
     @staticmethod
     def __validate(metadata: dict[str:dict]) -> dict[str:dict]:
         return metadata
 
-    def __combined(self, deep=False) -> dict[str:dict]:
-        if deep:
-            combined = deepcopy(self.original)
-            combined.update(deepcopy(self.updated))
-        else:
-            combined = dict(self.original)
-            combined.update(self.updated)
-
-        return combined
-
     # MARK: dict methods
 
-    def __getitem__(self, key: str) -> dict:
-        if key in self.updated:
-            return deepcopy(self.updated[key])
-
-        return deepcopy(self.original[key])
+    def __getitem__(self, key: str) -> FrozenDict:
+        return self.combined[key]
 
     def __repr__(self) -> str:
-        return repr(self.__combined())
+        return repr(self.combined)
 
     def __len__(self) -> int:
-        return len(self.__combined())
+        return len(self.combined)
 
     def has_key(self, key: str) -> bool:
         """Is the given identifier available
@@ -185,37 +367,37 @@ class Metadata:
         Returns:
             bool: True if found
         """
-        return key in self.original or key in self.updated
+        return key in self.combined
 
-    def keys(self) -> list[str]:
-        """A list of the identifiers
+    def keys(self):
+        """The identifiers
 
         Returns:
-            list[str]: The identifiers
+            KeysView: The identifiers
         """
-        return self.__combined().keys()
+        return self.combined.keys()
 
-    def values(self) -> list[dict]:
-        """A list of the people
+    def values(self):
+        """The entries (frozen, see editable)
 
         Returns:
-            list[dict]: The people
+            ValuesView: The entries
         """
-        return [deepcopy(v) for v in self.__combined().values()]
+        return self.combined.values()
 
-    def items(self) -> list[tuple[str, dict]]:
-        """Get a list of pairs of identifiers and people
+    def items(self):
+        """Get pairs of identifiers and entries (frozen, see editable)
 
         Returns:
-            list[tuple(str, dict)]: The identifiers and people
+            ItemsView: The identifiers and entries
         """
-        return [(k, deepcopy(v)) for k, v in self.__combined().items()]
+        return self.combined.items()
 
     def __contains__(self, key: str) -> bool:
-        return key in self.original or key in self.updated
+        return key in self.combined
 
     def __iter__(self):
-        return iter(self.__combined(deep=True))
+        return iter(self.combined)
 
     def get(self, key: str, default: dict | None = None) -> dict | None:
         """Gets the person for a given id, or a default person if the id is not found
@@ -226,15 +408,27 @@ class Metadata:
                                                             id is not found. Defaults to None.
 
         Returns:
-            dict | None: _description_
+            dict | None: The entry (frozen, see editable) or default
         """
-        if key in self.updated:
-            return deepcopy(self.updated[key])
+        return self.combined.get(key, default)
+
+    def __setitem__(self, key: str, item: dict):
+        self.updated[key] = self.combined[key] = freeze(item)
+        self.unsaved[key] = None
+
 
-        if key in self.original:
-            return deepcopy(self.original[key])
+def main() -> None:
+    """Parse the command line and compact the metadata"""
+    parser = ArgumentParser(description="Fold metadata changes into one revision")
+    parser.add_argument(
+        "path", nargs="?", help="metadata file (default: metadata_yaml in genweb.yml)"
+    )
+    args = parser.parse_args()
+    settings_file = join(dirname(__file__), "genweb.py")  # genweb.yml, like genweb
+    path = args.path if args.path else Settings(settings_file)["metadata_yaml"]
+    revision_path = Metadata(path).compact()
+    print(f"Compacted into {revision_path}" if revision_path else "Already compact")
 
-        return default
 
-    def __setitem__(self, key, item):
-        self.updated[key] = item
+if __name__ == "__main__":
+    main()
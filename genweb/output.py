@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+
+
+""" Only write output files whose contents change, so unchanged files keep their mtime """
+
+
+from os import getpid, replace, stat, lstat, unlink, link, makedirs, scandir, utime
+from os.path import isfile, isdir, join, dirname
+from shutil import copyfile
+from collections import Counter
+from errno import EXDEV, EPERM, EOPNOTSUPP, ENOTSUP, EINVAL, ENOSYS, ENOTTY, EMLINK
+import os
+
+try:
+    from fcntl import ioctl
+except ImportError:  # not available on Windows
+    ioctl = None
+
+
+COMPARE_CHUNK_SIZE_BYTES = 1 * 1024 * 1024  # 1 MiB
+COPY_CHUNK_SIZE_BYTES = 64 * 1024 * 1024  # 64 MiB per kernel copy call
+FICLONE = 0x40049409  # linux/fs.h _IOW(0x94, 9, int)
+FALLBACK_ERRORS = {EXDEV, EPERM, EOPNOTSUPP, ENOTSUP, EINVAL, ENOSYS, ENOTTY, EMLINK}
+# the strategy can never work for the filesystem (not just this file, like EPERM)
+DEVICE_ERRORS = {EXDEV, EOPNOTSUPP, ENOTSUP, ENOSYS, ENOTTY}
+
+
+def identical(path1: str, path2: str) -> bool:
+    """Determines if two files have the same contents (checks size first)
+
+    Args:
+        path1 (str): The path to one file
+        path2 (str): The path to the other file
+
+    Returns:
+        bool: True if the files are the same size and have the same bytes
+    """
+    if stat(path1).st_size != stat(path2).st_size:
+        return False
+
+    with open(path1, "rb") as file1, open(path2, "rb") as file2:
+        while True:
+            block = file1.read(COMPARE_CHUNK_SIZE_BYTES)
+
+            if block != file2.read(COMPARE_CHUNK_SIZE_BYTES):
+                return False
+
+            if not block:
+                return True
+
+
+def replace_if_changed(new_path: str, path: str) -> bool:
+    """Moves a new file into place unless the existing file is identical
+
+    Args:
+        new_path (str): The newly written file (removed either way)
+        path (str): The final location of the file
+
+    Returns:
+        bool: True if the file was replaced, False if it was left alone
+    """
+    if isfile(path) and identical(new_path, path):
+        unlink(new_path)
+        return False
+
+    replace(new_path, path)
+    return True
+
+
+def copy_if_changed(source: str, destination: str) -> bool:
+    """Copies a file unless the destination is identical
+
+    Args:
+        source (str): The file to copy
+        destination (str): Where to copy it to
+
+    Returns:
+        bool: True if the file was copied, False if it was left alone
+    """
+    if isfile(destination) and identical(source, destination):
+        return False
+
+    temporary_path = f"{destination}.{getpid()}.tmp"
+    copyfile(source, temporary_path)
+    replace(temporary_path, destination)
+    return True
+
+
+def site_inodes(site_dir: str) -> dict[str, int]:
+    """Lists every file in the site along with its inode in a single pass.
+        The inode comes from the directory listing, so no file is stat'ed.
+
+    Args:
+        site_dir (str): The root of the site
+
+    Returns:
+        dict[str, int]: Map of path relative to site_dir to the inode of the file
+    """
+    found = {}
+    pending = [""] if isdir(site_dir) else []
+
+    while pending:
+        relative_dir = pending.pop()
+
+        with scandir(join(site_dir, relative_dir)) as entries:
+            for entry in entries:
+                relative_path = join(relative_dir, entry.name)
+
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(relative_path)
+                    continue
+
+                found[relative_path] = entry.inode()
+
+    return found
+
+
+def reflink(source: str, destination: str) -> None:
+    """Clone a file so it shares its blocks with the source (btrfs, XFS, ...)
+
+    Args:
+        source (str): The file to clone
+        destination (str): The path of the new file
+    """
+    if ioctl is None:
+        raise OSError(ENOSYS, "reflink not supported", destination)
+
+    with open(source, "rb") as source_file, open(destination, "wb") as dest_file:
+        ioctl(dest_file.fileno(), FICLONE, source_file.fileno())
+
+
+def copy_range(source: str, destination: str) -> None:
+    """Copy a file in the kernel with copy_file_range
+
+    Args:
+        source (str): The file to copy
+        destination (str): The path of the new file
+    """
+    with open(source, "rb") as source_file, open(destination, "wb") as dest_file:
+        while os.copy_file_range(
+            source_file.fileno(), dest_file.fileno(), COPY_CHUNK_SIZE_BYTES
+        ):
+            pass
+
+
+def send_file(source: str, destination: str) -> None:
+    """Copy a file in the kernel with sendfile
+
+    Args:
+        source (str): The file to copy
+        destination (str): The path of the new file
+    """
+    with open(source, "rb") as source_file, open(destination, "wb") as dest_file:
+        offset = 0
+
+        while True:
+            sent = os.sendfile(
+                dest_file.fileno(), source_file.fileno(), offset, COPY_CHUNK_SIZE_BYTES
+            )
+
+            if not sent:
+                break
+
+            offset += sent
+
+
+# From cheapest to most expensive, the last one is expected to always work
+MATERIALIZE_STRATEGIES = [
+    ("hardlink", link),
+    ("reflink", reflink),
+    *([("copy_file_range", copy_range)] if hasattr(os, "copy_file_range") else []),
+    *([("sendfile", send_file)] if hasattr(os, "sendfile") else []),
+    ("copy", copyfile),  # uses the platform's zero-copy mechanism when available
+]
+
+
+def materialize(
+    source: str,
+    destination: str,
+    strategies: list[tuple[str, callable]] = None,
+    unsupported: set[str] = None,
+) -> str:
+    """Puts a file at destination using the first strategy that works.
+        Copies get the source's modification time so they can be recognized as current.
+
+    Args:
+        source (str): The file to link or copy
+        destination (str): The path to place it at (must not exist)
+        strategies (list[tuple[str, callable]], optional): The names and functions to
+                                                            try in order.
+                                                            Defaults to all of them.
+        unsupported (set[str], optional): The names of strategies that failed with a
+                                            DEVICE_ERRORS error are added to it.
+                                            Defaults to None.
+
+    Returns:
+        str: The name of the strategy that worked
+    """
+    strategies = strategies if strategies else MATERIALIZE_STRATEGIES
+
+    for name, strategy in strategies:
+        try:
+            strategy(source, destination)
+
+        except OSError as error:
+            if error.errno not in FALLBACK_ERRORS or name == strategies[-1][0]:
+                raise
+
+            if unsupported is not None and error.errno in DEVICE_ERRORS:
+                unsupported.add(name)
+
+            if isfile(destination):
+                unlink(destination)
+
+            continue
+
+        if name != "hardlink":
+            source_info = stat(source)
+            utime(destination, ns=(source_info.st_atime_ns, source_info.st_mtime_ns))
+
+        return name
+
+    raise AssertionError("no strategies given")
+
+
+def is_current(source_info, destination_path: str, inode: int | None) -> bool:
+    """Determines if the file in the site is the source or an up to date copy of it
+
+    Args:
+        source_info (stat_result): The stat of the source file
+        destination_path (str): The file in the site
+        inode (int | None): The inode of the file in the site (None if it doesn't exist)
+
+    Returns:
+        bool: True if the file is the source (hard link) or a copy with the same
+                size and modification time
+    """
+    if inode is None:
+        return False
+
+    destination_info = lstat(destination_path)
+
+    if destination_info.st_dev == source_info.st_dev and inode == source_info.st_ino:
+        return True
+
+    return (
+        destination_info.st_size == source_info.st_size
+        and destination_info.st_mtime_ns == source_info.st_mtime_ns
+    )
+
+
+def sync_links(
+    site_dir: str, links: dict[str, str], previous: dict[str, str] = None
+) -> tuple[dict[str, str], Counter]:
+    """Links (or copies) files into the site, only touching files that have changed.
+        Each file is hard linked if possible, otherwise cloned or copied in the kernel
+        (see MATERIALIZE_STRATEGIES). Once a strategy is unsupported for a source
+        filesystem (see DEVICE_ERRORS), it is not tried again for other files from that
+        filesystem. Failures specific to one file (like EPERM or EMLINK) are not
+        remembered.
+
+    Args:
+        site_dir (str): The root of the site
+        links (dict[str, str]): Map of path relative to site_dir to the file to link there
+        previous (dict[str, str], optional): The strategies returned by a previous sync.
+                                                Any paths no longer in links are removed.
+                                                Defaults to None.
+
+    Returns:
+        tuple[dict[str, str], Counter]: Map of path relative to site_dir to the name of
+                                        the strategy used to put it there, and the
+                                        number of files per strategy, "current" (already
+                                        there) and "removed"
+    """
+    previous = previous if previous else {}
+    existing = site_inodes(site_dir)
+    unsupported = {}  # source device -> names of strategies that cannot work
+    strategies = {}
+    results = Counter()
+
+    for destination, source in links.items():
+        source_info = stat(source)
+        destination_path = join(site_dir, destination)
+
+        if is_current(source_info, destination_path, existing.get(destination, None)):
+            strategies[destination] = previous.get(destination, "current")
+            results["current"] += 1
+            continue
+
+        if destination in existing:
+            unlink(destination_path)
+
+        else:
+            makedirs(dirname(destination_path), exist_ok=True)
+
+        skip = unsupported.setdefault(source_info.st_dev, set())
+        strategy = materialize(
+            source,
+            destination_path,
+            [s for s in MATERIALIZE_STRATEGIES if s[0] not in skip],
+            skip,
+        )
+        strategies[destination] = strategy
+        results[strategy] += 1
+
+    for destination in set(previous) - set(links):
+        if destination in existing:
+            unlink(join(site_dir, destination))
+            results["removed"] += 1
+
+    return strategies, results
@@ -3,58 +3,138 @@
 
 """ Render a .mako template """
 
-from os.path import realpath, dirname, basename, join, isdir
-from os import listdir
+from os.path import realpath, dirname, basename, join, isdir, isfile
+from os import listdir, getpid, unlink
+from functools import cache
 
 from mako.lookup import TemplateLookup
+from mako.template import Template
+from mako.runtime import Context
 
+from genweb.output import replace_if_changed
 
-CACHE_DIR = "/tmp/mako_modules"
 
+CACHE_DIR = "/tmp/mako_modules"
+OUTPUT_BUFFER_BYTES = 256 * 1024
+LOOKUPS = {}  # (template directory, *search directories) -> TemplateLookup
+LOOKUP_STATS = {"hits": 0, "misses": 0}
 
-def render(template_path: str, *search_dirs, **args) -> str:
-    """Render a template file searching for includes in given directories and using given args
 
-    Args:
-        template_path (str): The path to the template file
-        search_dirs (str*): Directories to search for includes
-        args (dict[str:any]): Args to pass to the script
+@cache
+def package_dirs() -> tuple[str, ...]:
+    """The directories around the package that are always searched for includes
 
     Returns:
-        _type_: _description_
+        tuple[str, ...]: The package's parent directory, its subdirectories and
+                            the subdirectories of the package
     """
     script_dir = dirname(realpath(__file__))
-    search_dirs = list(search_dirs)
     script_parent_dir = dirname(script_dir)
-    search_dirs.extend(
-        [
-            join(script_parent_dir, x)
-            for x in listdir(script_parent_dir)
-            if isdir(join(script_parent_dir, x))
-        ]
-    )
+    search_dirs = [
+        join(script_parent_dir, x)
+        for x in listdir(script_parent_dir)
+        if isdir(join(script_parent_dir, x))
+    ]
     search_dirs.extend(
         [join(script_dir, x) for x in listdir(script_dir) if isdir(join(script_dir, x))]
     )
     search_dirs.append(script_parent_dir)
-    search_dirs.append(dirname(template_path))
-    lookup = TemplateLookup(
-        directories=list(set(search_dirs)), module_directory=CACHE_DIR
+    return tuple(search_dirs)
+
+
+def lookup(template_path: str, *search_dirs) -> TemplateLookup:
+    """Gets the (shared) template lookup for a template and include directories.
+        Lookups are created once per set of directories and keep their compiled templates.
+
+    Args:
+        template_path (str): The path to the template file
+        search_dirs (str*): Directories to search for includes
+
+    Returns:
+        TemplateLookup: The lookup to find the template and its includes with
+    """
+    key = (dirname(template_path), *search_dirs)
+
+    if key in LOOKUPS:
+        LOOKUP_STATS["hits"] += 1
+        return LOOKUPS[key]
+
+    LOOKUP_STATS["misses"] += 1
+    directories = [*search_dirs, *package_dirs(), dirname(template_path)]
+    LOOKUPS[key] = TemplateLookup(
+        directories=list(set(directories)), module_directory=CACHE_DIR
     )
-    template = lookup.get_template(basename(template_path))
-    return template.render(**args)
+    return LOOKUPS[key]
+
+
+def lookup_stats() -> dict[str, int]:
+    """Get the number of times a template lookup was reused (hits) or created (misses)
+
+    Returns:
+        dict[str, int]: hits, misses and the number of lookups currently cached
+    """
+    return {**LOOKUP_STATS, "lookups": len(LOOKUPS)}
+
 
+def clear_lookups() -> None:
+    """Forget all the cached template lookups and reset the statistics"""
+    LOOKUPS.clear()
+    LOOKUP_STATS.update(hits=0, misses=0)
 
-def render_to_file(output_path: str, template_path: str, *search_dirs, **args) -> None:
-    """Render a template to a file on disk
+
+def get_template(template_path: str, *search_dirs) -> Template:
+    """Gets the compiled template
+
+    Args:
+        template_path (str): The path to the template file
+        search_dirs (str*): Directories to search for includes
+
+    Returns:
+        Template: The compiled template
+    """
+    return lookup(template_path, *search_dirs).get_template(basename(template_path))
+
+
+def render(template_path: str, *search_dirs, **args) -> str:
+    """Render a template file searching for includes in given directories and using given args
+
+    Args:
+        template_path (str): The path to the template file
+        search_dirs (str*): Directories to search for includes
+        args (dict[str:any]): Args to pass to the script
+
+    Returns:
+        str: The rendered template
+    """
+    return get_template(template_path, *search_dirs).render(**args)
+
+
+def render_to_file(output_path: str, template_path: str, *search_dirs, **args) -> bool:
+    """Render a template to a file on disk.
+        The template is streamed into a temporary file next to the output which then
+        replaces the output, so the page is never held in memory and readers never see
+        a partially written file. If the output is unchanged, it is left alone.
 
     Args:
         output_path (str): The file to render into
         template_path (str): The template to render
         search_dirs (*str): Any directories to search for includes
         args (**dict[str:any]): Arguments to pass to the template
+
+    Returns:
+        bool: True if the file was written, False if the existing file was identical
     """
-    contents = render(template_path, *search_dirs, **args)
+    template = get_template(template_path, *search_dirs)
+    temporary_path = f"{output_path}.{getpid()}.tmp"
+
+    try:
+        with open(
+            temporary_path, "w", encoding="utf-8", buffering=OUTPUT_BUFFER_BYTES
+        ) as output_file:
+            template.render_context(Context(output_file, **args), **args)
+
+        return replace_if_changed(temporary_path, output_path)
 
-    with open(output_path, "w", encoding="utf-8") as output_file:
-        output_file.write(contents)
+    finally:
+        if isfile(temporary_path):
+            unlink(temporary_path)
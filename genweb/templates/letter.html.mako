@@ -0,0 +1,37 @@
+<%page 
+    args="letter,surnames"
+/><!DOCTYPE html>
+<html lang="en" translate="no" class="notranslate">
+	<head>
+        <title>Family - ${letter}</title>
+        <meta http-equiv="Content-Type" content="text/html; charset=utf-8"/>
+        <meta charset="utf-8"/>
+		<meta name="google" content="notraslate"/>
+        <link rel="stylesheet" href="../static/styles.css">
+        <script>
+            <%include file="actions.js"/>
+        </script>
+    </head>
+	<body class="notranslate">
+        <div class="controls">
+            <a href="../index.html">&#x1f3e0;</a>
+        </div>
+        <center><h1>${letter}</h1></center>
+        % for surname, surname_people in surnames.items():
+        <span id="surname-${surname}-button" onclick="show_hide('surname-${surname}')" style="font-size:xx-large">▸</span>
+        <span style="font-size:x-large" onclick="show_hide('surname-${surname}')">${surname}</span>
+        <div id="surname-${surname}" style="display:none">
+            <ul>
+                % for person in surname_people:
+                <li>
+                    <a href="../${person.id}/index.html">
+                        ${person.surname}, ${person.given}, ${'?' if person.birthdate is None else person.birthdate.strftime("%Y")}
+                    </a>
+                    
+                </li>
+                % endfor
+            </ul>
+        </div>
+        % endfor
+    </body>
+</html>
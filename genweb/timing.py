@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+
+""" Measure where the time goes while building the site """
+
+
+from os import times, makedirs
+from os.path import dirname
+from time import perf_counter
+from platform import system
+from contextlib import contextmanager
+from heapq import heappush, heappushpop
+from json import dump
+
+try:
+    from resource import getrusage, RUSAGE_SELF, RUSAGE_CHILDREN
+except ImportError:  # not available on Windows
+    getrusage = None
+
+
+class Timings:
+    """Wall and CPU time per phase, item counts and the slowest pages"""
+
+    SLOWEST_COUNT = 10
+
+    def __init__(self, slowest_count: int = SLOWEST_COUNT):
+        self.slowest_count = slowest_count
+        self.phases = {}
+        self.counts = {}
+        self.slowest = []  # heap of (seconds, page)
+
+    def reset(self) -> None:
+        """Forget everything measured so far"""
+        self.phases.clear()
+        self.counts.clear()
+        self.slowest.clear()
+
+    @staticmethod
+    def _cpu_time() -> float:
+        """CPU time of this process and any child processes that have finished"""
+        used = times()
+        return used.user + used.system + used.children_user + used.children_system
+
+    @staticmethod
+    def peak_memory_kib(who: int = None) -> int | None:
+        """The most memory (resident set size) used so far
+
+        Args:
+            who (int, optional): RUSAGE_SELF or RUSAGE_CHILDREN. Defaults to RUSAGE_SELF.
+
+        Returns:
+            int | None: The peak memory in KiB or None if it cannot be determined
+        """
+        if getrusage is None:
+            return None
+
+        peak = getrusage(RUSAGE_SELF if who is None else who).ru_maxrss
+        return peak // 1024 if system() == "Darwin" else peak  # macOS reports bytes
+
+    @contextmanager
+    def phase(self, name: str):
+        """Measure the wall and CPU time of a block of code (accumulates if repeated)
+            and the peak memory of the process at the end of it
+
+        Args:
+            name (str): The name of the phase
+        """
+        wall_start = perf_counter()
+        cpu_start = Timings._cpu_time()
+
+        try:
+            yield self
+
+        finally:
+            measured = self.phases.setdefault(name, {"wall": 0.0, "cpu": 0.0})
+            measured["wall"] += perf_counter() - wall_start
+            measured["cpu"] += Timings._cpu_time() - cpu_start
+            measured["peak_kib"] = Timings.peak_memory_kib()
+
+    def count(self, name: str, value: int = 1) -> None:
+        """Adds to a count of items
+
+        Args:
+            name (str): The name of the count
+            value (int, optional): How much to add. Defaults to 1.
+        """
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def page(self, name: str, seconds: float) -> None:
+        """Records how long a page took, keeping only the slowest
+
+        Args:
+            name (str): The page
+            seconds (float): How long it took
+        """
+        if len(self.slowest) < self.slowest_count:
+            heappush(self.slowest, (seconds, name))
+
+        elif self.slowest_count:
+            heappushpop(self.slowest, (seconds, name))
+
+    def report(self) -> dict:
+        """Get everything that was measured
+
+        Returns:
+            dict: phases (name -> wall and cpu seconds and peak memory), counts,
+                    slowest_pages (slowest first) and peak memory of this process and
+                    its children
+        """
+        return {
+            "peak_kib": Timings.peak_memory_kib(),
+            "peak_children_kib": (
+                Timings.peak_memory_kib(RUSAGE_CHILDREN) if getrusage else None
+            ),
+            "phases": {n: dict(m) for n, m in self.phases.items()},
+            "counts": dict(self.counts),
+            "slowest_pages": [
+                {"page": n, "seconds": s} for s, n in sorted(self.slowest, reverse=True)
+            ],
+        }
+
+    def save(self, path: str) -> None:
+        """Write the report as JSON
+
+        Args:
+            path (str): The file to write the report to
+        """
+        if dirname(path):  # not for a file in the current directory
+            makedirs(dirname(path), exist_ok=True)
+
+        with open(path, "w", encoding="utf-8") as report_file:
+            dump(self.report(), report_file, indent=2)
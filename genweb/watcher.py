@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+
+
+""" Watch the artifacts directory and apply changes to an Artifacts inventory
+
+Uses inotify (through ctypes) on Linux, otherwise the inventory is refreshed
+periodically (which is cheap, see Artifacts.refresh).
+"""
+
+
+from abc import ABC, abstractmethod
+from os import read, close, pipe, write, fsencode, fsdecode, scandir, strerror
+from os.path import join
+from select import select
+from threading import Thread, Event
+from struct import calcsize, unpack_from
+from ctypes import CDLL, get_errno
+from ctypes.util import find_library
+from errno import ENOENT, ENOTDIR
+from traceback import format_exc
+
+
+PRINT = print
+POLL_SECONDS = 2.0
+READ_BYTES = 64 * 1024
+EVENT_HEADER = "iIII"  # struct inotify_event: wd, mask, cookie, len (then name)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_ONLYDIR
+)
+
+
+def load_libc() -> CDLL | None:
+    """Gets the C library if it has inotify
+
+    Returns:
+        CDLL | None: The C library or None if inotify is not available
+    """
+    try:
+        libc = CDLL(find_library("c"), use_errno=True)
+
+    except OSError:
+        return None
+
+    return libc if hasattr(libc, "inotify_init1") else None
+
+
+class Watcher(ABC):
+    """Applies changes to an Artifacts inventory from a background thread"""
+
+    def __init__(self, artifacts, poll_seconds: float = POLL_SECONDS):
+        self.artifacts = artifacts
+        self.poll_seconds = poll_seconds
+        self.stopped = Event()
+        self.thread = Thread(target=self.run, name="artifacts watcher", daemon=True)
+
+    def start(self) -> "Watcher":
+        """Start watching in the background
+
+        Returns:
+            Watcher: self
+        """
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop watching and wait for the background thread to finish"""
+        self.stopped.set()
+        self.thread.join()
+
+    @abstractmethod
+    def run(self) -> None:
+        """Watch until stopped"""
+
+    def apply(self, path: str) -> None:
+        """Applies a change to the inventory. Failures are reported, not raised,
+            so the background thread keeps watching.
+
+        Args:
+            path (str): The relative path that changed ("" to refresh everything)
+        """
+        try:
+            if path:
+                self.artifacts.update(path)
+
+            else:
+                self.artifacts.refresh()
+
+        except OSError:  # changed again while updating, there is another event
+            pass
+
+        except Exception:  # pylint: disable=broad-exception-caught
+            PRINT(f"WARNING: unable to update '{path}' artifacts\n{format_exc()}")
+
+    def poll(self) -> None:
+        """Refresh the inventory periodically until stopped"""
+        while not self.stopped.wait(self.poll_seconds):
+            self.apply("")
+
+
+class PollingWatcher(Watcher):
+    """Refreshes the inventory periodically"""
+
+    def run(self) -> None:
+        self.poll()
+
+
+class InotifyWatcher(Watcher):
+    """Applies inotify events for every directory in the artifacts directory"""
+
+    def __init__(self, artifacts, libc: CDLL, poll_seconds: float = POLL_SECONDS):
+        super().__init__(artifacts, poll_seconds)
+        self.libc = libc
+        self.watches = {}  # watch descriptor -> relative directory
+        self.descriptor = libc.inotify_init1(IN_CLOEXEC)
+
+        if self.descriptor < 0:
+            raise OSError(get_errno(), strerror(get_errno()))
+
+        self.wake_read, self.wake_write = pipe()
+
+        try:
+            self.add_watches("")
+
+        except OSError:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        """Release the inotify instance (and all its watches)"""
+        for descriptor in [self.descriptor, self.wake_read, self.wake_write]:
+            close(descriptor)
+
+    def add_watches(self, relative_dir: str) -> None:
+        """Watch a directory and all the directories under it
+
+        Args:
+            relative_dir (str): The directory relative to the artifacts directory
+        """
+        pending = [relative_dir]
+
+        while pending:
+            relative_dir = pending.pop()
+            full_path = join(self.artifacts.directory, relative_dir)
+
+            if relative_dir and self.artifacts.ignore.excluded(relative_dir, True):
+                continue
+
+            watch = self.libc.inotify_add_watch(
+                self.descriptor, fsencode(full_path), WATCH_MASK
+            )
+
+            if watch < 0:
+                error = get_errno()
+
+                if error in {ENOENT, ENOTDIR}:  # removed since it was listed
+                    continue
+
+                raise OSError(error, strerror(error), full_path)  # ENOSPC: too many
+
+            self.watches[watch] = relative_dir
+
+            try:
+                with scandir(full_path) as entries:
+                    pending.extend(
+                        join(relative_dir, e.name)
+                        for e in entries
+                        if e.is_dir(follow_symlinks=False)
+                    )
+
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+
+    def stop(self) -> None:
+        self.stopped.set()
+        write(self.wake_write, b"x")
+        self.thread.join()
+        self.close()
+
+    def changed_paths(self, events: bytes) -> list[str]:
+        """Parses inotify events, updating the watches when directories come and go
+
+        Args:
+            events (bytes): The events read from the inotify descriptor
+
+        Returns:
+            list[str]: The relative paths that changed (in order, without repeats),
+                        or [""] if events were lost and everything must be refreshed
+        """
+        changed = {}
+        offset = 0
+
+        while offset < len(events):
+            watch, mask, _, length = unpack_from(EVENT_HEADER, events, offset)
+            offset += calcsize(EVENT_HEADER)
+            name = fsdecode(events[offset : offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                return [""]
+
+            if mask & IN_IGNORED:  # the directory was removed
+                self.watches.pop(watch, None)
+                continue
+
+            if watch not in self.watches or not name:
+                continue
+
+            path = join(self.watches[watch], name)
+
+            if mask & IN_ISDIR and mask & IN_MOVED_FROM:  # watches keep the old path
+                moved = [
+                    w
+                    for w, d in self.watches.items()
+                    if d == path or d.startswith(path + "/")
+                ]
+
+                for moved_watch in moved:
+                    self.libc.inotify_rm_watch(self.descriptor, moved_watch)
+                    del self.watches[moved_watch]
+
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self.add_watches(path)
+
+            changed[path] = None
+
+        return list(changed)
+
+    def run(self) -> None:
+        try:
+            while not self.stopped.is_set():
+                readable = select([self.descriptor, self.wake_read], [], [])[0]
+
+                if self.descriptor not in readable:
+                    continue
+
+                for path in self.changed_paths(read(self.descriptor, READ_BYTES)):
+                    self.apply(path)
+
+        except Exception:  # pylint: disable=broad-exception-caught
+            # ie out of watches for a new directory, events may have been missed
+            PRINT(f"WARNING: inotify failed, polling instead\n{format_exc()}")
+            self.apply("")
+            self.poll()
+
+
+def start_watching(
+    artifacts, poll_seconds: float = POLL_SECONDS, inotify: bool = True
+) -> Watcher:
+    """Start keeping an Artifacts inventory up to date
+
+    Args:
+        artifacts (Artifacts): The inventory to update
+        poll_seconds (float, optional): How often to refresh if inotify is not
+                                        used (or stops working).
+                                        Defaults to POLL_SECONDS.
+        inotify (bool, optional): Use inotify if it is available. Defaults to True.
+
+    Returns:
+        Watcher: The running watcher (call stop() to stop it)
+    """
+    libc = load_libc() if inotify else None
+
+    if libc is not None:
+        try:
+            return InotifyWatcher(artifacts, libc, poll_seconds).start()
+
+        except OSError:  # out of watches, fall back to polling
+            pass
+
+    return PollingWatcher(artifacts, poll_seconds).start()
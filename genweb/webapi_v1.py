@@ -36,7 +36,22 @@ class ApiV1:
         Args:
             location (str): Pass __file__
         """
-        self.settings, self.artifacts, self.people, self.metadata = load_startup_data()
+        self.settings, self.artifacts, self.people, self.metadata = load_startup_data(
+            watch=True
+        )
+
+    def sync(self) -> None:
+        """Make sure metadata changes reach the disk (call periodically)"""
+        if self.metadata is not None:
+            self.metadata.sync_due()
+
+    def close(self) -> None:
+        """Save and sync any metadata changes and stop watching the artifacts"""
+        if self.metadata is not None:
+            self.metadata.close()
+
+        if self.artifacts is not None:
+            self.artifacts.close()
 
     def parse_call(self, handler: Handler) -> tuple[str | None, str | None]:
         """Get the category and (possibly) the identifier from the call
@@ -21,6 +21,13 @@ STATIC_FILES = {
 }
 
 
+class EditorHTTPServer(HTTPServer):
+    """Syncs metadata changes to disk between requests"""
+
+    def service_actions(self) -> None:
+        API_V1.sync()
+
+
 class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
     """Metadata Editor Web Server"""
 
@@ -107,9 +114,15 @@ def start_webserver(port=8000, host="") -> None:
         host (str, optional): The host to listen on. Defaults to "", meaning all local addresses.
     """
     API_V1.load()
-    httpd = HTTPServer((host, port), SimpleHTTPRequestHandler)
+    httpd = EditorHTTPServer((host, port), SimpleHTTPRequestHandler)
     print("Starting web server")
-    httpd.serve_forever()
+
+    try:
+        httpd.serve_forever()
+
+    finally:  # ie Ctrl-C
+        httpd.server_close()
+        API_V1.close()
 
 
 start_webserver()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+""" Test the synthetic benchmark """
+
+from os.path import join, isfile
+from tempfile import TemporaryDirectory
+
+from genweb.benchmark import synthetic_people, write_gedcom, run
+from genweb.relationships import load_gedcom
+from genweb.timing import Timings
+import genweb.benchmark
+
+
+def test_synthetic_people() -> None:
+    people, families = synthetic_people(100, seed=5)
+    assert len(people) >= 100, len(people)
+    assert families
+    assert synthetic_people(100, seed=5)[0] == people
+
+    with TemporaryDirectory() as working_dir:
+        write_gedcom(join(working_dir, "family.ged"), people, families)
+        individuals = load_gedcom(join(working_dir, "family.ged"))
+
+    assert len(individuals) == len(people)
+    child = individuals[f"@{families[0]['chil'][0]['id']}@"]
+    assert child.parents == {
+        f"@{families[0]['husb']['id']}@",
+        f"@{families[0]['wife']['id']}@",
+    }, child
+
+
+def test_run() -> None:
+    generate = genweb.benchmark.generate
+    ballast = []
+
+    def wasteful_generate(*args, **kwargs) -> dict:
+        ballast.append(b"x" * (256 * 1024 * 1024))  # generating uses a lot of memory
+        return generate(*args, **kwargs)
+
+    genweb.benchmark.generate = wasteful_generate
+
+    try:
+        with TemporaryDirectory() as working_dir:
+            results = run(working_dir, 30, runs=2, pictures=2, picture_bytes=16)
+            assert isfile(join(working_dir, "build report.json"))
+
+    finally:
+        genweb.benchmark.generate = generate
+
+    if Timings.peak_memory_kib() is not None:  # the builds do not count the ballast
+        assert all(
+            r["peak_kib"] < Timings.peak_memory_kib() - len(ballast[0]) // 2048
+            for r in results["runs"]
+        ), results
+
+    assert len(results["runs"]) == 2, results
+    first, second = results["runs"]
+    assert first["counts"]["pages written"] > 0, first
+    assert "pages written" not in second["counts"], second
+    assert second["counts"]["pages current"] > 0, second
+    assert "person pages" in first["phases"], first
+
+
+if __name__ == "__main__":
+    test_synthetic_people()
+    test_run()
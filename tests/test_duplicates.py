@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+
+""" Test finding duplicate artifacts """
+
+
+from os import makedirs
+from os.path import join, dirname
+from tempfile import TemporaryDirectory
+from json import load
+import sys
+
+from devopsdriver.settings import Settings
+
+from genweb.inventory import Artifacts
+from genweb.duplicates import report
+import genweb.duplicates
+
+
+def create_file(path: str, contents: bytes):
+    makedirs(dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(contents)
+
+
+def test_report() -> None:
+    large = Artifacts.PARTIAL_HASH_BYTES * 3
+    picture = bytes(range(256)) * (large // 256)
+    middle = picture[: large // 2] + b"x" + picture[large // 2 + 1 :]
+    start = b"x" + picture[1:]
+
+    with TemporaryDirectory() as working_dir, TemporaryDirectory() as cache_dir:
+        create_file(join(working_dir, "a/picture.jpg"), picture)
+        create_file(join(working_dir, "b/picture copy.jpg"), picture)
+        create_file(join(working_dir, "b/rescan.jpg"), picture)
+        create_file(join(working_dir, "b/middle.jpg"), middle)  # same start and end
+        create_file(join(working_dir, "b/start.jpg"), start)
+        create_file(join(working_dir, "a/notes.txt"), b"notes")
+        create_file(join(working_dir, "b/notes.txt"), b"notes")
+        create_file(join(working_dir, "b/other.txt"), b"other file")
+        create_file(join(working_dir, "a/empty.txt"), b"")
+        create_file(join(working_dir, "b/empty.txt"), b"")
+        artifacts = Artifacts(working_dir, cache_dir=cache_dir)
+        hashed = []
+        results = report(artifacts, lambda d, t: hashed.append(d))
+
+    assert len(hashed) == 6, hashed  # start.jpg is ruled out by its partial hash
+    assert results["duplicate_files"] == 3, results
+    assert results["duplicate_bytes"] == 2 * large + 5, results
+    assert [g["paths"] for g in results["groups"]] == [
+        ["a/picture.jpg", "b/picture copy.jpg", "b/rescan.jpg"],
+        ["a/notes.txt", "b/notes.txt"],
+    ], results
+    assert results["groups"][0]["size"] == large
+
+
+def test_main() -> None:
+    with TemporaryDirectory() as working_dir, TemporaryDirectory() as binaries_dir:
+        create_file(join(binaries_dir, "a/notes.txt"), b"notes")
+        create_file(join(binaries_dir, "b/notes.txt"), b"notes")
+        create_file(join(binaries_dir, "c/notes.txt"), b"notes")
+
+        with open(join(working_dir, "genweb.yml"), "w", encoding="utf-8") as file:
+            file.write(f"binaries_dir: {binaries_dir}\nartifact_ignore: ['c/']\n")
+
+        output_path = join(working_dir, "duplicates.json")
+        preferences, argv = Settings.PREF_DIR, sys.argv
+        Settings.PREF_DIR = {k: working_dir for k in preferences}
+        sys.argv = ["duplicates", "--quiet", "--output", output_path]
+
+        try:  # binaries_dir and artifact_ignore from genweb.yml
+            genweb.duplicates.main()
+
+        finally:
+            Settings.PREF_DIR, sys.argv = preferences, argv
+
+        with open(output_path, "r", encoding="utf-8") as output_file:
+            results = load(output_file)
+
+    assert results["duplicate_files"] == 1, results  # c/ is ignored
+    assert results["groups"][0]["paths"] == ["a/notes.txt", "b/notes.txt"], results
+
+
+if __name__ == "__main__":
+    test_report()
+    test_main()
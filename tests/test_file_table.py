@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+
+""" Test FileTable """
+
+
+from time import perf_counter
+
+from genweb.file_table import FileTable, directory_key
+
+
+HASH_1 = "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855"
+
+
+def test_insert_remove() -> None:
+    table = FileTable()
+    table.insert("a/b/one.txt", 10, 1.5)
+    table.insert("a/two.txt", 20, 2.5, accounted=True)
+    table.insert("three.txt", 10, 3.5)
+    assert len(table) == 3
+    assert "a/b/one.txt" in table
+    assert "b/one.txt" not in table
+    assert table["a/two.txt"].size == 20
+    assert table["a/two.txt"].accounted
+    assert not table["three.txt"].accounted
+    assert table.get("missing.txt") is None
+    assert set(table) == {"a/b/one.txt", "a/two.txt", "three.txt"}
+    assert dict(table.items())["a/b/one.txt"].modified == 1.5
+    row = table.row("a/two.txt")
+    table.remove("a/two.txt")
+    assert "a/two.txt" not in table
+    assert len(table) == 2
+    table.insert("c/four.txt", 40, 4.5)
+    assert table.row("c/four.txt") == row  # free rows are reused
+    assert not table["c/four.txt"].accounted
+    assert set(table) == {"a/b/one.txt", "c/four.txt", "three.txt"}
+
+    try:
+        _ = table["a/two.txt"]
+        raise AssertionError("removed file found")
+
+    except KeyError:
+        pass
+
+
+def test_names() -> None:
+    table = FileTable()
+
+    for index in range(100):  # enough to grow the name index
+        table.insert(f"{index}/picture.jpg", index, 0.0)
+        table.insert(f"{index}/other{index}.jpg", index, 0.0)
+
+    assert len(table.named("picture.jpg")) == 100
+    assert table.named("other7.jpg") == ["7/other7.jpg"]
+
+    for index in range(0, 100, 2):
+        table.remove(f"{index}/picture.jpg")
+
+    assert sorted(table.named("picture.jpg")) == sorted(
+        f"{i}/picture.jpg" for i in range(1, 100, 2)
+    )
+    assert table.named("missing.jpg") == []
+
+
+def test_directories() -> None:
+    table = FileTable()
+    table.insert("a/b/one.txt", 1, 0.0)
+    table.insert("a/b/two.txt", 2, 0.0)
+    table.insert("a/three.txt", 3, 0.0)
+    table.insert("c/four.txt", 4, 0.0)
+    assert directory_key(".") == ""
+    assert directory_key("a/b/") == "a/b"
+    assert table.has_directory("a/")
+    assert table.has_directory("a/b")
+    assert not table.has_directory("d")
+    assert set(table.files_in("a/b")) == {"one.txt", "two.txt"}
+    assert set(table.files_in("")) == set()
+    assert set(table.files_under("a")) == {"a/b/one.txt", "a/b/two.txt", "a/three.txt"}
+    assert len(table.files_under(".")) == 4
+    table.remove("a/b/one.txt")
+    table.remove("a/b/two.txt")
+    assert not table.has_directory("a/b")
+    assert table.has_directory("a")
+    assert table.files_under("a/b") == []
+    assert table.files_in("a/b") == {}
+
+
+def test_sizes() -> None:
+    table = FileTable()
+    table.insert("one.txt", 0x0100, 0.0)
+    table.insert("two.txt", 0x01, 0.0)
+    table.insert("three.txt", 0x0100, 0.0)
+    table.insert("four.txt", 0x01, 0.0)
+    table.insert("five.txt", 5, 0.0)
+    assert sorted(table.of_size(0x01)) == ["four.txt", "two.txt"]
+    assert sorted(table.of_size(0x0100)) == ["one.txt", "three.txt"]
+    assert table.of_size(7) == []
+    assert sorted(sorted(g) for g in table.same_size()) == [
+        ["four.txt", "two.txt"],
+        ["one.txt", "three.txt"],
+    ]
+    assert table.same_size(minimum=0x0100) == [["one.txt", "three.txt"]]
+    table.remove("one.txt")
+    table.remove("four.txt")
+    assert table.of_size(0x0100) == ["three.txt"]
+    assert not table.same_size()
+    table["five.txt"].size = 0x0100
+    assert table.of_size(5) == []
+    assert sorted(table.of_size(0x0100)) == ["five.txt", "three.txt"]
+
+    for index in range(100):  # enough to grow the size index
+        table.insert(f"{index}.txt", index % 10, 0.0)
+
+    assert len(table.of_size(7)) == 10
+
+
+def test_remove_order() -> None:
+    table = FileTable()
+    names = [f"dir/{i}.txt" for i in range(1000)]
+
+    for name in names:
+        table.insert(name, 1, 0.0)
+
+    # first, last and middle of the directory's chain of rows
+    for name in names[0::3] + names[2::3] + names[1::3][::-1]:
+        table.remove(name)
+        assert name not in table, name
+
+    assert not table.has_directory("dir")
+    assert table.files_in("dir") == {}
+    table.insert("dir/again.txt", 1, 0.0)
+    table.insert("dir/more.txt", 1, 0.0)
+    assert set(table.files_in("dir")) == {"again.txt", "more.txt"}
+    assert sorted(table.of_size(1)) == ["dir/again.txt", "dir/more.txt"]
+
+
+def test_hash() -> None:
+    table = FileTable()
+    table.insert("one.txt", 1, 0.0)
+    entry = table["one.txt"]
+    assert entry.hash is None
+    entry.hash = HASH_1
+    assert table["one.txt"].hash == HASH_1
+    entry.hash = None
+    assert table["one.txt"].hash is None
+    entry.hash = HASH_1
+    table.remove("one.txt")
+    table.insert("two.txt", 2, 0.0)
+    assert table["two.txt"].hash is None  # not inherited from the free row
+
+
+def test_duplicates() -> None:
+    table = FileTable()
+    start = perf_counter()
+
+    for index in range(20000):  # quadratic if rows with one value crowd the index
+        table.insert(f"{index}/index.html", 1000, 0.0)
+
+    for index in range(0, 20000, 2):
+        table.remove(f"{index}/index.html")
+
+    assert perf_counter() - start < 5.0
+    assert len(table.named("index.html")) == 10000
+    assert len(table.of_size(1000)) == 10000
+    assert "3/index.html" in table
+    assert "2/index.html" not in table
+    assert table.named("index.html")[:2] == ["1/index.html", "3/index.html"]
+
+
+def test_not_indexed() -> None:
+    table = FileTable()
+    table.insert("one.txt", 1, 0.0)
+    table.insert("two.txt", 1, 0.0)
+    entry = table["one.txt"]
+    table.remove("one.txt")
+    entry.size = 5  # kept after the file was removed
+    assert not table.by_size.remove(entry.row)
+    assert table.of_size(5) == []
+    assert table.of_size(1) == ["two.txt"]
+
+
+if __name__ == "__main__":
+    test_insert_remove()
+    test_names()
+    test_directories()
+    test_sizes()
+    test_remove_order()
+    test_hash()
+    test_duplicates()
+    test_not_indexed()
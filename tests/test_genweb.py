@@ -11,12 +11,14 @@ from shutil import copytree, copy
 
 from genweb.genweb import link_people_to_metadata, generate_people_pages
 from genweb.genweb import copy_static_files, copy_metadata_files
+from genweb.genweb import generate_index_pages, index_groups, letter_page
 from genweb.inventory import Artifacts
+from genweb.manifest import Manifest
 import genweb.genweb
 
 
-def test_generate_people_pages() -> None:
-    people = {
+def create_people() -> dict[str, SimpleNamespace]:
+    return {
         "1": SimpleNamespace(
             id="1",
             parents=["2", "3", "4", "5"],
@@ -45,11 +47,123 @@ def test_generate_people_pages() -> None:
         "4": SimpleNamespace(parents=[], gender="F", surname="Jones", metadata=[]),
         "5": SimpleNamespace(parents=[], gender="F", surname="Brown", metadata=[]),
     }
+
+
+def test_generate_people_pages() -> None:
+    people = create_people()
     metadata = {"1": {"type": "dummy"}, "2": {"type": "dummy"}}
     with TemporaryDirectory() as working_dir:
         generate_people_pages(working_dir, people, metadata)
 
 
+def test_generate_people_pages_incremental() -> None:
+    people = create_people()
+    metadata = {"1": {"type": "dummy"}, "2": {"type": "dummy"}}
+
+    with TemporaryDirectory() as working_dir:
+        manifest_path = join(working_dir, "manifest.json")
+        manifest = Manifest(working_dir, manifest_path)
+        results = generate_people_pages(working_dir, people, metadata, manifest)
+        assert results == {"written": 2}, results
+        results = generate_people_pages(working_dir, people, metadata, manifest)
+        assert results == {"current": 2}, results
+        manifest.save()
+
+        manifest = Manifest(working_dir, manifest_path)
+        metadata["1"] = {"type": "dummy", "caption": "changed"}
+        results = generate_people_pages(working_dir, people, metadata, manifest)
+        assert results == {"current": 1, "identical": 1}, results  # caption not shown
+        people["2"].given = "Johnny"  # "1" shows "2" in the navigation area
+        results = generate_people_pages(working_dir, people, metadata, manifest)
+        assert results == {"written": 2}, results
+
+
+def test_generate_people_pages_parallel() -> None:
+    genweb.genweb.PRINT = lambda _: None
+    people = create_people()
+    metadata = {"1": {"type": "dummy"}, "2": {"type": "dummy"}}
+
+    with TemporaryDirectory() as working_dir:
+        genweb.genweb.TIMINGS.reset()
+        results = generate_people_pages(working_dir, people, metadata, workers=2)
+        assert results == {"written": 2}, results
+        slowest = genweb.genweb.TIMINGS.report()["slowest_pages"]
+        assert {p["page"] for p in slowest} == {"1", "2"}, slowest
+        assert isfile(join(working_dir, "1", "index.html"))
+        assert isfile(join(working_dir, "2", "index.html"))
+
+        del metadata["2"]  # rendering "2" fails, "1" still renders
+        results = generate_people_pages(working_dir, people, metadata, workers=2)
+        assert results == {"identical": 1, "failed": 1}, results
+
+    def no_fork(_: str) -> None:
+        raise AssertionError("forked where it is not the default")
+
+    system, get_context = genweb.genweb.system, genweb.genweb.get_context
+    genweb.genweb.system, genweb.genweb.get_context = lambda: "Darwin", no_fork
+
+    try:
+        with TemporaryDirectory() as working_dir:
+            results = generate_people_pages(working_dir, people, metadata, workers=2)
+            assert results == {"written": 1, "failed": 1}, results
+
+    finally:
+        genweb.genweb.system, genweb.genweb.get_context = system, get_context
+
+
+def test_index_groups() -> None:
+    people = {k: v for k, v in create_people().items() if k in {"1", "2"}}
+    people["5"] = SimpleNamespace(id="5", surname="Brown", given="Zed", metadata=[])
+    people["6"] = SimpleNamespace(id="6", surname="Smith", given="Adam", metadata=[])
+    people["7"] = SimpleNamespace(id="7", surname="", given="Nobody", metadata=[])
+    groups = index_groups(people)
+    assert list(groups) == ["B", "S"], groups
+    assert list(groups["S"]) == ["Smith"], groups
+    assert [p.given for p in groups["S"]["Smith"]] == ["Adam", "John", "Sally"]
+    assert letter_page("S") == "names/S.html"
+    assert letter_page("'") == "names/u0027.html"
+
+
+def test_generate_index_pages() -> None:
+    people = {k: v for k, v in create_people().items() if k in {"1", "2"}}
+    people["6"] = SimpleNamespace(
+        id="6", surname="Jones", given="Adam", birthdate=None, metadata=[]
+    )
+
+    with TemporaryDirectory() as working_dir:
+        manifest = Manifest(working_dir, join(working_dir, "manifest.json"))
+        results = generate_index_pages(working_dir, people, manifest)
+        assert results == {"written": 3}, results
+        assert isfile(join(working_dir, "index.html"))
+        assert isfile(join(working_dir, "names", "S.html"))
+        assert isfile(join(working_dir, "names", "J.html"))
+
+        with open(join(working_dir, "index.html"), "r", encoding="utf-8") as file:
+            index = file.read()
+
+        assert "names/S.html" in index, index
+
+        with open(join(working_dir, "names", "S.html"), "r", encoding="utf-8") as file:
+            letter = file.read()
+
+        assert "../1/index.html" in letter, letter
+        assert "Jones" not in letter, letter
+
+        results = generate_index_pages(working_dir, people, manifest)
+        assert results == {"current": 3}, results
+        people["1"].given = "Sally Ann"
+        results = generate_index_pages(working_dir, people, manifest)
+        assert results == {"current": 2, "written": 1}, results
+        results = generate_index_pages(working_dir, people)
+        assert results == {"identical": 3}, results
+
+        del people["6"]
+        results = generate_index_pages(working_dir, people, manifest)
+        assert results == {"current": 1, "written": 1, "removed": 1}, results
+        assert not isfile(join(working_dir, "names", "J.html"))
+        assert "names/J.html" not in manifest.fingerprints, manifest.fingerprints
+
+
 def test_link_people_to_metadata() -> None:
     genweb.genweb.PRINT = lambda _: None
     people = {"p1": SimpleNamespace(metadata=[])}
@@ -65,9 +179,12 @@ def test_copy_static_files() -> None:
             "dir/styles.css": "data/styles.css",
             "images/unknown.jpg": "data/silhouette.jpg",
         }
-        copy_static_files(files, working_dir)
+        results = copy_static_files(files, working_dir)
+        assert results == {"written": 2}, results
         assert isfile(join(working_dir, "dir", "styles.css"))
         assert isfile(join(working_dir, "images", "unknown.jpg"))
+        results = copy_static_files(files, working_dir)
+        assert results == {"identical": 2}, results
 
 
 class MockMetadata(dict):
@@ -128,5 +245,9 @@ def test_copy_metadata_files() -> None:
 if __name__ == "__main__":
     test_link_people_to_metadata()
     test_generate_people_pages()
+    test_generate_people_pages_incremental()
+    test_generate_people_pages_parallel()
+    test_index_groups()
+    test_generate_index_pages()
     test_copy_static_files()
     test_copy_metadata_files()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+
+""" Test HashCache """
+
+
+from os.path import join, isfile
+from tempfile import TemporaryDirectory
+from json import dump
+from sqlite3 import connect
+
+from genweb.hash_cache import HashCache
+
+
+HASH_1 = "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855"
+HASH_2 = "d4735e3a265e16eee03f59718b9b5d03019c07d8b6c51f90da3a666eec13ab35"
+BLAKE_1 = (
+    "786a02f742015903c6c6fd852552d272912f4740e15847618a86e217f71f5419"
+    + "d25e1031afee585313896444934eb04b903a685b1448b755d56f701afe9be2ce"
+)
+
+
+def test_lookup() -> None:
+    with TemporaryDirectory() as working_dir:
+        path = join(working_dir, "cache", "hashes.sqlite3")
+        cache = HashCache(path)
+        assert cache.get("file.txt") is None
+        assert not isfile(path)  # nothing to look up in
+        cache.record("file.txt", 1, 2.5, HASH_1)
+        assert cache.get("file.txt") == {"size": 1, "modified": 2.5, "hash": HASH_1}
+        assert HashCache(path).get("file.txt") is None  # not written yet
+        cache.flush()
+        assert HashCache(path).get("file.txt")["hash"] == HASH_1
+        cache.record("file.txt", 2, 3.5, HASH_2)
+        cache.close()
+        assert HashCache(path).get("file.txt") == {
+            "size": 2,
+            "modified": 3.5,
+            "hash": HASH_2,
+        }
+        cache.discard("file.txt")
+        assert cache.get("file.txt") is None
+        cache.close()
+        assert HashCache(path).get("file.txt") is None
+
+
+def test_batches() -> None:
+    with TemporaryDirectory() as working_dir:
+        path = join(working_dir, "hashes.sqlite3")
+        cache = HashCache(path)
+
+        for index in range(HashCache.BATCH_ENTRIES + 1):
+            cache.record(f"file{index}.txt", index, 1.0, HASH_1)
+
+        assert len(cache.pending) == 1
+        reloaded = HashCache(path)
+        assert reloaded.get(f"file{HashCache.BATCH_ENTRIES - 1}.txt") is not None
+        assert reloaded.get(f"file{HashCache.BATCH_ENTRIES}.txt") is None
+
+
+def test_compact() -> None:
+    with TemporaryDirectory() as working_dir:
+        path = join(working_dir, "hashes.sqlite3")
+        cache = HashCache(path)
+        cache.record("file1.txt", 1, 1.0, HASH_1)
+        cache.record("file2.txt", 2, 2.0, HASH_2)
+        cache.compact({"file2.txt"})
+        assert cache.get("file1.txt") is None
+        assert cache.get("file2.txt")["hash"] == HASH_2
+        cache.compact()
+        assert cache.get("file2.txt")["hash"] == HASH_2
+        cache.close()
+
+
+def test_migrate() -> None:
+    with TemporaryDirectory() as working_dir:
+        legacy_path = join(working_dir, "hashes.json")
+        journal_path = join(working_dir, "hashes.journal")
+
+        with open(legacy_path, "w", encoding="utf-8") as legacy_file:
+            dump(
+                {"file1.txt": {"size": 1, "modified": 1.0, "hash": HASH_1}}, legacy_file
+            )
+
+        with open(journal_path, "w", encoding="utf-8") as journal_file:
+            journal_file.write(
+                f'{{"path": "file2.txt", "size": 2, "modified": 2.0, "hash": "{HASH_2}"}}\n'
+                '{"path": "file3.txt", "si'  # killed mid-write
+            )
+
+        cache = HashCache(join(working_dir, "hashes.sqlite3"), legacy_path)
+        assert cache.get("file1.txt") == {"size": 1, "modified": 1.0, "hash": HASH_1}
+        assert cache.get("file2.txt") == {"size": 2, "modified": 2.0, "hash": HASH_2}
+        assert cache.get("file3.txt") is None
+        assert not isfile(legacy_path)
+        assert not isfile(journal_path)
+        cache.close()
+
+
+def test_algorithms() -> None:
+    with TemporaryDirectory() as working_dir:
+        path = join(working_dir, "hashes.sqlite3")
+        cache = HashCache(path)
+        cache.record("file1.txt", 1, 1.0, HASH_1)
+        cache.record("file2.txt", 2, 2.0, HASH_2)
+        cache.close()
+        cache = HashCache(path, algorithm="blake2b")
+        assert cache.get("file1.txt") is None  # not mistaken for a blake2b hash
+        assert cache.get("file1.txt", "sha256")["hash"] == HASH_1
+        cache.record("file1.txt", 1, 1.0, BLAKE_1)
+        assert cache.get("file1.txt")["hash"] == BLAKE_1
+        assert cache.algorithms() == {"sha256": 2, "blake2b": 1}
+        cache.discard("file1.txt")
+        assert cache.algorithms() == {"sha256": 1}
+        cache.record("file1.txt", 1, 1.0, BLAKE_1)
+        cache.compact()
+        assert cache.algorithms() == {"blake2b": 1}
+        assert cache.get("file2.txt", "sha256") is None
+        cache.close()
+
+
+def test_upgrade() -> None:
+    with TemporaryDirectory() as working_dir:
+        path = join(working_dir, "hashes.sqlite3")
+        database = connect(path)  # before the algorithm was recorded
+        database.execute(
+            "CREATE TABLE hashes (path TEXT PRIMARY KEY, size INTEGER NOT NULL,"
+            + " modified REAL NOT NULL, digest BLOB NOT NULL) WITHOUT ROWID"
+        )
+
+        with database:
+            database.execute(
+                "INSERT INTO hashes VALUES (?, ?, ?, ?)",
+                ("file1.txt", 1, 1.0, bytes.fromhex(HASH_1)),
+            )
+
+        database.close()
+        cache = HashCache(path, algorithm="blake2b")
+        assert cache.get("file1.txt") is None
+        assert cache.get("file1.txt", "sha256") == {
+            "size": 1,
+            "modified": 1.0,
+            "hash": HASH_1,
+        }
+        cache.close()
+        assert HashCache(path).get("file1.txt")["hash"] == HASH_1
+
+
+def test_move() -> None:
+    with TemporaryDirectory() as working_dir:
+        path = join(working_dir, "hashes.sqlite3")
+        cache = HashCache(path)
+        cache.record("old1.txt", 1, 1.0, HASH_1, 5, 10)
+        cache.record("old2.txt", 2, 2.0, HASH_2, 5, 20)
+        cache.record("unknown.txt", 2, 2.0, HASH_2)  # no inode
+        cache.flush()
+        cache.record("old3.txt", 3, 3.0, HASH_2, 5, 30)  # not written yet
+        cache.discard("old1.txt")
+        cache.discard("new1.txt")
+        assert cache.identities(["old1.txt", "old3.txt", "unknown.txt"]) == {
+            (5, 10, 1, 1.0): "old1.txt",
+            (5, 30, 3, 3.0): "old3.txt",
+        }
+        cache.move({"old1.txt": "new1.txt", "old3.txt": "new3.txt"})
+        cache.close()
+        cache = HashCache(path)
+        assert cache.get("old1.txt") is None
+        assert cache.get("new1.txt") == {"size": 1, "modified": 1.0, "hash": HASH_1}
+        assert cache.get("old3.txt") is None
+        assert cache.get("new3.txt")["hash"] == HASH_2
+        assert cache.get("old2.txt")["hash"] == HASH_2
+        assert cache.identities(["new1.txt"]) == {(5, 10, 1, 1.0): "new1.txt"}
+        cache.close()
+
+
+if __name__ == "__main__":
+    test_lookup()
+    test_batches()
+    test_compact()
+    test_migrate()
+    test_algorithms()
+    test_upgrade()
+    test_move()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+
+""" Test IgnoreRules """
+
+
+from genweb.ignore import (
+    IgnoreRules,
+    DEFAULT_PATTERNS,
+    case_insensitive,
+    escape_pattern,
+)
+
+
+def test_patterns() -> None:
+    rules = IgnoreRules(
+        [
+            "# comment",
+            "",
+            "*.bak",
+            "!keep.bak",
+            "logs/",
+            "/top.txt",
+            "a/**/b",
+            "[a-c]x.txt",
+            "[!a-c]y.txt",
+            "photos/*.raw",
+        ]
+    )
+    assert rules.ignored("file.bak")
+    assert rules.ignored("dir/sub/file.bak")
+    assert not rules.ignored("keep.bak")
+    assert not rules.ignored("dir/keep.bak")
+    assert rules.ignored("logs", is_dir=True)
+    assert rules.ignored("dir/logs", is_dir=True)
+    assert not rules.ignored("logs")  # only directories
+    assert rules.ignored("top.txt")
+    assert not rules.ignored("dir/top.txt")  # anchored
+    assert rules.ignored("a/b")
+    assert rules.ignored("a/x/y/b")
+    assert not rules.ignored("x/a/b")
+    assert rules.ignored("bx.txt")
+    assert not rules.ignored("dx.txt")
+    assert rules.ignored("dy.txt")
+    assert not rules.ignored("by.txt")
+    assert rules.ignored("photos/1.raw")
+    assert not rules.ignored("photos/sub/1.raw")  # * does not match /
+    assert not rules.ignored("comment")
+    assert not IgnoreRules([]).ignored("anything")
+
+
+def test_excluded() -> None:
+    rules = IgnoreRules(["logs/", "!logs/keep.txt"])
+    assert rules.excluded("logs/keep.txt")  # can't include under an excluded dir
+    assert rules.excluded("dir/logs/sub", is_dir=True)
+    assert not rules.excluded("dir/sub/file.txt")
+
+
+def test_defaults() -> None:
+    rules = IgnoreRules(DEFAULT_PATTERNS)
+    assert rules.ignored(".git", is_dir=True)
+    assert rules.ignored("person/.svn", is_dir=True)
+    assert rules.ignored("person/Thumbs.db")
+    assert rules.ignored("person/ToDo", is_dir=True)  # any case, like cleanup
+    assert rules.ignored("person/notes.txt~")
+    assert rules.ignored("person/#notes.txt#")
+    assert not rules.ignored("person/picture.jpg")
+    assert case_insensitive(".DS_Store") == ".[dD][sS]_[sS][tT][oO][rR][eE]"
+    exact = IgnoreRules(["/" + escape_pattern("a [1]*?.txt")])
+    assert exact.ignored("a [1]*?.txt")
+    assert not exact.ignored("a 1xy.txt")
+
+
+if __name__ == "__main__":
+    test_patterns()
+    test_excluded()
+    test_defaults()
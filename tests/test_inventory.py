@@ -4,8 +4,8 @@
 """ Test Artifacts """
 
 
-from os import makedirs, utime
-from os.path import dirname, relpath, basename, join
+from os import makedirs, utime, remove, rename
+from os.path import dirname, relpath, basename, join, isfile
 from tempfile import TemporaryDirectory
 from time import time
 
@@ -13,55 +13,57 @@ from genweb.inventory import Artifacts
 
 
 def test_suffixed() -> None:
-    artifacts = Artifacts(dirname(__file__))
-    assert "data/fake.jpg" in artifacts.suffixed("ta/fake.jpg")
+    with TemporaryDirectory() as working_dir:
+        artifacts = Artifacts(dirname(__file__), cache_dir=working_dir)
+        assert "data/fake.jpg" in artifacts.suffixed("ta/fake.jpg")
 
 
 def test_basic() -> None:
-    artifacts = Artifacts(dirname(__file__))
-    assert relpath(__file__, artifacts.directory) in artifacts.lost(), [
-        relpath(__file__, artifacts.directory),
-        artifacts.lost(),
-    ]
-    assert "data/bad.xml" in artifacts.lost()
-    assert "test_people.py" in artifacts.lost()
-    assert "data/test.xml" in artifacts.lost()
-    assert artifacts.has_file(relpath(__file__, artifacts.directory))
-    assert artifacts.has_file("data/bad.xml")
-    assert artifacts.has_file("data/test.xml")
-    assert artifacts.has_file("test_people.py")
-    assert len(artifacts.paths(basename(__file__))) == 1
-    assert len(artifacts.paths("bad.xml")) == 1
-    assert len(artifacts.paths("test.xml")) == 1
-    assert len(artifacts.paths("test_people.py")) == 1
-    assert len(artifacts.paths("bogus")) == 0
-    assert artifacts.has_dir("data")
-    assert not artifacts.has_dir("bogus")
-    assert "data/bad.xml" in artifacts.files_under("data")
-    assert "data/test.xml" in artifacts.files_under("data")
-    artifacts.add(relpath(__file__, artifacts.directory))
-    artifacts.add("data/bad.xml")
-    artifacts.add("data/bad.xml")
-    assert relpath(__file__, artifacts.directory) not in artifacts.lost(), [
-        relpath(__file__, artifacts.directory),
-        artifacts.lost(),
-    ]
-    assert "data/bad.xml" not in artifacts.lost()
-    assert "test_people.py" in artifacts.lost()
-    assert "data/test.xml" in artifacts.lost()
-    assert len(artifacts.paths(basename(__file__))) == 1
-    assert len(artifacts.paths("bad.xml")) == 1
-    assert len(artifacts.paths("test.xml")) == 1
-    assert len(artifacts.paths("test_people.py")) == 1
-    assert len(artifacts.paths("bogus")) == 0
-    assert artifacts.has_dir("data")
-    assert not artifacts.has_dir("bogus")
-    assert artifacts.has_file(relpath(__file__, artifacts.directory))
-    assert artifacts.has_file("data/bad.xml")
-    assert artifacts.has_file("data/test.xml")
-    assert artifacts.has_file("test_people.py")
-    assert "data/bad.xml" in artifacts.files_under("data")
-    assert "data/test.xml" in artifacts.files_under("data")
+    with TemporaryDirectory() as working_dir:
+        artifacts = Artifacts(dirname(__file__), cache_dir=working_dir)
+        assert relpath(__file__, artifacts.directory) in artifacts.lost(), [
+            relpath(__file__, artifacts.directory),
+            artifacts.lost(),
+        ]
+        assert "data/bad.xml" in artifacts.lost()
+        assert "test_people.py" in artifacts.lost()
+        assert "data/test.xml" in artifacts.lost()
+        assert artifacts.has_file(relpath(__file__, artifacts.directory))
+        assert artifacts.has_file("data/bad.xml")
+        assert artifacts.has_file("data/test.xml")
+        assert artifacts.has_file("test_people.py")
+        assert len(artifacts.paths(basename(__file__))) == 1
+        assert len(artifacts.paths("bad.xml")) == 1
+        assert len(artifacts.paths("test.xml")) == 1
+        assert len(artifacts.paths("test_people.py")) == 1
+        assert len(artifacts.paths("bogus")) == 0
+        assert artifacts.has_dir("data")
+        assert not artifacts.has_dir("bogus")
+        assert "data/bad.xml" in artifacts.files_under("data")
+        assert "data/test.xml" in artifacts.files_under("data")
+        artifacts.add(relpath(__file__, artifacts.directory))
+        artifacts.add("data/bad.xml")
+        artifacts.add("data/bad.xml")
+        assert relpath(__file__, artifacts.directory) not in artifacts.lost(), [
+            relpath(__file__, artifacts.directory),
+            artifacts.lost(),
+        ]
+        assert "data/bad.xml" not in artifacts.lost()
+        assert "test_people.py" in artifacts.lost()
+        assert "data/test.xml" in artifacts.lost()
+        assert len(artifacts.paths(basename(__file__))) == 1
+        assert len(artifacts.paths("bad.xml")) == 1
+        assert len(artifacts.paths("test.xml")) == 1
+        assert len(artifacts.paths("test_people.py")) == 1
+        assert len(artifacts.paths("bogus")) == 0
+        assert artifacts.has_dir("data")
+        assert not artifacts.has_dir("bogus")
+        assert artifacts.has_file(relpath(__file__, artifacts.directory))
+        assert artifacts.has_file("data/bad.xml")
+        assert artifacts.has_file("data/test.xml")
+        assert artifacts.has_file("test_people.py")
+        assert "data/bad.xml" in artifacts.files_under("data")
+        assert "data/test.xml" in artifacts.files_under("data")
 
 
 def create_file(path: str, contents: str):
@@ -116,10 +118,234 @@ def test_hash() -> None:
         assert artifacts.hash("file1.txt") == hash_empty, artifacts.hash("file1.txt")
 
 
+def test_refresh() -> None:
+    with TemporaryDirectory() as working_dir:
+        create_file(join(working_dir, "file1.txt"), "file1")
+        create_file(join(working_dir, "dir/file2.txt"), "file2")
+        create_file(join(working_dir, "dir/sub/file3.txt"), "file3")
+        minute_ago = time() - 60
+
+        for directory in ["dir/sub", "dir", ""]:
+            utime(join(working_dir, directory), (minute_ago, minute_ago))
+
+        artifacts = Artifacts(working_dir)
+        assert set(artifacts.inventory) == {
+            "file1.txt",
+            "dir/file2.txt",
+            "dir/sub/file3.txt",
+        }, artifacts.inventory
+        assert artifacts.inventory["dir/file2.txt"].size == 5
+        assert isfile(join(working_dir, "metadata", "artifact directory cache.json"))
+
+        # listing of unmodified directories is remembered across instances
+        create_file(join(working_dir, "dir/file2.txt"), "file2 changed")
+        utime(join(working_dir, "dir"), (minute_ago, minute_ago))
+        artifacts = Artifacts(working_dir)
+        assert artifacts.inventory["dir/file2.txt"].size == 5
+        assert artifacts.hash("dir/file2.txt") == Artifacts._hash_file(
+            join(working_dir, "dir/file2.txt")
+        )
+        assert artifacts.inventory["dir/file2.txt"].size == 13
+
+        # new and removed files are found in modified directories
+        create_file(join(working_dir, "dir/sub/file4.txt"), "file4")
+        remove(join(working_dir, "file1.txt"))
+        artifacts.refresh()
+        assert "dir/sub/file4.txt" in artifacts.inventory
+        assert "file1.txt" not in artifacts.inventory
+        assert not artifacts.has_file("file1.txt")
+
+
+def test_paths() -> None:
+    with TemporaryDirectory() as working_dir:
+        create_file(join(working_dir, "a/picture.jpg"), "a")
+        create_file(join(working_dir, "b/picture.jpg"), "b")
+        artifacts = Artifacts(working_dir)
+        assert set(artifacts.paths("picture.jpg")) == {"a/picture.jpg", "b/picture.jpg"}
+        create_file(join(working_dir, "c/picture.jpg"), "c")
+        artifacts.add("c/picture.jpg")
+        assert len(artifacts.paths("picture.jpg")) == 3
+        remove(join(working_dir, "a/picture.jpg"))
+        remove(join(working_dir, "b/picture.jpg"))
+        remove(join(working_dir, "c/picture.jpg"))
+        artifacts.refresh()
+        assert not artifacts.paths("picture.jpg")
+        assert not artifacts.inventory.by_name.rows("picture.jpg")
+
+
+def test_folders() -> None:
+    with TemporaryDirectory() as working_dir:
+        create_file(join(working_dir, "site/index.html"), "index")
+        create_file(join(working_dir, "site/pages/a/page.html"), "a")
+        create_file(join(working_dir, "site/pages/b/page.html"), "b")
+        create_file(join(working_dir, "site2/index.html"), "index")
+        artifacts = Artifacts(working_dir)
+        assert artifacts.has_dir("site")
+        assert artifacts.has_dir("site/")
+        assert artifacts.has_dir("site/pages/a")
+        assert not artifacts.has_dir("sit")
+        assert not artifacts.has_dir("site/index.html/")
+        assert set(artifacts.files_under("site/")) == {
+            "site/index.html",
+            "site/pages/a/page.html",
+            "site/pages/b/page.html",
+        }, artifacts.files_under("site/")
+        assert artifacts.files_under("site/pages/b") == ["site/pages/b/page.html"]
+        assert not artifacts.files_under("bogus")
+        remove(join(working_dir, "site/pages/a/page.html"))
+        artifacts.refresh()
+        assert not artifacts.has_dir("site/pages/a")
+        assert artifacts.has_dir("site/pages")
+        assert len(artifacts.files_under("site")) == 2
+        remove(join(working_dir, "site/pages/b/page.html"))
+        artifacts.refresh()
+        assert not artifacts.has_dir("site/pages")
+        assert artifacts.files_under("site") == ["site/index.html"]
+
+
+def test_hash_many() -> None:
+    with TemporaryDirectory() as working_dir, TemporaryDirectory() as cache_dir:
+        for index in range(20):
+            create_file(join(working_dir, f"dir{index % 3}/file{index}.txt"), "2")
+
+        create_file(join(working_dir, "empty.txt"), "")
+        artifacts = Artifacts(working_dir, cache_dir=cache_dir)
+        hash_empty = "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855"
+        hash_2 = "d4735e3a265e16eee03f59718b9b5d03019c07d8b6c51f90da3a666eec13ab35"
+        reported = []
+        threshold = Artifacts.MMAP_THRESHOLD_BYTES
+        Artifacts.MMAP_THRESHOLD_BYTES = 1  # hash the non-empty files with mmap
+
+        try:
+            assert artifacts.warm_cache(lambda d, t: reported.append((d, t))) == 21
+
+        finally:
+            Artifacts.MMAP_THRESHOLD_BYTES = threshold
+
+        assert reported[-1] == (21, 21), reported
+        assert len(reported) == 21, reported
+        assert artifacts.warm_cache() == 0
+        hashes = artifacts.hash_many(["empty.txt", "dir1/file1.txt", "empty.txt"])
+        assert hashes == {"empty.txt": hash_empty, "dir1/file1.txt": hash_2}, hashes
+        assert Artifacts(working_dir, cache_dir=cache_dir).warm_cache() == 0
+        artifacts.close()
+        assert isfile(join(cache_dir, "artifact hash cache.sqlite3"))
+        assert Artifacts(working_dir, cache_dir=cache_dir).warm_cache() == 0
+
+
+def test_algorithm() -> None:
+    with TemporaryDirectory() as working_dir, TemporaryDirectory() as cache_dir:
+        create_file(join(working_dir, "a.txt"), "2")
+        create_file(join(working_dir, "dir/b.txt"), "2")
+        create_file(join(working_dir, "c.txt"), "")
+        hash_2 = "d4735e3a265e16eee03f59718b9b5d03019c07d8b6c51f90da3a666eec13ab35"
+        blake_2 = Artifacts._hash_file(join(working_dir, "a.txt"), "blake2b")
+        assert len(blake_2) == 128
+        artifacts = Artifacts(working_dir, cache_dir=cache_dir)
+        assert artifacts.warm_cache() == 3
+        artifacts.close()
+        artifacts = Artifacts(working_dir, cache_dir=cache_dir, algorithm="blake2b")
+        assert artifacts.hash_cache.algorithms() == {"sha256": 3}
+        assert artifacts.warm_cache() == 3  # sha256 hashes are not blake2b hashes
+        assert artifacts.hash("a.txt") == blake_2
+        assert artifacts.duplicates() == {blake_2: ["a.txt", "dir/b.txt"]}
+        assert artifacts.lookup_hashes({blake_2: 1}) == {
+            blake_2: ["a.txt", "dir/b.txt"]
+        }
+        assert sorted(artifacts.lookup_hashes({hash_2: 1}, "sha256")[hash_2]) == [
+            "a.txt",
+            "dir/b.txt",
+        ]
+        artifacts.compact_cache()
+        assert artifacts.hash_cache.algorithms() == {"blake2b": 3}
+        artifacts.close()
+        artifacts = Artifacts(working_dir, cache_dir=cache_dir, algorithm="blake2b")
+        assert artifacts.warm_cache() == 0
+        artifacts.close()
+
+
+def test_moved() -> None:
+    with TemporaryDirectory() as working_dir, TemporaryDirectory() as cache_dir:
+        for index in range(6):
+            create_file(join(working_dir, f"old/file{index}.txt"), f"{index}")
+
+        artifacts = Artifacts(working_dir, cache_dir=cache_dir)
+        assert artifacts.warm_cache() == 6
+        artifacts.close()
+        rename(join(working_dir, "old"), join(working_dir, "new"))
+        rename(join(working_dir, "new/file0.txt"), join(working_dir, "file0.txt"))
+        create_file(join(working_dir, "new/file6.txt"), "6")
+        artifacts = Artifacts(working_dir, cache_dir=cache_dir)
+        assert not artifacts.has_dir("old")
+        assert artifacts.warm_cache() == 1  # only the new file
+        makedirs(join(working_dir, "moved"))
+        rename(join(working_dir, "new/file1.txt"), join(working_dir, "moved/file1.txt"))
+        rename(join(working_dir, "file0.txt"), join(working_dir, "moved/zero.txt"))
+        artifacts.refresh()
+        assert set(artifacts.files_under("moved")) == {
+            "moved/file1.txt",
+            "moved/zero.txt",
+        }
+        assert artifacts.warm_cache() == 0
+        rename(join(working_dir, "moved"), join(working_dir, "watched"))
+        artifacts.update("moved")  # as reported by a watcher
+        artifacts.update("watched")
+        assert artifacts.warm_cache() == 0
+        assert artifacts.hash("watched/zero.txt") == Artifacts._hash_file(
+            join(working_dir, "watched/zero.txt")
+        )
+        artifacts.close()
+        assert Artifacts(working_dir, cache_dir=cache_dir).warm_cache() == 0
+
+
+def test_ignore() -> None:
+    with TemporaryDirectory() as working_dir:
+        create_file(join(working_dir, "person/picture.jpg"), "picture")
+        create_file(join(working_dir, "person/Thumbs.db"), "junk")
+        create_file(join(working_dir, ".git/objects/ab"), "object")
+        create_file(join(working_dir, "drafts/notes.txt"), "notes")
+        artifacts = Artifacts(working_dir)
+        artifacts.hash("person/picture.jpg")  # writes the cache in metadata/
+        artifacts.close()
+        artifacts = Artifacts(working_dir)
+        assert set(artifacts.lost()) == {"person/picture.jpg", "drafts/notes.txt"}
+        assert ".git" not in artifacts.directories
+        assert "metadata" not in artifacts.directories
+        artifacts = Artifacts(working_dir, ignore=["drafts/", "!Thumbs.db"])
+        assert set(artifacts.lost()) == {"person/picture.jpg", "person/Thumbs.db"}
+        create_file(join(working_dir, "drafts/more.txt"), "more")
+        artifacts.update("drafts/more.txt")
+        artifacts.update("drafts")
+        assert not artifacts.has_dir("drafts")
+        artifacts.close()
+
+
+def test_sizes() -> None:
+    with TemporaryDirectory() as working_dir:
+        create_file(join(working_dir, "a.txt"), "12")
+        create_file(join(working_dir, "dir/b.txt"), "34")
+        create_file(join(working_dir, "dir/c.txt"), "567")
+        artifacts = Artifacts(working_dir)
+        assert set(artifacts.get_files_of_size(2)) == {"a.txt", "dir/b.txt"}
+        assert artifacts.get_files_of_size(3) == ["dir/c.txt"]
+        assert not artifacts.get_files_of_size(4)
+        create_file(join(working_dir, "dir/d.txt"), "8901")
+        artifacts.add("dir/d.txt")
+        assert artifacts.get_files_of_size(4) == ["dir/d.txt"]
+        create_file(join(working_dir, "a.txt"), "123")
+        artifacts.hash("a.txt")
+        assert artifacts.get_files_of_size(2) == ["dir/b.txt"]
+        assert set(artifacts.get_files_of_size(3)) == {"a.txt", "dir/c.txt"}
+        remove(join(working_dir, "dir/c.txt"))
+        artifacts.refresh()
+        assert artifacts.get_files_of_size(3) == ["a.txt"]
+
+
 def test_get_files_of_size() -> None:
-    artifacts = Artifacts(dirname(__file__))
-    files = artifacts.get_files_of_size(19)
-    assert "data/fake.jpg" in files, files
+    with TemporaryDirectory() as working_dir:
+        artifacts = Artifacts(dirname(__file__), cache_dir=working_dir)
+        files = artifacts.get_files_of_size(19)
+        assert "data/fake.jpg" in files, files
 
 
 def test_lookup_hashes() -> None:
@@ -149,5 +375,13 @@ if __name__ == "__main__":
     test_suffixed()
     test_add()
     test_hash()
+    test_refresh()
+    test_paths()
+    test_folders()
+    test_hash_many()
+    test_algorithm()
+    test_moved()
+    test_ignore()
+    test_sizes()
     test_get_files_of_size()
     test_lookup_hashes()
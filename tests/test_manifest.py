@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+""" Test the generated file manifest """
+
+from os.path import join
+from tempfile import TemporaryDirectory
+
+from genweb.manifest import Manifest, fingerprint, files_fingerprint
+
+
+def test_fingerprint() -> None:
+    assert fingerprint({"a": 1, "b": [1, 2]}) == fingerprint({"b": [1, 2], "a": 1})
+    assert fingerprint({"a": 1}) != fingerprint({"a": 2})
+    assert fingerprint("a", "b") != fingerprint("ab")
+
+
+def test_files_fingerprint() -> None:
+    with TemporaryDirectory() as working_dir:
+        for name, contents in (("a.txt", "a"), ("b.txt", "b")):
+            with open(join(working_dir, name), "w", encoding="utf-8") as file:
+                file.write(contents)
+
+        before = files_fingerprint(working_dir, "a.txt", "b.txt")
+        assert before == files_fingerprint(working_dir, "b.txt", "a.txt")
+
+        with open(join(working_dir, "b.txt"), "w", encoding="utf-8") as file:
+            file.write("B")
+
+        assert before != files_fingerprint(working_dir, "a.txt", "b.txt")
+
+
+def test_manifest() -> None:
+    with TemporaryDirectory() as working_dir:
+        manifest_path = join(working_dir, "manifest.json")
+        manifest = Manifest(working_dir, manifest_path)
+        assert not manifest.unchanged("index.html", "1234")
+        manifest.record("index.html", "1234")
+        assert not manifest.unchanged("index.html", "1234")  # file does not exist
+
+        with open(join(working_dir, "index.html"), "w", encoding="utf-8") as file:
+            file.write("index")
+
+        assert manifest.unchanged("index.html", "1234")
+        assert not manifest.unchanged("index.html", "5678")
+        manifest.links = {"b.jpg": "hardlink", "a.jpg": "sendfile"}
+        manifest.save()
+
+        manifest = Manifest(working_dir, manifest_path)
+        assert manifest.unchanged("index.html", "1234")
+        assert manifest.links == {"a.jpg": "sendfile", "b.jpg": "hardlink"}
+
+
+if __name__ == "__main__":
+    test_fingerprint()
+    test_files_fingerprint()
+    test_manifest()
@@ -3,12 +3,24 @@
 """ Test parsing the yaml """
 
 
-from os.path import dirname, join
+from os import listdir
+from os.path import dirname, join, isfile, basename
+from datetime import date
 from shutil import copy
 from tempfile import TemporaryDirectory
 
 
-from genweb.metadata import load_yaml, Metadata
+from pickle import dumps, loads
+from copy import deepcopy
+from json import dumps as json_dumps
+from contextlib import redirect_stdout
+from io import StringIO
+import sys
+
+from devopsdriver.settings import Settings
+
+from genweb.metadata import load_yaml, Metadata, FrozenDict, freeze, thaw
+import genweb.metadata
 
 
 DATA_DIR = join(dirname(__file__), "data")
@@ -20,7 +32,7 @@ def test_metadata_save() -> None:
         metadata_file = join(working_dir, "example.yml")
         copy(src_file, metadata_file)
         metadata = Metadata(metadata_file)
-        johns_picture = metadata["1700000000WilliamsJohn1665DavisRebecca1639"]
+        johns_picture = metadata.editable("1700000000WilliamsJohn1665DavisRebecca1639")
         johns_picture["width"] = 500
         metadata["1700000000WilliamsJohn1665DavisRebecca1639"] = johns_picture
         assert metadata["1700000000WilliamsJohn1665DavisRebecca1639"]["width"] == 500
@@ -45,7 +57,7 @@ def test_metadata_update() -> None:
         "type": "inline",
         "content": "hello",
     }
-    original = metadata["0000000000JohnsonSamI1892MillerJane1860"]
+    original = metadata.editable("0000000000JohnsonSamI1892MillerJane1860")
     assert "StoriesPersonal0000-" not in original["people"]
     original["people"].append("StoriesPersonal0000-")
     assert (
@@ -109,6 +121,143 @@ def test_metadata() -> None:
     )
 
 
+def test_journal() -> None:
+    with TemporaryDirectory() as working_dir:
+        metadata_file = join(working_dir, "example.yml")
+        copy(join(DATA_DIR, "example.yml"), metadata_file)
+        metadata = Metadata(metadata_file)
+        metadata["new"] = {
+            "type": "inline",
+            "contents": "line 1\nline 2",
+            "on": date.today(),
+        }
+        metadata.save()
+        metadata.save()  # nothing new to save
+        picture = metadata.editable("1700000000WilliamsJohn1665DavisRebecca1639")
+        picture["width"] = 500
+        metadata["1700000000WilliamsJohn1665DavisRebecca1639"] = picture
+        metadata.save()
+        assert sorted(listdir(working_dir)) == ["example.journal", "example.yml"]
+
+        with open(metadata.journal_path, "r", encoding="utf-8") as journal_file:
+            assert len(journal_file.readlines()) == 2  # only the changes
+
+        metadata.close()
+
+        with open(metadata.journal_path, "a", encoding="utf-8") as journal_file:
+            journal_file.write('{"key": "cut short", "ya')  # killed mid-write
+
+        reloaded = Metadata(metadata_file)
+        assert reloaded["new"] == metadata["new"]
+        assert reloaded["new"]["on"] == date.today()
+        assert reloaded["1700000000WilliamsJohn1665DavisRebecca1639"]["width"] == 500
+        assert "cut short" not in reloaded
+        assert len(reloaded) == 7
+
+        # changes after a torn line are not lost
+        reloaded["after crash"] = {"type": "inline"}
+        reloaded.close()
+        recovered = Metadata(metadata_file)
+        assert recovered["after crash"] == {"type": "inline"}
+        assert recovered["1700000000WilliamsJohn1665DavisRebecca1639"]["width"] == 500
+        assert "cut short" not in recovered
+        assert len(recovered) == 8
+
+
+def test_sync() -> None:
+    with TemporaryDirectory() as working_dir:
+        metadata = Metadata(join(DATA_DIR, "example.yml"))
+        metadata.journal_path = join(working_dir, "example.journal")
+        sync_records = Metadata.SYNC_RECORDS
+        Metadata.SYNC_RECORDS = 3
+
+        try:
+            for index in range(5):
+                metadata[f"entry{index}"] = {"type": "inline"}
+                metadata.save()
+
+            assert metadata.unsynced == 2
+            metadata.sync_due()
+            assert metadata.unsynced == 2  # not due yet
+            metadata.last_sync -= Metadata.SYNC_SECONDS
+            metadata.sync_due()
+            assert metadata.unsynced == 0
+
+        finally:
+            Metadata.SYNC_RECORDS = sync_records
+
+        metadata.close()
+        assert metadata.unsynced == 0
+        assert metadata.journal is None
+
+
+def test_compact() -> None:
+    with TemporaryDirectory() as working_dir:
+        metadata_file = join(working_dir, "layered.yml")
+        copy(join(DATA_DIR, "layered.yml"), metadata_file)
+
+        for revision in [f for f in listdir(DATA_DIR) if f.startswith("layered ")]:
+            copy(join(DATA_DIR, revision), join(working_dir, revision))
+
+        assert Metadata(metadata_file).compact() is None  # only one revision
+        metadata = Metadata(metadata_file)
+        metadata["new"] = {"type": "inline", "contents": "hello"}
+        metadata.save()
+        expected = dict(metadata.items())
+        revision_path = metadata.compact()
+        assert sorted(listdir(working_dir)) == sorted(
+            ["layered.yml", basename(revision_path)]
+        )
+        assert not isfile(metadata.journal_path)
+        assert dict(Metadata(metadata_file).items()) == expected
+        assert Metadata(metadata_file).compact() is None
+
+        with open(join(DATA_DIR, "layered.yml"), "r", encoding="utf-8") as file:
+            original = file.read()
+
+        with open(metadata_file, "r", encoding="utf-8") as file:
+            assert file.read() == original, "base metadata file was modified"
+
+
+def test_frozen() -> None:
+    metadata = Metadata(join(DATA_DIR, "layered.yml"))
+    entry = metadata["0000000000JohnsonSamI1892MillerJane1860"]
+    assert isinstance(entry, FrozenDict)
+    assert entry is metadata.get("0000000000JohnsonSamI1892MillerJane1860")  # no copy
+    assert isinstance(entry["people"], tuple)
+
+    for change in [
+        lambda: entry.__setitem__("type", "href"),
+        lambda: entry.__delitem__("type"),
+        lambda: entry.update({"type": "href"}),
+        lambda: entry.setdefault("new", 1),
+        lambda: entry.pop("type"),
+        entry.clear,
+    ]:
+        try:
+            change()
+            raise AssertionError("frozen entry changed")
+
+        except TypeError:
+            pass
+
+    editable = metadata.editable("0000000000JohnsonSamI1892MillerJane1860")
+    editable["people"].append("StoriesPersonal0000-")
+    assert editable["people"][:-1] == thaw(entry["people"])
+    assert "StoriesPersonal0000-" not in entry["people"]
+    assert len(metadata) == 3
+    metadata["new"] = editable
+    editable["people"].clear()  # the stored entry is a frozen copy
+    assert len(metadata) == 4
+    assert "new" in metadata.keys()
+    assert "StoriesPersonal0000-" in metadata["new"]["people"]
+    assert loads(dumps(entry)) == entry
+    assert isinstance(loads(dumps(entry)), FrozenDict)
+    assert deepcopy(entry) == entry
+    assert freeze(entry) is entry
+    assert json_dumps(entry) == json_dumps(thaw(entry))
+
+
 def test_load_yaml() -> None:
     metadata = load_yaml(join(DATA_DIR, "example.yml"))
     assert len(metadata) == 6, ",".join(metadata.keys())
@@ -153,9 +302,42 @@ def test_get_copy_list() -> None:
     _ = metadata.get_copy_list(artifacts)
 
 
+def test_main() -> None:
+    with TemporaryDirectory() as working_dir:
+        metadata_file = join(working_dir, "example.yml")
+        copy(join(DATA_DIR, "example.yml"), metadata_file)
+        metadata = Metadata(metadata_file)
+        metadata["new"] = {"type": "inline"}
+        metadata.close()
+
+        with open(join(working_dir, "genweb.yml"), "w", encoding="utf-8") as file:
+            file.write(f"metadata_yaml: {metadata_file}\n")
+
+        preferences, argv = Settings.PREF_DIR, sys.argv
+        Settings.PREF_DIR = {k: working_dir for k in preferences}
+        sys.argv = ["metadata"]  # metadata_yaml from genweb.yml
+        output = StringIO()
+
+        try:
+            with redirect_stdout(output):
+                genweb.metadata.main()
+
+        finally:
+            Settings.PREF_DIR, sys.argv = preferences, argv
+
+        assert output.getvalue().startswith("Compacted into"), output.getvalue()
+        assert not isfile(metadata.journal_path)
+        assert Metadata(metadata_file)["new"] == {"type": "inline"}
+
+
 if __name__ == "__main__":
+    test_journal()
+    test_sync()
+    test_compact()
+    test_frozen()
     test_load_yaml()
     test_metadata()
     test_metadata_update()
     test_metadata_save()
     test_get_copy_list()
+    test_main()
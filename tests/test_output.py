@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+
+""" Test writing output files only when they change """
+
+from os import listdir, stat, utime, makedirs, remove, link
+from os.path import join, isfile
+from tempfile import TemporaryDirectory
+from errno import EXDEV, EPERM
+from shutil import copyfile
+
+import genweb.output
+from genweb.output import identical, replace_if_changed, copy_if_changed
+from genweb.output import site_inodes, sync_links, materialize
+from genweb.output import MATERIALIZE_STRATEGIES, FALLBACK_ERRORS
+
+
+def create_file(path: str, contents: str):
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(contents)
+
+
+def test_identical() -> None:
+    with TemporaryDirectory() as working_dir:
+        create_file(join(working_dir, "a"), "contents")
+        create_file(join(working_dir, "b"), "contents")
+        create_file(join(working_dir, "c"), "Contents")
+        create_file(join(working_dir, "d"), "contents!")
+        create_file(join(working_dir, "e"), "")
+        create_file(join(working_dir, "f"), "")
+        assert identical(join(working_dir, "a"), join(working_dir, "b"))
+        assert not identical(join(working_dir, "a"), join(working_dir, "c"))
+        assert not identical(join(working_dir, "a"), join(working_dir, "d"))
+        assert identical(join(working_dir, "e"), join(working_dir, "f"))
+
+
+def test_replace_if_changed() -> None:
+    with TemporaryDirectory() as working_dir:
+        final_path = join(working_dir, "final")
+        create_file(join(working_dir, "new"), "contents")
+        assert replace_if_changed(join(working_dir, "new"), final_path)
+        utime(final_path, (1000, 1000))
+        create_file(join(working_dir, "new"), "contents")
+        assert not replace_if_changed(join(working_dir, "new"), final_path)
+        assert stat(final_path).st_mtime == 1000
+        create_file(join(working_dir, "new"), "changed")
+        assert replace_if_changed(join(working_dir, "new"), final_path)
+        assert listdir(working_dir) == ["final"], listdir(working_dir)
+
+
+def test_copy_if_changed() -> None:
+    with TemporaryDirectory() as working_dir:
+        source_path = join(working_dir, "source")
+        final_path = join(working_dir, "final")
+        create_file(source_path, "contents")
+        assert copy_if_changed(source_path, final_path)
+        utime(final_path, (1000, 1000))
+        assert not copy_if_changed(source_path, final_path)
+        assert stat(final_path).st_mtime == 1000
+        create_file(source_path, "changed")
+        assert copy_if_changed(source_path, final_path)
+        assert sorted(listdir(working_dir)) == ["final", "source"]
+
+
+def test_site_inodes() -> None:
+    with TemporaryDirectory() as working_dir:
+        makedirs(join(working_dir, "dir", "sub"))
+        create_file(join(working_dir, "a"), "a")
+        create_file(join(working_dir, "dir", "sub", "b"), "b")
+        found = site_inodes(working_dir)
+        assert found == {
+            "a": stat(join(working_dir, "a")).st_ino,
+            "dir/sub/b": stat(join(working_dir, "dir", "sub", "b")).st_ino,
+        }, found
+        assert not site_inodes(join(working_dir, "missing"))
+
+
+def test_sync_links() -> None:
+    with TemporaryDirectory() as source_dir, TemporaryDirectory() as site_dir:
+        create_file(join(source_dir, "a.jpg"), "a")
+        create_file(join(source_dir, "b.jpg"), "b")
+        create_file(join(site_dir, "index.html"), "index")
+        links = {
+            "p1/a.jpg": join(source_dir, "a.jpg"),
+            "p2/b.jpg": join(source_dir, "b.jpg"),
+        }
+        strategies, results = sync_links(site_dir, links)
+        assert results == {"hardlink": 2}, results
+        assert strategies == {"p1/a.jpg": "hardlink", "p2/b.jpg": "hardlink"}
+        assert stat(join(site_dir, "p1", "a.jpg")).st_nlink == 2
+
+        links["p2/b.jpg"] = join(source_dir, "a.jpg")
+        strategies, results = sync_links(site_dir, links, strategies)
+        assert results == {"hardlink": 1, "current": 1}, results
+        assert strategies == {"p1/a.jpg": "hardlink", "p2/b.jpg": "hardlink"}
+        assert stat(join(site_dir, "p2", "b.jpg")).st_nlink == 3
+
+        strategies, results = sync_links(
+            site_dir, {"p1/a.jpg": links["p1/a.jpg"]}, strategies
+        )
+        assert results == {"current": 1, "removed": 1}, results
+        assert not isfile(join(site_dir, "p2", "b.jpg"))
+        assert isfile(join(site_dir, "index.html"))
+
+
+def no_link(_: str, __: str) -> None:
+    raise OSError(EXDEV, "Invalid cross-device link")
+
+
+def test_materialize() -> None:
+    with TemporaryDirectory() as working_dir:
+        source_path = join(working_dir, "source")
+        create_file(source_path, "contents")
+        utime(source_path, (1000, 1000))
+
+        for name, strategy in MATERIALIZE_STRATEGIES:
+            destination_path = join(working_dir, name)
+
+            try:
+                assert materialize(source_path, destination_path, [(name, strategy)])
+
+            except OSError as error:  # ie reflink not supported on this filesystem
+                assert error.errno in FALLBACK_ERRORS, error
+                continue
+
+            assert identical(source_path, destination_path), name
+            assert stat(destination_path).st_mtime == 1000, name
+
+        strategies = [("hardlink", no_link), ("copy", copyfile)]
+        destination_path = join(working_dir, "fallback")
+        assert materialize(source_path, destination_path, strategies) == "copy"
+        assert identical(source_path, destination_path)
+        assert stat(source_path).st_nlink == 2  # from the hardlink strategy above
+
+        try:
+            materialize(source_path, join(working_dir, "fail"), strategies[:1])
+            raise AssertionError("the last strategy should raise")
+
+        except OSError as error:
+            assert error.errno == EXDEV, error
+
+
+def test_sync_links_copy() -> None:
+    with TemporaryDirectory() as source_dir, TemporaryDirectory() as site_dir:
+        create_file(join(source_dir, "a.jpg"), "a")
+        copy_if_changed(join(source_dir, "a.jpg"), join(site_dir, "a.jpg"))
+        links = {"a.jpg": join(source_dir, "a.jpg")}
+        strategies, results = sync_links(site_dir, links, {"a.jpg": "sendfile"})
+        assert results == {"hardlink": 1}, results  # mtime differs
+
+        remove(join(site_dir, "a.jpg"))
+        materialize(links["a.jpg"], join(site_dir, "a.jpg"), [("copy", copyfile)])
+        strategies, results = sync_links(site_dir, links, {"a.jpg": "copy"})
+        assert results == {"current": 1}, results
+        assert strategies == {"a.jpg": "copy"}, strategies
+
+
+def test_sync_links_demotion() -> None:
+    def fussy_link(source: str, destination: str) -> None:
+        if source.endswith("locked.jpg"):
+            raise OSError(EPERM, "Operation not permitted")
+
+        link(source, destination)
+
+    saved = genweb.output.MATERIALIZE_STRATEGIES
+
+    with TemporaryDirectory() as source_dir, TemporaryDirectory() as site_dir:
+        for name in ("a.jpg", "locked.jpg", "b.jpg"):
+            create_file(join(source_dir, name), name)
+
+        links = {n: join(source_dir, n) for n in ("locked.jpg", "a.jpg", "b.jpg")}
+
+        try:
+            # a file that cannot be linked does not stop the others from linking
+            genweb.output.MATERIALIZE_STRATEGIES = [
+                ("hardlink", fussy_link),
+                ("copy", copyfile),
+            ]
+            strategies, results = sync_links(site_dir, links)
+            assert results == {"hardlink": 2, "copy": 1}, results
+            assert strategies["locked.jpg"] == "copy", strategies
+
+            # a filesystem that cannot link is not tried again
+            calls = []
+
+            def cross_device(source: str, destination: str) -> None:
+                calls.append(source)
+                no_link(source, destination)
+
+            genweb.output.MATERIALIZE_STRATEGIES = [
+                ("hardlink", cross_device),
+                ("copy", copyfile),
+            ]
+            strategies, results = sync_links(join(site_dir, "other"), links, strategies)
+            assert results == {"copy": 3}, results
+            assert len(calls) == 1, calls
+
+        finally:
+            genweb.output.MATERIALIZE_STRATEGIES = saved
+
+
+if __name__ == "__main__":
+    test_identical()
+    test_replace_if_changed()
+    test_copy_if_changed()
+    test_site_inodes()
+    test_sync_links()
+    test_materialize()
+    test_sync_links_copy()
+    test_sync_links_demotion()
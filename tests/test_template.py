@@ -2,10 +2,11 @@
 
 """ Test template rendering """
 
+from os import listdir
 from os.path import join, dirname
 from tempfile import TemporaryDirectory
 
-from genweb.template import render, render_to_file
+from genweb.template import render, render_to_file, lookup_stats, clear_lookups
 
 
 DATA_DIR = join(dirname(__file__), "data")
@@ -25,12 +26,46 @@ def test_render_to_file() -> None:
     assert "Orange" in contents, contents
 
 
+def test_render_to_file_failure() -> None:
+    with TemporaryDirectory() as working_dir:
+        output_path = join(working_dir, "results.html")
+
+        with open(output_path, "w", encoding="utf-8") as file:
+            file.write("previous")
+
+        try:
+            render_to_file(output_path, join(DATA_DIR, "test.html.mako"), name="Fred")
+            raise AssertionError("color was not passed")
+
+        except TypeError:
+            pass
+
+        with open(output_path, "r", encoding="utf-8") as file:
+            contents = file.read()
+
+        assert contents == "previous", contents
+        assert listdir(working_dir) == ["results.html"], listdir(working_dir)
+
+
 def test_basic() -> None:
     output = render(join(DATA_DIR, "test.html.mako"), name="Fred", color="Orange")
     assert "Fred" in output, output
     assert "Orange" in output, output
 
 
+def test_lookup_reuse() -> None:
+    clear_lookups()
+    render(join(DATA_DIR, "test.html.mako"), name="Fred", color="Orange")
+    assert lookup_stats() == {"hits": 0, "misses": 1, "lookups": 1}, lookup_stats()
+    output = render(join(DATA_DIR, "test.html.mako"), name="Wilma", color="Red")
+    assert "Wilma" in output, output
+    assert lookup_stats() == {"hits": 1, "misses": 1, "lookups": 1}, lookup_stats()
+    render(join(DATA_DIR, "test.html.mako"), DATA_DIR, name="Fred", color="Orange")
+    assert lookup_stats() == {"hits": 1, "misses": 2, "lookups": 2}, lookup_stats()
+
+
 if __name__ == "__main__":
     test_basic()
+    test_lookup_reuse()
     test_render_to_file()
+    test_render_to_file_failure()
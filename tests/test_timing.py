@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+""" Test build timings """
+
+from json import load
+from os import chdir, getcwd
+from os.path import join, isfile
+from tempfile import TemporaryDirectory
+
+from genweb.timing import Timings
+
+
+def test_phase() -> None:
+    timings = Timings()
+
+    with timings.phase("loop"):
+        sum(range(100000))
+
+    with timings.phase("loop"):
+        sum(range(100000))
+
+    report = timings.report()
+    assert set(report["phases"]) == {"loop"}, report
+    assert report["phases"]["loop"]["wall"] > 0.0, report
+    assert report["phases"]["loop"]["cpu"] >= 0.0, report
+    assert report["phases"]["loop"]["peak_kib"] == Timings.peak_memory_kib(), report
+
+    try:
+        with timings.phase("failed"):
+            raise ValueError("failed")
+
+    except ValueError:
+        pass
+
+    assert "failed" in timings.report()["phases"]
+
+
+def test_counts_and_pages() -> None:
+    timings = Timings(slowest_count=2)
+    timings.count("people", 5)
+    timings.count("people")
+    timings.page("a", 0.5)
+    timings.page("b", 3.0)
+    timings.page("c", 1.0)
+    timings.page("d", 0.1)
+    report = timings.report()
+    assert report["counts"] == {"people": 6}, report
+    assert report["slowest_pages"] == [
+        {"page": "b", "seconds": 3.0},
+        {"page": "c", "seconds": 1.0},
+    ], report
+    timings.reset()
+    report = timings.report()
+    assert report["phases"] == {} and report["counts"] == {}, report
+    assert report["slowest_pages"] == [], report
+
+
+def test_save() -> None:
+    timings = Timings()
+    timings.count("people", 5)
+
+    with TemporaryDirectory() as working_dir:
+        report_path = join(working_dir, "reports", "report.json")
+        timings.save(report_path)
+
+        with open(report_path, "r", encoding="utf-8") as report_file:
+            assert load(report_file) == timings.report()
+
+        previous_dir = getcwd()
+        chdir(working_dir)
+
+        try:  # ie the default report path for a relative site_dir
+            timings.save("site build report.json")
+
+        finally:
+            chdir(previous_dir)
+
+        assert isfile(join(working_dir, "site build report.json"))
+
+
+if __name__ == "__main__":
+    test_phase()
+    test_counts_and_pages()
+    test_save()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+
+""" Test keeping Artifacts up to date while files change """
+
+
+from os import makedirs, remove, rename
+from os.path import join, dirname
+from tempfile import TemporaryDirectory
+from time import monotonic, sleep
+from sqlite3 import OperationalError
+
+from genweb.inventory import Artifacts
+from genweb.watcher import load_libc, Watcher, InotifyWatcher, PollingWatcher
+import genweb.watcher
+
+
+def create_file(path: str, contents: str):
+    makedirs(dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(contents)
+
+
+def wait_for(condition: callable, seconds: float = 5.0) -> bool:
+    deadline = monotonic() + seconds
+
+    while not condition():
+        if monotonic() > deadline:
+            return False
+
+        sleep(0.01)
+
+    return True
+
+
+def check_watching(inotify: bool) -> None:
+    with TemporaryDirectory() as working_dir, TemporaryDirectory() as cache_dir:
+        create_file(join(working_dir, "dir/file1.txt"), "file1")
+        artifacts = Artifacts(working_dir, cache_dir=cache_dir)
+        artifacts.watch(poll_seconds=0.01, inotify=inotify)
+        expected = InotifyWatcher if inotify else PollingWatcher
+        assert isinstance(artifacts.watcher, expected), artifacts.watcher
+
+        try:
+            create_file(join(working_dir, "dir/file2.txt"), "file2")
+            create_file(join(working_dir, ".git/HEAD"), "ignored")
+            assert wait_for(
+                lambda: artifacts.has_file("dir/file2.txt")
+                and artifacts.inventory["dir/file2.txt"].size == 5
+            )
+            create_file(join(working_dir, "new/sub/file3.txt"), "file3")
+            assert wait_for(lambda: artifacts.has_file("new/sub/file3.txt"))
+            assert artifacts.paths("file3.txt") == ["new/sub/file3.txt"]
+            rename(join(working_dir, "new"), join(working_dir, "renamed"))
+            assert wait_for(lambda: artifacts.has_file("renamed/sub/file3.txt"))
+            assert wait_for(lambda: not artifacts.has_dir("new"))
+            create_file(join(working_dir, "renamed/sub/file4.txt"), "file4")
+            assert wait_for(lambda: artifacts.has_file("renamed/sub/file4.txt"))
+            remove(join(working_dir, "dir/file1.txt"))
+            assert wait_for(lambda: not artifacts.has_file("dir/file1.txt"))
+            assert artifacts.paths("file1.txt") == []
+            assert not artifacts.has_dir(".git")
+
+        finally:
+            artifacts.close()
+
+        assert artifacts.watcher is None
+
+
+def test_inotify() -> None:
+    if load_libc() is not None:  # only on Linux
+        check_watching(inotify=True)
+
+
+def test_polling() -> None:
+    check_watching(inotify=False)
+
+
+def test_update() -> None:
+    with TemporaryDirectory() as working_dir, TemporaryDirectory() as cache_dir:
+        create_file(join(working_dir, "dir/file1.txt"), "file1")
+        artifacts = Artifacts(working_dir, cache_dir=cache_dir)
+        create_file(join(working_dir, "dir/sub/file2.txt"), "file2")
+        create_file(join(working_dir, "other/file3.txt"), "file3")
+        artifacts.update("dir")
+        assert artifacts.has_file("dir/sub/file2.txt")
+        assert not artifacts.has_file("other/file3.txt")
+        artifacts.update("other/file3.txt")
+        assert artifacts.has_file("other/file3.txt")
+        remove(join(working_dir, "dir/sub/file2.txt"))
+        remove(join(working_dir, "dir/file1.txt"))
+        artifacts.update("dir")
+        assert not artifacts.has_dir("dir")
+        remove(join(working_dir, "other/file3.txt"))
+        artifacts.update("other/file3.txt")
+        assert not artifacts.inventory
+
+
+class FailingArtifacts:
+    def __init__(self):
+        self.refreshes = 0
+
+    def refresh(self) -> None:
+        self.refreshes += 1
+
+        if self.refreshes == 1:
+            raise OperationalError("database is locked")
+
+
+def test_failures() -> None:
+    genweb.watcher.PRINT = lambda _: None
+
+    try:
+        Watcher(None)
+        raise AssertionError("Watcher should be abstract")
+
+    except TypeError:
+        pass
+
+    artifacts = FailingArtifacts()
+    watcher = PollingWatcher(artifacts, poll_seconds=0.01).start()
+
+    try:
+        assert wait_for(lambda: artifacts.refreshes > 1)  # still running
+
+    finally:
+        watcher.stop()
+
+    libc = load_libc()
+
+    if libc is None:  # only on Linux
+        return
+
+    with TemporaryDirectory() as working_dir, TemporaryDirectory() as cache_dir:
+        artifacts = Artifacts(working_dir, cache_dir=cache_dir)
+        watcher = InotifyWatcher(artifacts, libc, poll_seconds=0.01)
+
+        def broken(_: bytes) -> list[str]:
+            raise OSError("out of watches")
+
+        watcher.changed_paths = broken
+        watcher.start()
+
+        try:  # falls back to polling
+            create_file(join(working_dir, "dir/file1.txt"), "file1")
+            assert wait_for(lambda: artifacts.has_file("dir/file1.txt"))
+            create_file(join(working_dir, "dir/file2.txt"), "file2")
+            assert wait_for(lambda: artifacts.has_file("dir/file2.txt"))
+
+        finally:
+            watcher.stop()
+            artifacts.close()
+
+
+if __name__ == "__main__":
+    test_inotify()
+    test_polling()
+    test_update()
+    test_failures()
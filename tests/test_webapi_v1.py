@@ -8,8 +8,10 @@ from json import loads, dumps
 from types import SimpleNamespace
 from io import BytesIO
 from os.path import join, dirname
+from tempfile import TemporaryDirectory
 
 from genweb.webapi_v1 import ApiV1
+from genweb.inventory import Artifacts
 import genweb.genweb
 import genweb.webapi_v1
 
@@ -311,7 +313,19 @@ def test_load() -> None:
     genweb.genweb.People = MockPeople
     genweb.genweb.load_gedcom = lambda f: f
     api = ApiV1()
-    api.load()
+
+    with TemporaryDirectory() as cache_dir:  # keep the artifact caches out of DATA_DIR
+        genweb.genweb.Artifacts = lambda d, **kw: Artifacts(
+            d, cache_dir=cache_dir, **kw
+        )
+
+        try:
+            api.load()
+            assert api.artifacts.watcher is not None
+            api.artifacts.close()
+
+        finally:
+            genweb.genweb.Artifacts = Artifacts
 
 
 def test_post():